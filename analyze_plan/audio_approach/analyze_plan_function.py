@@ -1,9 +1,14 @@
 import subprocess
 import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from urllib.parse import urlparse
 import librosa
 import numpy as np
-from scipy.signal import correlate, find_peaks
+from scipy.signal import correlate, find_peaks, peak_prominences, peak_widths
+
+# 每个时间戳的 corr / prominence (timestamps.txt 的附带文件)
+TIMESTAMP_SCORES_FILENAME = 'timestamps_scores.tsv'
 
 def download_twitch(video_url, outputfile, start_time=None, end_time=None, stream='bestvideo+bestaudio/best'):#默认下载最佳视频和音频
     parsed_url = urlparse(video_url)
@@ -74,11 +79,201 @@ def hms_to_seconds(time_str):
     total_seconds = int(hours) * 3600 + int(minutes) * 60 + int(seconds1) + int(milliseconds) / 1000
     return total_seconds
 
+def _load_template_bank(template_folder, template_files, sr, x):
+    # 加载、重采样并归一化所有模板，返回 [{'file', 'template', 'threshold'}]，顺序与 template_files 一致
+    template_bank = []
+    for template_file in template_files:
+        template_normalized = None # 初始化
+        template_path = os.path.join(template_folder, template_file)
+        try:
+            template, sr_template = librosa.load(template_path, sr=None)
+
+            if template is None or len(template) == 0:
+                print(f"警告: 模板 {template_file} 为空或加载失败。跳过此模板。")
+                continue
+            print(f"\n加载模板文件: {template_path}, 采样率: {sr_template}, 时长: {len(template)/sr_template:.2f} 秒")
+
+            if sr_template != sr:
+                print(f"模板采样率 {sr_template} 与目标音频采样率 {sr} 不匹配。正在重采样模板...")
+                template = librosa.resample(template, orig_sr=sr_template, target_sr=sr)
+                print(f"模板已重采样到目标采样率: {sr}")
+
+            if len(template) == 0:
+                print(f"警告: 重采样后的模板 {template_file} 为空。跳过此模板。")
+                continue
+
+            # --- 模板归一化 (保留模板归一化) ---
+            template_max_abs = np.max(np.abs(template))
+            if template_max_abs > 1e-6: # 避免除以非常小的值或零
+                template_normalized = template / template_max_abs
+                print(f"  模板 '{template_file}' 已归一化 (原最大绝对值: {template_max_abs:.4f})")
+            else:
+                print(f"警告: 模板 '{template_file}' 最大绝对值过小 ({template_max_abs:.4f})，可能为空白或接近空白。跳过归一化，并按原样使用。")
+                template_normalized = template # 如果模板是静音或接近静音，保持原样
+
+        except Exception as e:
+            print(f"错误: 加载、重采样或归一化模板 {template_path} 失败: {e}")
+            continue
+
+        # --- 使用归一化后的模板计算能量和阈值 (这部分逻辑不变) ---
+        current_template_energy = np.sum(template_normalized**2)
+        if current_template_energy < 1e-6: # 检查能量是否过小
+            print(f"警告: 归一化后的模板 '{template_file}' 能量 ({current_template_energy:.4f}) 过低。跳过此模板。")
+            continue
+
+        print(f"  模板: {template_file}, 归一化后能量: {current_template_energy:.4f}")
+        threshold = x * current_template_energy # X 仍然是作用于归一化模板能量
+        print(f"  基于 X={x}, 计算得到的 height 阈值 (基于归一化能量): {threshold:.4f}")
+
+        template_bank.append({
+            'file': template_file,
+            'template': template_normalized,
+            'threshold': threshold,
+        })
+    return template_bank
+
+def _iter_segment_bounds(total_samples, segment_length_samples, step_samples):
+    # 逐个给出 (起始样本, 结束样本)，最后一个分段覆盖到音频末尾后停止
+    current_segment_start_sample = 0
+    while current_segment_start_sample < total_samples:
+        current_segment_end_sample = min(current_segment_start_sample + segment_length_samples, total_samples)
+        yield current_segment_start_sample, current_segment_end_sample
+        if current_segment_end_sample >= total_samples: break
+        current_segment_start_sample += step_samples
+
+def read_gameplay_segments(segments_path):
+    # 读取 image_approach 的游戏画面分段 (gameplay_segments.txt，每行 HH:MM:SS.mmm - HH:MM:SS.mmm)，返回 [(start_sec, end_sec)]
+    segments = []
+    with open(segments_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split(' - ')
+            if len(parts) != 2:
+                continue
+            try:
+                segments.append((hms_to_seconds(parts[0].strip()), hms_to_seconds(parts[1].strip())))
+            except ValueError:
+                continue
+    return sorted(segments)
+
+def _bounds_in_segments(bounds_list, segments_samples):
+    # 只保留与游戏画面分段有重叠的分段 (样本范围)
+    return [(start, end) for start, end in bounds_list
+            if any(seg_start < end and start < seg_end for seg_start, seg_end in segments_samples)]
+
+def _prominence_wlen(prominence_window_seconds, sr):
+    # prominence 只在峰值前后各 window/2 秒内找基线 (find_peaks 的 wlen)；None 时到分段边界为止
+    if not prominence_window_seconds:
+        return None
+    return max(3, int(prominence_window_seconds * sr))
+
+def _segment_peaks(segment, template_normalized, threshold, distance_samples, pro, wlen_samples=None):
+    # 单个分段与单个模板的互相关峰值。分段比模板短时返回 None
+    if len(segment) < len(template_normalized): # 模板仍然是归一化后的模板
+        return None
+
+    # --- 【重要改动】不再对音频分段 (segment) 进行归一化 ---
+    # --- 使用 原始音频分段(segment) 和 归一化后的模板(template_normalized) 进行互相关 ---
+    # 注意：现在是用原始信号强度的 segment 与归一化（峰值为1）的 template_normalized 进行匹配
+    corr = correlate(segment, template_normalized, mode='valid')
+    if len(corr) == 0:
+        return None
+
+    peaks_in_segment, properties = find_peaks(corr, height=threshold, distance=distance_samples, prominence=pro, wlen=wlen_samples)
+    return peaks_in_segment, corr[peaks_in_segment], properties.get('prominences', np.array([]))
+
+def _segment_cache_peaks(segment, template_normalized, threshold, distance_samples, wlen_samples=None):
+    # 峰值缓存用: 单个分段与单个模板的互相关峰值 (只按 height 和 distance 筛选)，以及 prominence 和半高宽度
+    # 返回 (峰值位置, 高度, prominence, 宽度)；分段比模板短或没有峰值时返回 None
+    if len(segment) < len(template_normalized):
+        return None
+    corr = correlate(segment, template_normalized, mode='valid')
+    if len(corr) == 0:
+        return None
+    peaks, props = find_peaks(corr, height=threshold, distance=distance_samples)
+    if len(peaks) == 0:
+        return None
+    prom_data = peak_prominences(corr, peaks, wlen=wlen_samples)
+    widths = peak_widths(corr, peaks, rel_height=0.5, prominence_data=prom_data)[0]
+    return peaks, props['peak_heights'], prom_data[0], widths
+
+# --- 多进程模式: 解码后的音频放在共享内存中，每个进程只挂载一次，不随任务 pickle ---
+_worker_audio = None
+_worker_shm = None
+_worker_bank = None
+_worker_distance_samples = 1
+_worker_pro = 0.1
+_worker_wlen_samples = None
+_worker_extra = None
+
+def _init_segment_worker(shm_name, shape, dtype, template_bank, distance_samples, pro, wlen_samples=None, extra=None):
+    global _worker_audio, _worker_shm, _worker_bank, _worker_distance_samples, _worker_pro, _worker_wlen_samples, _worker_extra
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_audio = np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf)
+    _worker_bank = template_bank
+    _worker_distance_samples = distance_samples
+    _worker_pro = pro
+    _worker_wlen_samples = wlen_samples
+    _worker_extra = extra
+
+def _segment_worker(bounds):
+    # 一个任务 = 一个分段 x 整个模板库，按模板顺序返回结果
+    start, end = bounds
+    segment = _worker_audio[start:end]
+    return [_segment_peaks(segment, entry['template'], entry['threshold'], _worker_distance_samples, _worker_pro, _worker_wlen_samples)
+            for entry in _worker_bank]
+
+def _cache_segment_worker(bounds):
+    # 峰值缓存的一个任务 = 一个分段 x 整个模板库
+    start, end = bounds
+    segment = _worker_audio[start:end]
+    return [_segment_cache_peaks(segment, entry['template'], entry['threshold'], _worker_distance_samples, _worker_wlen_samples)
+            for entry in _worker_bank]
+
+def _map_shared_audio(y, worker_fn, tasks, workers, template_bank=None, distance_samples=1, pro=0.1, wlen_samples=None, extra=None):
+    # 把 y 放进共享内存，用 workers 个进程对 tasks 运行 worker_fn (worker_fn 从 _worker_audio 等全局变量读取数据)。
+    # map 按提交顺序返回，合并结果与串行顺序一致
+    shm = shared_memory.SharedMemory(create=True, size=max(1, y.nbytes))
+    shared_y = None
+    try:
+        shared_y = np.ndarray(y.shape, dtype=y.dtype, buffer=shm.buf)
+        shared_y[:] = y[:]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_segment_worker,
+                                 initargs=(shm.name, y.shape, y.dtype, template_bank, distance_samples, pro, wlen_samples, extra)) as executor:
+            return list(executor.map(worker_fn, tasks, chunksize=chunksize))
+    finally:
+        shared_y = None # 释放对共享内存的引用后才能 close
+        shm.close()
+        shm.unlink()
+
+def _compute_peaks_parallel(y, template_bank, bounds_list, distance_samples, pro, workers, wlen_samples=None):
+    per_segment_results = _map_shared_audio(y, _segment_worker, bounds_list, workers, template_bank, distance_samples, pro, wlen_samples)
+    # 转成 [模板][分段] 的顺序
+    return [[seg_results[t_idx] for seg_results in per_segment_results] for t_idx in range(len(template_bank))]
+
+def _resolve_workers(workers):
+    # 1 为串行；None 或 0 使用全部CPU核心
+    return workers if workers else (os.cpu_count() or 1)
+
+def _in_gameplay(t_original_video, gameplay_segments):
+    return gameplay_segments is None or any(start <= t_original_video <= end for start, end in gameplay_segments)
+
 def find_impact_segments(twitch_url, audio_path, template_folder, output_folder,
                          audio_clip_original_starttime_seconds=0.0,
                          x=0.65, dis=10.0, pro=0.1,
                          segment_duration_seconds=180.0,
-                         overlap_seconds=10.0):
+                         overlap_seconds=10.0,
+                         workers=1,
+                         gameplay_segments=None,
+                         prominence_window_seconds=None):
+    # workers: 1 为串行；大于1时按 (分段, 模板库) 分发到多个进程；None 或 0 使用全部CPU核心。
+    # 两种模式按相同的 模板->分段 顺序合并去重，timestamps.txt 结果完全一致。
+    # prominence_window_seconds: None (默认) 时 prominence 的基线到分段边界为止 (find_peaks 不设 wlen)。
+    # 设置时基线只在峰值前后各一半的时间内寻找，结果只取决于峰值附近的音频；
+    # 指纹模式 (find_impact_segments_fingerprint) 需要有界的窗口，与其比较时两边使用同一个值。
+    # gameplay_segments: 可选，原视频时间的游戏画面分段 [(start_sec, end_sec)] (read_gameplay_segments)，
+    # 与分段没有重叠的音频分段不做互相关，分段外的峰值也不记录。
     video_id = twitch_url.split('/')[-1]
     # print(f"提取的视频 ID: {video_id}") # 已在 main.py 中打印
 
@@ -106,6 +301,7 @@ def find_impact_segments(twitch_url, audio_path, template_folder, output_folder,
     print(f"在 {template_folder} 中找到 {len(template_files)} 个模板文件: {template_files}")
 
     detected_times_in_original_video = []
+    detections = [] # [(原视频时间, corr, prominence, 模板)]，写入 timestamps_scores.tsv
     timestamps_filepath = os.path.join(save_directory, 'timestamps.txt')
 
     segment_length_samples = int(segment_duration_seconds * sr)
@@ -120,99 +316,55 @@ def find_impact_segments(twitch_url, audio_path, template_folder, output_folder,
         step_samples = segment_length_samples
         overlap_samples = 0
 
-    with open(timestamps_filepath, 'w', encoding='utf-8') as f_timestamps:
-        for template_file in template_files:
-            template_normalized = None # 初始化
-            try:
-                template_path = os.path.join(template_folder, template_file)
-                template, sr_template = librosa.load(template_path, sr=None)
-
-                if template is None or len(template) == 0:
-                    print(f"警告: 模板 {template_file} 为空或加载失败。跳过此模板。")
-                    continue
-                print(f"\n加载模板文件: {template_path}, 采样率: {sr_template}, 时长: {len(template)/sr_template:.2f} 秒")
-
-                if sr_template != sr:
-                    print(f"模板采样率 {sr_template} 与目标音频采样率 {sr} 不匹配。正在重采样模板...")
-                    template = librosa.resample(template, orig_sr=sr_template, target_sr=sr)
-                    print(f"模板已重采样到目标采样率: {sr}")
-
-                if len(template) == 0:
-                    print(f"警告: 重采样后的模板 {template_file} 为空。跳过此模板。")
-                    continue
+    distance_samples = int(dis * sr)
+    if distance_samples < 1: distance_samples = 1
+    wlen_samples = _prominence_wlen(prominence_window_seconds, sr)
+
+    template_bank = _load_template_bank(template_folder, template_files, sr, x)
+    bounds_list = list(_iter_segment_bounds(len(y), segment_length_samples, step_samples))
+    if gameplay_segments is not None:
+        segments_samples = [(int((start - audio_clip_original_starttime_seconds) * sr), int((end - audio_clip_original_starttime_seconds) * sr))
+                            for start, end in gameplay_segments]
+        all_bounds_count = len(bounds_list)
+        bounds_list = _bounds_in_segments(bounds_list, segments_samples)
+        print(f"游戏画面分段: {len(gameplay_segments)} 段，只分析其中 {len(bounds_list)} / {all_bounds_count} 个音频分段。")
+
+    workers = _resolve_workers(workers)
+    peaks_by_template = None
+    if workers > 1 and template_bank and len(bounds_list) > 1:
+        print(f"并行模式: {len(bounds_list)} 个分段 x {len(template_bank)} 个模板，使用 {workers} 个进程。")
+        peaks_by_template = _compute_peaks_parallel(y, template_bank, bounds_list, distance_samples, pro, workers, wlen_samples)
 
-                # --- 模板归一化 (保留模板归一化) ---
-                template_max_abs = np.max(np.abs(template))
-                if template_max_abs > 1e-6: # 避免除以非常小的值或零
-                    template_normalized = template / template_max_abs
-                    print(f"  模板 '{template_file}' 已归一化 (原最大绝对值: {template_max_abs:.4f})")
-                else:
-                    print(f"警告: 模板 '{template_file}' 最大绝对值过小 ({template_max_abs:.4f})，可能为空白或接近空白。跳过归一化，并按原样使用。")
-                    template_normalized = template # 如果模板是静音或接近静音，保持原样
-
-            except Exception as e:
-                print(f"错误: 加载、重采样或归一化模板 {template_path} 失败: {e}")
-                continue
+    with open(timestamps_filepath, 'w', encoding='utf-8') as f_timestamps:
+        for t_idx, entry in enumerate(template_bank):
+            template_file = entry['file']
+            template_normalized = entry['template']
+            threshold = entry['threshold']
 
-            # --- 使用归一化后的模板计算能量和阈值 (这部分逻辑不变) ---
-            current_template_energy = np.sum(template_normalized**2)
-            if current_template_energy < 1e-6: # 检查能量是否过小
-                print(f"警告: 归一化后的模板 '{template_file}' 能量 ({current_template_energy:.4f}) 过低。跳过此模板。")
+            if len(y) < len(template_normalized):
+                print(f"  整个音频片段 ({len(y)/sr:.2f}s) 比模板 ({template_file}, {len(template_normalized)/sr:.2f}s) 短，无法处理。")
                 continue
 
-            print(f"  模板: {template_file}, 归一化后能量: {current_template_energy:.4f}")
-            threshold = x * current_template_energy # X 仍然是作用于归一化模板能量
-            print(f"  基于 X={x}, 计算得到的 height 阈值 (基于归一化能量): {threshold:.4f}")
-
-            current_segment_start_sample = 0
-            segment_count = 0
-            while current_segment_start_sample < len(y):
-                segment_count += 1
-                segment_start_time_in_clip = current_segment_start_sample / sr
-                current_segment_end_sample = min(current_segment_start_sample + segment_length_samples, len(y))
-                segment = y[current_segment_start_sample:current_segment_end_sample] # 这是原始的音频分段
-
-                if len(segment) < len(template_normalized): # 模板仍然是归一化后的模板
-                    if segment_count == 1 and current_segment_start_sample == 0 and len(y) < len(template_normalized):
-                         print(f"  整个音频片段 ({len(y)/sr:.2f}s) 比模板 ({template_file}, {len(template_normalized)/sr:.2f}s) 短，无法处理。")
-                         break
-                    current_segment_start_sample += step_samples
-                    if step_samples <= 0 : current_segment_start_sample +=1
-                    continue
-
-                # --- 【重要改动】不再对音频分段 (segment) 进行归一化 ---
-                # segment_normalized = None # 原有代码
-                # segment_max_abs = np.max(np.abs(segment)) # 原有代码
-                # if segment_max_abs > 1e-6: # 原有代码
-                #     segment_normalized = segment / segment_max_abs # 原有代码
-                # else: # 原有代码
-                #     # print(f"  分段 {segment_count} 最大绝对值过小 ({segment_max_abs:.4f})，可能为空白。跳过归一化，按原样使用。") # 原有代码
-                #     segment_normalized = segment # 原有代码
-
-                # --- 使用 原始音频分段(segment) 和 归一化后的模板(template_normalized) 进行互相关 ---
-                # 注意：现在是用原始信号强度的 segment 与归一化（峰值为1）的 template_normalized 进行匹配
-                corr = correlate(segment, template_normalized, mode='valid') # 【重要改动】使用 segment (原始) 而不是 segment_normalized
-
-                if len(corr) == 0:
-                    current_segment_start_sample += step_samples
-                    if step_samples <= 0: current_segment_start_sample +=1
+            for segment_count, (current_segment_start_sample, current_segment_end_sample) in enumerate(bounds_list, 1):
+                if peaks_by_template is not None:
+                    segment_result = peaks_by_template[t_idx][segment_count - 1]
+                else:
+                    segment = y[current_segment_start_sample:current_segment_end_sample] # 这是原始的音频分段
+                    segment_result = _segment_peaks(segment, template_normalized, threshold, distance_samples, pro, wlen_samples)
+                if segment_result is None:
                     continue
-
-                distance_samples = int(dis * sr)
-                if distance_samples < 1: distance_samples = 1
-
-                peaks_in_segment, properties = find_peaks(corr, height=threshold, distance=distance_samples, prominence=pro)
+                peaks_in_segment, peak_corr_values, actual_prominences = segment_result
 
                 if len(peaks_in_segment) > 0:
-                    actual_prominences = properties.get('prominences', [])
                     #您可以取消下面这行注释来查看每个分段的详细峰值信息，但日志会非常多
                     print(f"    在分段 {segment_count} 中找到 {len(peaks_in_segment)} 个峰值 (PRO设置值为: {pro})。实际Prominences: {np.array2string(np.array(actual_prominences), formatter={'float_kind':lambda val: '%.2f' % val})}")
-                    pass
 
-                times_in_segment = peaks_in_segment / sr
-                for t_segment_idx, t_segment_time in enumerate(times_in_segment):
-                    t_clip = segment_start_time_in_clip + t_segment_time
+                # 时间按音频中的样本位置一次换算，峰值缓存和指纹模式用同样的算式，毫秒的舍入才一致
+                times_in_clip = (current_segment_start_sample + peaks_in_segment) / sr
+                for t_segment_idx, t_clip in enumerate(times_in_clip):
                     t_original_video = audio_clip_original_starttime_seconds + t_clip
+                    if not _in_gameplay(t_original_video, gameplay_segments):
+                        continue
 
                     is_duplicate = False
                     for recorded_time in detected_times_in_original_video:
@@ -221,17 +373,12 @@ def find_impact_segments(twitch_url, audio_path, template_folder, output_folder,
                             break
 
                     if not is_duplicate:
-                        actual_prom = properties['prominences'][t_segment_idx] if 'prominences' in properties and t_segment_idx < len(properties['prominences']) else "N/A"
-                        peak_corr_value = corr[peaks_in_segment[t_segment_idx]] # 获取该峰值在corr中的值
+                        actual_prom = actual_prominences[t_segment_idx] if t_segment_idx < len(actual_prominences) else "N/A"
+                        peak_corr_value = peak_corr_values[t_segment_idx] # 获取该峰值在corr中的值
                         print(f"      >> 考虑记录时间戳 (原视频): {seconds_to_hms(t_original_video)}, 模板: {template_file}, Corr峰值: {peak_corr_value:.2f}, 峰值Prominence: {actual_prom}, Height阈值: {threshold:.2f}") #
                         f_timestamps.write(f"{seconds_to_hms(t_original_video)}\n")
                         detected_times_in_original_video.append(t_original_video)
-
-                if current_segment_end_sample >= len(y): break
-                current_segment_start_sample += step_samples
-                if step_samples <= 0:
-                    print("错误：step_samples 计算为0或负数，强行终止分段处理以避免无限循环。")
-                    break
+                        detections.append((t_original_video, peak_corr_value, None if actual_prom == "N/A" else actual_prom, template_file))
             # print(f"  模板 {template_file} 处理完毕，当前总检测数: {len(detected_times_in_original_video)}")
 
     print(f"总共检测到 {len(detected_times_in_original_video)} 个不重复的时间戳 (相对于原视频) 写入到 {timestamps_filepath}")
@@ -241,9 +388,268 @@ def find_impact_segments(twitch_url, audio_path, template_folder, output_folder,
             for t in detected_times_in_original_video:
                 f_timestamps_sorted.write(f"{seconds_to_hms(t)}\n")
         print("时间戳已排序并重新写入文件。")
+    write_timestamp_scores(save_directory, detections, audio_clip_original_starttime_seconds)
 
     return detected_times_in_original_video
 
+# --- 峰值缓存: 每个 (音频, 模板) 只做一次互相关，保存高于 floor 的峰值 (位置, 高度, prominence, 宽度) ---
+# 调整 X / PRO / DISTANCE 时只需重新筛选缓存中的峰值，不需要再次加载音频
+# 缓存的峰值已经按 min_distance_seconds 做过 distance 筛选 (振荡的互相关几乎每个周期都有局部最大值，不筛选时多小时音频有上千万行)。
+# distance 规则只会让较高的峰去掉较低的峰，所以 DISTANCE 等于 min_distance_seconds 时，任意更高的 X 和 PRO 的结果都与 find_impact_segments 完全一致；
+# DISTANCE 更大时只有 "被缓存中已去掉的峰挡住的峰" 这种连锁情况可能不同。DISTANCE 小于 min_distance_seconds 或 prominence 窗口不同时缓存失效。
+# 被 _load_template_bank 跳过的模板 (加载失败、能量过低) 保存一个 skipped 标记，同样算作有效缓存，不会每次都重新加载音频。
+def _peak_cache_path(cache_dir, audio_path, template_file):
+    return os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(audio_path))[0]}__{os.path.splitext(template_file)[0]}.npz")
+
+def _peak_cache_valid(cache_path, audio_path, template_path, segment_duration_seconds, step_seconds, x,
+                      dis=None, prominence_window_seconds=None):
+    # 音频/模板未改动、分段参数和 prominence 窗口相同，并且缓存的 floor 不高于当前 X、最小距离不大于当前 DISTANCE 时缓存可用
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        with np.load(cache_path) as c:
+            if 'min_distance_seconds' not in c.files:
+                return False # 旧格式的缓存 (没有 distance 筛选)
+            if not (int(c['audio_size']) == os.path.getsize(audio_path)
+                    and float(c['audio_mtime']) == os.path.getmtime(audio_path)
+                    and float(c['template_mtime']) == os.path.getmtime(template_path)):
+                return False
+            if bool(c['skipped']):
+                return True
+            return (float(c['segment_duration_seconds']) == segment_duration_seconds
+                    and abs(float(c['step_seconds']) - step_seconds) < 1e-3
+                    and float(c['floor_x']) <= x
+                    and (dis is None or float(c['min_distance_seconds']) <= dis)
+                    and float(c['prominence_window_seconds']) == float(prominence_window_seconds or 0))
+    except Exception as e:
+        print(f"警告: 峰值缓存 {cache_path} 无法读取 ({e})，将重新计算。")
+        return False
+
+def build_peak_cache(audio_path, template_folder, cache_dir,
+                     floor_x=0.01,
+                     segment_duration_seconds=180.0,
+                     overlap_seconds=10.0,
+                     min_distance_seconds=0.3,
+                     prominence_window_seconds=None,
+                     workers=1):
+    # 与 find_impact_segments 相同的分段和互相关，用很低的 height 下限 (floor_x * 模板能量) 和 min_distance_seconds 取峰值，
+    # 不做 prominence 筛选，并记录每个峰值的 prominence (wlen 与 find_impact_segments 相同) 和半高宽度
+    # workers: 与 find_impact_segments 相同，大于1时按分段分发到多个进程，缓存内容与串行完全一致
+    os.makedirs(cache_dir, exist_ok=True)
+    try:
+        y, sr = librosa.load(audio_path, sr=None)
+        if y is None or len(y) == 0 or not sr:
+            print(f"错误: 加载的音频文件 {audio_path} 为空。跳过处理。")
+            return []
+        print(f"加载音频文件: {audio_path}, 采样率: {sr}, 时长: {len(y)/sr:.2f} 秒")
+    except Exception as e:
+        print(f"错误: 无法加载音频文件 {audio_path}: {e}")
+        return []
+
+    template_files = [f for f in os.listdir(template_folder) if f.endswith(('.mp3', '.wav', '.m4a', '.aac', '.ogg'))]
+    template_bank = _load_template_bank(template_folder, template_files, sr, floor_x)
+    distance_samples = max(1, int(min_distance_seconds * sr)) # 与 find_impact_segments 的 int(dis * sr) 相同
+    wlen_samples = _prominence_wlen(prominence_window_seconds, sr)
+    source_info = dict(audio_size=os.path.getsize(audio_path), audio_mtime=os.path.getmtime(audio_path),
+                       min_distance_seconds=min_distance_seconds)
+
+    written = []
+    loaded_files = {entry['file'] for entry in template_bank}
+    for template_file in template_files:
+        if template_file in loaded_files:
+            continue
+        cache_path = _peak_cache_path(cache_dir, audio_path, template_file)
+        np.savez_compressed(cache_path, skipped=True,
+                            template_mtime=os.path.getmtime(os.path.join(template_folder, template_file)), **source_info)
+        print(f"  峰值缓存: 模板 {template_file} 被跳过，保存标记 {cache_path}")
+        written.append(cache_path)
+
+    segment_length_samples = int(segment_duration_seconds * sr)
+    step_samples = segment_length_samples - int(overlap_seconds * sr)
+    if step_samples <= 0:
+        step_samples = segment_length_samples
+    bounds_list = list(_iter_segment_bounds(len(y), segment_length_samples, step_samples))
+
+    workers = _resolve_workers(workers)
+    per_segment_results = None
+    if workers > 1 and template_bank and len(bounds_list) > 1:
+        print(f"并行模式: {len(bounds_list)} 个分段 x {len(template_bank)} 个模板，使用 {workers} 个进程建立峰值缓存。")
+        per_segment_results = _map_shared_audio(y, _cache_segment_worker, bounds_list, workers, template_bank,
+                                                distance_samples, wlen_samples=wlen_samples)
+
+    for t_idx, entry in enumerate(template_bank):
+        template_normalized = entry['template']
+        seg_idx, samples, heights, prominences, widths = [], [], [], [], []
+        for segment_count, (start, end) in enumerate(bounds_list):
+            if per_segment_results is not None:
+                segment_result = per_segment_results[segment_count][t_idx]
+            else:
+                segment_result = _segment_cache_peaks(y[start:end], template_normalized, entry['threshold'], distance_samples, wlen_samples)
+            if segment_result is None:
+                continue
+            peaks, peak_heights, peak_proms, peak_width_values = segment_result
+            seg_idx.append(np.full(len(peaks), segment_count, dtype=np.int32))
+            samples.append((start + peaks).astype(np.int64))
+            heights.append(peak_heights.astype(np.float64))
+            prominences.append(peak_proms.astype(np.float64))
+            widths.append(peak_width_values.astype(np.float32))
+
+        def _cat(parts, dtype):
+            return np.concatenate(parts) if parts else np.array([], dtype=dtype)
+
+        template_path = os.path.join(template_folder, entry['file'])
+        cache_path = _peak_cache_path(cache_dir, audio_path, entry['file'])
+        np.savez_compressed(
+            cache_path,
+            segment=_cat(seg_idx, np.int32),
+            sample=_cat(samples, np.int64),
+            height=_cat(heights, np.float64),
+            prominence=_cat(prominences, np.float64),
+            width=_cat(widths, np.float32),
+            skipped=False,
+            energy=np.sum(template_normalized**2),
+            sr=sr,
+            too_short=len(y) < len(template_normalized),
+            floor_x=floor_x,
+            segment_duration_seconds=segment_duration_seconds,
+            step_seconds=step_samples / sr,
+            prominence_window_seconds=float(prominence_window_seconds or 0),
+            template_mtime=os.path.getmtime(template_path),
+            **source_info
+        )
+        print(f"  峰值缓存: 模板 {entry['file']} -> {sum(len(h) for h in heights)} 个峰值, 保存到 {cache_path}")
+        written.append(cache_path)
+    return written
+
+def _select_by_distance(samples, heights, distance):
+    # 与 scipy.signal.find_peaks 的 distance 规则一致: 从最高的峰开始，去掉距离小于 distance 的较低峰
+    keep = np.ones(len(samples), dtype=bool)
+    distance = np.ceil(distance)
+    priority_to_position = np.argsort(heights)
+    for i in range(len(samples) - 1, -1, -1):
+        j = priority_to_position[i]
+        if not keep[j]:
+            continue
+        k = j - 1
+        while 0 <= k and samples[j] - samples[k] < distance:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < len(samples) and samples[k] - samples[j] < distance:
+            keep[k] = False
+            k += 1
+    return keep
+
+def rethreshold_from_cache(twitch_url, audio_path, template_folder, output_folder,
+                           audio_clip_original_starttime_seconds=0.0,
+                           x=0.65, dis=10.0, pro=0.1,
+                           segment_duration_seconds=180.0,
+                           overlap_seconds=10.0,
+                           floor_x=0.01,
+                           cache_dir=None,
+                           prominence_window_seconds=None,
+                           workers=1,
+                           gameplay_segments=None):
+    # 用峰值缓存重新生成 timestamps.txt，结果与相同参数的 find_impact_segments 一致 (DISTANCE 与建立缓存时相同时完全一致)。
+    # 缓存缺失、过期、floor_x 高于 X 或最小距离大于 DISTANCE 时先调用 build_peak_cache (只有这时才加载音频，workers 用于建立缓存)，
+    # 新缓存的最小距离为当前的 DISTANCE
+    # gameplay_segments: 与 find_impact_segments 相同，只保留游戏画面分段内的峰值。缓存本身覆盖整个音频，换分段不需要重建
+    # 筛选顺序与 find_peaks 相同: height -> distance -> prominence
+    video_id = twitch_url.split('/')[-1]
+    save_directory = os.path.join(output_folder, video_id)
+    os.makedirs(save_directory, exist_ok=True)
+    if cache_dir is None:
+        cache_dir = os.path.join(save_directory, 'peak_cache')
+
+    template_files = [f for f in os.listdir(template_folder) if f.endswith(('.mp3', '.wav', '.m4a', '.aac', '.ogg'))]
+    step_seconds = segment_duration_seconds - overlap_seconds
+    if step_seconds <= 0:
+        step_seconds = segment_duration_seconds
+    for template_file in template_files:
+        cache_path = _peak_cache_path(cache_dir, audio_path, template_file)
+        template_path = os.path.join(template_folder, template_file)
+        if not _peak_cache_valid(cache_path, audio_path, template_path, segment_duration_seconds, step_seconds, x,
+                                 dis, prominence_window_seconds):
+            print(f"峰值缓存不存在或已过期 ({template_file})，重新计算...")
+            build_peak_cache(audio_path, template_folder, cache_dir, floor_x=min(floor_x, x),
+                             segment_duration_seconds=segment_duration_seconds, overlap_seconds=overlap_seconds,
+                             min_distance_seconds=dis, prominence_window_seconds=prominence_window_seconds, workers=workers)
+            break
+
+    detected_times_in_original_video = []
+    detections = []
+    for template_file in template_files:
+        cache_path = _peak_cache_path(cache_dir, audio_path, template_file)
+        if not os.path.exists(cache_path):
+            continue
+        with np.load(cache_path) as c:
+            if bool(c['skipped']) or bool(c['too_short']):
+                continue # 模板加载失败或能量过低，与 find_impact_segments 一样跳过
+            sr = int(c['sr'])
+            threshold = x * float(c['energy'])
+            distance_samples = max(1, int(dis * sr))
+            segments, samples = c['segment'], c['sample']
+            heights, prominences = c['height'], c['prominence']
+
+        for segment_count in np.unique(segments):
+            in_segment = (segments == segment_count) & (heights >= threshold)
+            seg_samples, seg_heights, seg_proms = samples[in_segment], heights[in_segment], prominences[in_segment]
+            keep = _select_by_distance(seg_samples, seg_heights, distance_samples)
+            keep &= seg_proms >= pro
+            for sample, peak_height, actual_prom in zip(seg_samples[keep], seg_heights[keep], seg_proms[keep]):
+                t_original_video = audio_clip_original_starttime_seconds + sample / sr
+                if not _in_gameplay(t_original_video, gameplay_segments):
+                    continue
+                if any(abs(t_original_video - recorded_time) < 0.25 for recorded_time in detected_times_in_original_video): # 去重阈值0.25秒
+                    continue
+                print(f"      >> 记录时间戳 (原视频): {seconds_to_hms(t_original_video)}, 模板: {template_file}, Corr峰值: {peak_height:.2f}, 峰值Prominence: {actual_prom:.2f}, Height阈值: {threshold:.2f}")
+                detected_times_in_original_video.append(t_original_video)
+                detections.append((t_original_video, peak_height, actual_prom, template_file))
+
+    detected_times_in_original_video.sort()
+    timestamps_filepath = os.path.join(save_directory, 'timestamps.txt')
+    with open(timestamps_filepath, 'w', encoding='utf-8') as f_timestamps:
+        for t in detected_times_in_original_video:
+            f_timestamps.write(f"{seconds_to_hms(t)}\n")
+    write_timestamp_scores(save_directory, detections, audio_clip_original_starttime_seconds)
+    print(f"[缓存] X={x}, PRO={pro}, DISTANCE={dis}: 共 {len(detected_times_in_original_video)} 个不重复的时间戳写入到 {timestamps_filepath}")
+    return detected_times_in_original_video
+
+def write_timestamp_scores(save_directory, detections, clip_start_seconds=0.0):
+    # timestamps.txt 的附带文件 timestamps_scores.tsv: 每个时间戳的模板、互相关峰值 (corr) 和 prominence，
+    # image_approach 的事件数据库 (event_dataset.ingest_audio_scores) 把它们导入为 detector="audio" 的事件。
+    # t_local 为本地视频时间 (原视频时间 - 音频在原视频中的开始时间)，与图像分析的时间一致
+    # detections: [(原视频时间, corr, prominence 或 None, 模板文件)]
+    scores_path = os.path.join(save_directory, TIMESTAMP_SCORES_FILENAME)
+    with open(scores_path, 'w', encoding='utf-8') as f:
+        f.write("t_original\tt_local\tcorr\tprominence\ttemplate\n")
+        for t, corr_value, prominence, template_file in sorted(detections, key=lambda d: d[0]):
+            prominence_str = "" if prominence is None else f"{float(prominence):.4f}"
+            f.write(f"{seconds_to_hms(t)}\t{seconds_to_hms(max(0.0, t - clip_start_seconds))}\t{float(corr_value):.4f}\t{prominence_str}\t{template_file}\n")
+    return scores_path
+
+def write_candidate_windows(detected_times, output_path, clip_start_seconds=0.0, before=1.5, after=1.5):
+    # 混合模式: 把音频检测到的枪声时间(原视频时间)转换成本地视频时间的候选窗口，供 image_approach 只解码这些小窗口
+    # 每行格式与 infinite_2.txt 相同: HH:MM:SS.mmm - HH:MM:SS.mmm，重叠的窗口会合并
+    windows = []
+    for t in sorted(detected_times):
+        local_t = t - clip_start_seconds
+        start = max(0.0, local_t - before)
+        end = local_t + after
+        if end <= 0:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for start, end in windows:
+            f.write(f"{seconds_to_hms(start)} - {seconds_to_hms(end)}\n")
+    total_window_seconds = sum(end - start for start, end in windows)
+    print(f"写入 {len(windows)} 个候选窗口 (共 {total_window_seconds:.1f} 秒) 到 {output_path}")
+    return windows
+
 def download_impact_segments(twitch_url, detected_times_path, save_directory, length=0.8):
     # 读取时间戳文件
     with open(detected_times_path, 'r', encoding='utf-8') as f:
@@ -301,4 +707,105 @@ def dl_target_audios(urltxt, outputfile):
                 print(f"警告: 跳过格式错误的行: {line}")
                 print("请确保每行格式为: url,starttime,endtime (例如: https://...,00:10:00.000,01:30:00.000)")
             except Exception as e:
-                print(f"处理行时发生错误 '{line}': {e}")
\ No newline at end of file
+                print(f"处理行时发生错误 '{line}': {e}")
+
+def probe_duration_seconds(media_path):
+    # 用 ffprobe 读取容器时长（秒），失败返回 None
+    command = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        media_path
+    ]
+    try:
+        result = subprocess.run(command, check=True, text=True, capture_output=True)
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, ValueError) as e:
+        print(f"警告: 无法读取 {media_path} 的时长: {e}")
+    except FileNotFoundError:
+        print("错误：未找到 ffprobe，请确保已安装并配置环境变量")
+    return None
+
+def extract_audio_from_video(video_path, audio_output_dir, video_id, start_time="00:00:00.000", end_time=None, mode='copy'):
+    # 从已下载的视频中只取出音轨，不需要再次联网下载，也不解码视频
+    # 文件名沿用 dl_target_audios 的规则 {video_id}_{HHMMSS.mmm}_{HHMMSS.mmm}，main.py 的 Part 2 可直接解析起始时间
+    # mode='copy': 音轨直接流复制为 .m4a（最快，不解码）
+    # mode='pcm' : 解码音轨为单声道 16bit PCM .wav（librosa 加载更快）
+    if mode not in ('copy', 'pcm'):
+        print(f"错误: 不支持的提取模式 '{mode}'，可选 'copy' 或 'pcm'。")
+        return None
+    os.makedirs(audio_output_dir, exist_ok=True)
+
+    start_key = start_time.replace(':', '')
+    # 缓存: 同一个 video_id + 起始时间 已经提取过则直接返回
+    for existing in os.listdir(audio_output_dir):
+        if existing.startswith(f"{video_id}_{start_key}_") and existing.endswith(('.m4a', '.wav')):
+            print(f"{existing} 已存在，跳过提取。")
+            return os.path.join(audio_output_dir, existing)
+
+    if not end_time:
+        duration = probe_duration_seconds(video_path)
+        if duration is None:
+            print(f"错误: 无法确定 {video_path} 的结束时间，跳过提取。")
+            return None
+        end_time = seconds_to_hms(hms_to_seconds(start_time) + duration)
+    end_key = end_time.replace(':', '')
+
+    if mode == 'copy':
+        output_path = os.path.join(audio_output_dir, f"{video_id}_{start_key}_{end_key}.m4a")
+        codec_args = ['-c:a', 'copy']
+    else:
+        output_path = os.path.join(audio_output_dir, f"{video_id}_{start_key}_{end_key}.wav")
+        codec_args = ['-ac', '1', '-c:a', 'pcm_s16le']
+
+    command = [
+        'ffmpeg',
+        '-i', video_path,
+        '-map', '0:a:0',  # 只取第一条音轨
+        '-vn',            # 不处理视频流
+        *codec_args,
+        '-y',
+        output_path
+    ]
+    try:
+        subprocess.run(command, check=True, text=True, capture_output=True, encoding='utf-8', errors='replace')
+        print(f"提取音频成功： {output_path}")
+        return output_path
+    except subprocess.CalledProcessError as e:
+        print(f"提取音频出错: {e}")
+        print(e.stderr)
+    except FileNotFoundError:
+        print("错误：未找到 ffmpeg，请确保已安装并配置环境变量")
+    if os.path.exists(output_path):
+        os.remove(output_path) # 不留下不完整的缓存文件
+    return None
+
+def extract_target_audios(video_dir, audio_output_dir, urltxt=None, mode='copy'):
+    # dl_target_audios 的本地版本: 对 downloaded_videos/ 里已有的完整视频提取音轨
+    # urltxt (url,starttime,endtime) 用于找回每个视频在原网络视频中的起始偏移；没有记录的视频按 00:00:00.000 处理
+    offsets = {}
+    if urltxt and os.path.exists(urltxt):
+        with open(urltxt, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = [p.strip() for p in line.split(',')]
+                video_code = urlparse(parts[0]).path.split('/')[-1]
+                if len(parts) == 3:
+                    offsets[video_code] = (parts[1], parts[2])
+                else:
+                    offsets[video_code] = ("00:00:00.000", None)
+
+    extracted = []
+    for filename in sorted(os.listdir(video_dir)):
+        if not filename.lower().endswith(('.mp4', '.mkv', '.mov', '.ts')):
+            continue
+        video_id = os.path.splitext(filename)[0]
+        start_time, end_time = offsets.get(video_id, ("00:00:00.000", None))
+        print(f"准备提取音频: {filename}, Start={start_time}, End={end_time}")
+        output_path = extract_audio_from_video(os.path.join(video_dir, filename), audio_output_dir, video_id,
+                                               start_time=start_time, end_time=end_time, mode=mode)
+        if output_path:
+            extracted.append(output_path)
+    return extracted
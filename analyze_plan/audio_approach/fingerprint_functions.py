@@ -0,0 +1,341 @@
+import os
+import librosa
+import numpy as np
+from scipy.ndimage import maximum_filter
+
+import analyze_plan_function
+from analyze_plan_function import (seconds_to_hms, _load_template_bank, _segment_peaks, _prominence_wlen,
+                                   _iter_segment_bounds, _bounds_in_segments, _map_shared_audio, _resolve_workers, _in_gameplay,
+                                   find_impact_segments, write_timestamp_scores)
+
+# 指纹索引 (landmark hashing):
+# 1. 每个模板只计算一次 mel 频谱上的局部峰值，峰值两两配对成 (f1, f2, dt) 哈希，建成索引表
+# 2. 对长音频按块计算一次频谱，提取同样的哈希，在索引中查找并按 (模板, 时间偏移) 投票
+# 3. 票数足够的位置才用原来的时域互相关 (_segment_peaks) 在附近的窗口内确认
+# 互相关只在候选位置附近计算，多小时音频的处理时间主要是一次 STFT
+# 确认时按 find_impact_segments 的分段计算，每个候选前后各多算 context (2 * distance + 模板长度 + prominence 窗口的一半)，
+# distance 规则和 prominence (有界的 wlen) 与全量扫描看到的是同样的互相关，只保留候选核心范围内的峰值
+
+def _landmark_hashes(f_bins, t_frames, n_mels, fan_out, max_dt_frames):
+    # 峰值按时间排序后，每个锚点与其后 fan_out 个峰值配对，只保留 1 <= dt <= max_dt_frames 的组合
+    # 返回 (哈希, 锚点帧)
+    hashes, anchors = [], []
+    for k in range(1, fan_out + 1):
+        if len(t_frames) <= k:
+            break
+        dt = t_frames[k:] - t_frames[:-k]
+        valid = (dt >= 1) & (dt <= max_dt_frames)
+        f1 = f_bins[:-k][valid]
+        f2 = f_bins[k:][valid]
+        hashes.append((f1 * n_mels + f2) * (max_dt_frames + 1) + dt[valid])
+        anchors.append(t_frames[:-k][valid])
+    if not hashes:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(hashes).astype(np.int64), np.concatenate(anchors).astype(np.int64)
+
+def _spectral_peaks(y_chunk, sr, n_fft, hop_length, n_mels, amp_min_db, peak_neighborhood):
+    # mel 频谱 (dB, 绝对参考值 1.0) 上的局部最大值。返回按 (帧, 频带) 排序的 (频带, 帧)
+    if len(y_chunk) < n_fft:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    S = librosa.feature.melspectrogram(y=y_chunk, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, center=False, power=2.0)
+    S_db = librosa.power_to_db(S, ref=1.0)
+    local_max = (S_db == maximum_filter(S_db, size=peak_neighborhood, mode='constant', cval=-np.inf)) & (S_db >= amp_min_db)
+    f_bins, t_frames = np.nonzero(local_max)
+    order = np.lexsort((f_bins, t_frames))
+    return f_bins[order].astype(np.int64), t_frames[order].astype(np.int64)
+
+def build_fingerprint_index(template_bank, sr, n_fft=1024, hop_length=256, n_mels=64,
+                            amp_min_db=-50.0, peak_neighborhood=(5, 5), fan_out=5, max_dt_frames=32):
+    # 为模板库建立指纹索引。返回 dict:
+    # 'hashes' (已排序), 'template_idx', 'template_frame' 三个等长数组，以及每个模板的 landmark 数量
+    all_hashes, all_tidx, all_tframe = [], [], []
+    landmark_counts = []
+    for t_idx, entry in enumerate(template_bank):
+        f_bins, t_frames = _spectral_peaks(entry['template'], sr, n_fft, hop_length, n_mels, amp_min_db, peak_neighborhood)
+        hashes, anchors = _landmark_hashes(f_bins, t_frames, n_mels, fan_out, max_dt_frames)
+        landmark_counts.append(len(hashes))
+        print(f"  指纹: 模板 {entry['file']} -> {len(f_bins)} 个频谱峰值, {len(hashes)} 个 landmark")
+        all_hashes.append(hashes)
+        all_tidx.append(np.full(len(hashes), t_idx, dtype=np.int64))
+        all_tframe.append(anchors)
+
+    if all_hashes:
+        hashes = np.concatenate(all_hashes)
+        tidx = np.concatenate(all_tidx)
+        tframe = np.concatenate(all_tframe)
+    else:
+        hashes = tidx = tframe = np.array([], dtype=np.int64)
+    order = np.argsort(hashes, kind='stable')
+    return {
+        'hashes': hashes[order],
+        'template_idx': tidx[order],
+        'template_frame': tframe[order],
+        'landmark_counts': landmark_counts,
+        'params': dict(n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, amp_min_db=amp_min_db,
+                       peak_neighborhood=peak_neighborhood, fan_out=fan_out, max_dt_frames=max_dt_frames),
+    }
+
+def _lookup_votes(index, stream_hashes, stream_anchors):
+    # 用 searchsorted 在已排序的索引中查找，返回每个匹配的 (模板, 模板起点在音频中的帧)
+    left = np.searchsorted(index['hashes'], stream_hashes, side='left')
+    right = np.searchsorted(index['hashes'], stream_hashes, side='right')
+    counts = right - left
+    if counts.sum() == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    # 展开所有 [left, right) 区间
+    match_stream = np.repeat(np.arange(len(stream_hashes)), counts)
+    starts = np.repeat(left - np.cumsum(counts) + counts, counts)
+    match_index = starts + np.arange(counts.sum())
+    offsets = stream_anchors[match_stream] - index['template_frame'][match_index]
+    return index['template_idx'][match_index], offsets
+
+def _chunk_landmarks(y, sr, p, chunk):
+    # 一个块的 landmark (a, s, b: 计算范围起点帧、本块起点帧、计算范围终点帧，p['chunk_frames']: 块长度)，
+    # 只返回锚点在本块内的 (哈希, 锚点帧)
+    a, s, b = chunk
+    y_chunk = y[a * p['hop_length']:(b - 1) * p['hop_length'] + p['n_fft']]
+    f_bins, t_frames = _spectral_peaks(y_chunk, sr, p['n_fft'], p['hop_length'], p['n_mels'], p['amp_min_db'], p['peak_neighborhood'])
+    hashes, anchors = _landmark_hashes(f_bins, t_frames + a, p['n_mels'], p['fan_out'], p['max_dt_frames'])
+    own = (anchors >= s) & (anchors < s + p['chunk_frames'])
+    return hashes[own], anchors[own]
+
+def _chunk_landmarks_worker(chunk):
+    # 多进程模式: 音频在共享内存中 (analyze_plan_function._map_shared_audio)，extra = (sr, 参数)
+    sr, p = analyze_plan_function._worker_extra
+    return _chunk_landmarks(analyze_plan_function._worker_audio, sr, p, chunk)
+
+def scan_fingerprint_candidates(y, sr, index, chunk_seconds=60.0, offset_tolerance_frames=2,
+                                min_vote_ratio=0.2, min_votes=3, workers=1, sample_ranges=None):
+    # 按块计算整段音频的频谱并投票。块两端各多算 pad 帧，锚点只取本块范围内的，避免重复和漏检
+    # workers: 大于1时各块的频谱在多个进程中计算 (与 find_impact_segments 相同的共享内存方式)，结果与串行一致
+    # sample_ranges: 可选 [(起点样本, 终点样本)]，只计算与这些范围重叠的块 (游戏画面分段)
+    # 返回 [(模板序号, 模板起点样本, 票数)]
+    p = index['params']
+    n_fft, hop_length = p['n_fft'], p['hop_length']
+    if len(y) < n_fft:
+        return []
+    n_frames = 1 + (len(y) - n_fft) // hop_length
+    chunk_frames = max(1, int(chunk_seconds * sr / hop_length))
+    pad_frames = p['max_dt_frames'] + max(p['peak_neighborhood'])
+
+    chunks = []
+    for s in range(0, n_frames, chunk_frames):
+        chunk_start, chunk_end = s * hop_length, (s + chunk_frames) * hop_length + n_fft
+        if sample_ranges is not None and not any(start < chunk_end and chunk_start < end for start, end in sample_ranges):
+            continue
+        chunks.append((max(0, s - pad_frames), s, min(n_frames, s + chunk_frames + pad_frames)))
+    chunk_params = dict(p, chunk_frames=chunk_frames)
+    workers = _resolve_workers(workers)
+    if workers > 1 and len(chunks) > 1:
+        print(f"  指纹扫描并行模式: {len(chunks)} 个块，使用 {workers} 个进程。")
+        chunk_results = _map_shared_audio(y, _chunk_landmarks_worker, chunks, workers, extra=(sr, chunk_params))
+    else:
+        chunk_results = (_chunk_landmarks(y, sr, chunk_params, chunk) for chunk in chunks)
+
+    vote_tidx, vote_offsets = [], []
+    total_landmarks = 0
+    for hashes, anchors in chunk_results:
+        total_landmarks += len(hashes)
+        tidx, offsets = _lookup_votes(index, hashes, anchors)
+        vote_tidx.append(tidx)
+        vote_offsets.append(offsets)
+
+    if not vote_tidx:
+        return []
+    vote_tidx = np.concatenate(vote_tidx)
+    vote_offsets = np.concatenate(vote_offsets)
+    print(f"  指纹扫描: {n_frames} 帧, {total_landmarks} 个 landmark, {len(vote_offsets)} 次索引命中")
+    if len(vote_offsets) == 0:
+        return []
+
+    # 允许 ±offset_tolerance_frames 的偏移误差: 偏移量按容差分桶后计票
+    tol = max(1, int(offset_tolerance_frames))
+    offset_bins = np.floor_divide(vote_offsets, tol)
+    keys = np.stack([vote_tidx, offset_bins], axis=1)
+    unique_keys, vote_counts = np.unique(keys, axis=0, return_counts=True)
+
+    candidates = []
+    for (t_idx, offset_bin), votes in zip(unique_keys, vote_counts):
+        needed = max(min_votes, min_vote_ratio * index['landmark_counts'][t_idx])
+        if votes >= needed:
+            candidates.append((int(t_idx), int(offset_bin) * tol * hop_length, int(votes)))
+    return candidates
+
+def _candidate_groups(candidates, margin_samples, context_samples):
+    # candidates: 同一个模板的 [(模板起点样本, 票数)]。每个候选的核心范围为起点 ±margin，
+    # 重叠的核心合并 (相邻偏移桶的候选是同一个位置)，上下文会重叠的核心放在同一组，同一段音频只做一次互相关
+    # 返回 [[(核心起点, 核心终点, 票数), ...], ...]
+    groups = []
+    for start, votes in sorted(candidates):
+        core_start, core_end = start - margin_samples, start + margin_samples
+        if groups and core_start - groups[-1][-1][1] <= 2 * context_samples:
+            last_start, last_end, last_votes = groups[-1][-1]
+            if core_start <= last_end:
+                groups[-1][-1] = (last_start, max(last_end, core_end), max(last_votes, votes))
+            else:
+                groups[-1].append((core_start, core_end, votes))
+        else:
+            groups.append([(core_start, core_end, votes)])
+    return groups
+
+def verify_candidates(y, sr, template_bank, candidates, dis, pro, bounds_list,
+                      margin_samples, prominence_window_seconds=4.0):
+    # 在 find_impact_segments 的分段 (bounds_list) 内确认指纹候选。
+    # 返回 (peaks_by_template, 互相关覆盖的样本数)，peaks_by_template[模板][分段序号] = [(音频中的样本, Corr峰值, Prominence, 票数)]
+    distance_samples = max(1, int(dis * sr))
+    wlen_samples = _prominence_wlen(prominence_window_seconds, sr)
+    candidates_by_template = {}
+    for t_idx, start_sample, votes in candidates:
+        candidates_by_template.setdefault(t_idx, []).append((start_sample, votes))
+
+    peaks_by_template = [{} for _ in template_bank]
+    verified_samples = 0
+    for t_idx, template_candidates in sorted(candidates_by_template.items()):
+        entry = template_bank[t_idx]
+        template_length = len(entry['template'])
+        if wlen_samples is None:
+            context_samples = bounds_list[0][1] - bounds_list[0][0] if bounds_list else len(y) # prominence 不限窗口时需要整个分段
+        else:
+            context_samples = 2 * distance_samples + template_length + wlen_samples // 2
+        for group in _candidate_groups(template_candidates, margin_samples, context_samples):
+            for seg_idx, (seg_start, seg_end) in enumerate(bounds_list):
+                # 模板起点范围: 不超出分段，分段边界处与全量扫描一样截断
+                lo = max(seg_start, group[0][0] - context_samples)
+                hi = min(seg_end - template_length, group[-1][1] + context_samples)
+                if hi < lo or not any(core_start <= hi and lo <= core_end for core_start, core_end, _ in group):
+                    continue
+                verified_samples += hi + template_length - lo
+                segment_result = _segment_peaks(y[lo:hi + template_length], entry['template'], entry['threshold'],
+                                                distance_samples, pro, wlen_samples)
+                if segment_result is None:
+                    continue
+                for peak, corr_value, prominence in zip(*segment_result):
+                    sample = lo + int(peak)
+                    for core_start, core_end, votes in group:
+                        if core_start <= sample <= core_end:
+                            peaks_by_template[t_idx].setdefault(seg_idx, []).append((sample, corr_value, prominence, votes))
+                            break
+    return peaks_by_template, verified_samples
+
+def find_impact_segments_fingerprint(twitch_url, audio_path, template_folder, output_folder,
+                                     audio_clip_original_starttime_seconds=0.0,
+                                     x=0.65, dis=10.0, pro=0.1,
+                                     segment_duration_seconds=180.0,
+                                     overlap_seconds=10.0,
+                                     prominence_window_seconds=4.0,
+                                     n_fft=1024, hop_length=256, n_mels=64, amp_min_db=-50.0,
+                                     fan_out=5, max_dt_frames=32,
+                                     min_vote_ratio=0.2, min_votes=3,
+                                     chunk_seconds=60.0, verify_margin_seconds=0.1,
+                                     workers=1, gameplay_segments=None):
+    # 与 find_impact_segments 参数和输出 (timestamps.txt, 返回值) 相同，
+    # 但只在指纹投票得到的候选位置附近做时域互相关确认。
+    # 指纹找到候选的位置，结果与相同参数 (包括分段和 prominence_window_seconds) 的 find_impact_segments 一致
+    # workers: 指纹扫描 (频谱) 的进程数；gameplay_segments: 与 find_impact_segments 相同，
+    # 只扫描游戏画面分段附近的音频块，只确认和记录分段内的峰值
+    video_id = twitch_url.split('/')[-1]
+    save_directory = os.path.join(output_folder, video_id)
+    if not os.path.exists(save_directory):
+        os.makedirs(save_directory)
+        print(f"创建保存目录: {save_directory}")
+
+    try:
+        y, sr = librosa.load(audio_path, sr=None)
+        if y is None or len(y) == 0:
+            print(f"错误: 加载的音频文件 {audio_path} 为空。跳过处理。")
+            return []
+        print(f"加载音频文件: {audio_path}, 采样率: {sr}, 时长: {len(y)/sr:.2f} 秒")
+    except Exception as e:
+        print(f"错误: 无法加载音频文件 {audio_path}: {e}")
+        return []
+
+    template_files = [f for f in os.listdir(template_folder) if f.endswith(('.mp3', '.wav', '.m4a', '.aac', '.ogg'))]
+    print(f"在 {template_folder} 中找到 {len(template_files)} 个模板文件: {template_files}")
+    template_bank = _load_template_bank(template_folder, template_files, sr, x)
+
+    segment_length_samples = int(segment_duration_seconds * sr)
+    step_samples = segment_length_samples - int(overlap_seconds * sr)
+    if step_samples <= 0:
+        step_samples = segment_length_samples
+    bounds_list = list(_iter_segment_bounds(len(y), segment_length_samples, step_samples))
+    margin_samples = int(verify_margin_seconds * sr) + 2 * hop_length
+
+    sample_ranges = None
+    if gameplay_segments is not None:
+        segments_samples = [(int((start - audio_clip_original_starttime_seconds) * sr), int((end - audio_clip_original_starttime_seconds) * sr))
+                            for start, end in gameplay_segments]
+        all_bounds_count = len(bounds_list)
+        bounds_list = _bounds_in_segments(bounds_list, segments_samples)
+        # 候选的模板起点可能在锚点之前一个模板长度，扫描范围两端各放宽一个模板长度
+        pad_samples = max((len(entry['template']) for entry in template_bank), default=0) + margin_samples
+        sample_ranges = [(start - pad_samples, end + pad_samples) for start, end in segments_samples]
+        print(f"游戏画面分段: {len(gameplay_segments)} 段，只分析其中 {len(bounds_list)} / {all_bounds_count} 个音频分段。")
+
+    index = build_fingerprint_index(template_bank, sr, n_fft=n_fft, hop_length=hop_length, n_mels=n_mels,
+                                    amp_min_db=amp_min_db, fan_out=fan_out, max_dt_frames=max_dt_frames)
+    candidates = scan_fingerprint_candidates(y, sr, index, chunk_seconds=chunk_seconds,
+                                             min_vote_ratio=min_vote_ratio, min_votes=min_votes,
+                                             workers=workers, sample_ranges=sample_ranges)
+    print(f"  指纹候选位置: {len(candidates)} 个，开始时域互相关确认...")
+    peaks_by_template, verified_samples = verify_candidates(y, sr, template_bank, candidates, dis, pro, bounds_list,
+                                                            margin_samples, prominence_window_seconds)
+
+    detected_times_in_original_video = []
+    detections = []
+    # 按 模板 -> 分段 -> 时间 顺序合并去重，与 find_impact_segments 一致
+    for t_idx, entry in enumerate(template_bank):
+        for seg_idx in sorted(peaks_by_template[t_idx]):
+            for sample, peak_corr_value, actual_prom, votes in peaks_by_template[t_idx][seg_idx]:
+                t_original_video = audio_clip_original_starttime_seconds + sample / sr
+                if not _in_gameplay(t_original_video, gameplay_segments):
+                    continue
+                if any(abs(t_original_video - recorded_time) < 0.25 for recorded_time in detected_times_in_original_video): # 去重阈值0.25秒
+                    continue
+                print(f"      >> 记录时间戳 (原视频): {seconds_to_hms(t_original_video)}, 模板: {entry['file']}, 指纹票数: {votes}, Corr峰值: {peak_corr_value:.2f}, 峰值Prominence: {actual_prom:.2f}, Height阈值: {entry['threshold']:.2f}")
+                detected_times_in_original_video.append(t_original_video)
+                detections.append((t_original_video, peak_corr_value, actual_prom, entry['file']))
+
+    print(f"  互相关确认只覆盖了 {verified_samples / sr:.1f} 秒音频 (全长 {len(y)/sr:.1f} 秒)")
+
+    detected_times_in_original_video.sort()
+    timestamps_filepath = os.path.join(save_directory, 'timestamps.txt')
+    with open(timestamps_filepath, 'w', encoding='utf-8') as f_timestamps:
+        for t in detected_times_in_original_video:
+            f_timestamps.write(f"{seconds_to_hms(t)}\n")
+    write_timestamp_scores(save_directory, detections, audio_clip_original_starttime_seconds)
+    print(f"总共检测到 {len(detected_times_in_original_video)} 个不重复的时间戳 (相对于原视频) 写入到 {timestamps_filepath}")
+    return detected_times_in_original_video
+
+def check_fingerprint_against_full_scan(twitch_url, audio_path, template_folder, output_folder,
+                                        audio_clip_original_starttime_seconds=0.0,
+                                        x=0.65, dis=10.0, pro=0.1,
+                                        segment_duration_seconds=180.0,
+                                        overlap_seconds=10.0,
+                                        prominence_window_seconds=4.0,
+                                        workers=1,
+                                        gameplay_segments=None,
+                                        **fingerprint_kwargs):
+    # 在同一个音频上分别运行 find_impact_segments 和 find_impact_segments_fingerprint，比较两者的 timestamps.txt。
+    # 结果分别写到 output_folder/_fingerprint_check/{full,fingerprint}/<id>/，不覆盖正式的结果。
+    # 只有全量扫描有的时间戳是指纹没有给出候选的位置 (召回率)，只有指纹有的时间戳说明确认窗口与全量扫描不一致
+    check_root = os.path.join(output_folder, '_fingerprint_check')
+    common = dict(audio_clip_original_starttime_seconds=audio_clip_original_starttime_seconds, x=x, dis=dis, pro=pro,
+                  segment_duration_seconds=segment_duration_seconds, overlap_seconds=overlap_seconds,
+                  prominence_window_seconds=prominence_window_seconds, workers=workers, gameplay_segments=gameplay_segments)
+    full_times = find_impact_segments(twitch_url, audio_path, template_folder, os.path.join(check_root, 'full'), **common)
+    fingerprint_times = find_impact_segments_fingerprint(twitch_url, audio_path, template_folder, os.path.join(check_root, 'fingerprint'),
+                                                         **common, **fingerprint_kwargs)
+    full_set = {seconds_to_hms(t) for t in full_times}
+    fingerprint_set = {seconds_to_hms(t) for t in fingerprint_times}
+    missing = sorted(full_set - fingerprint_set)
+    extra = sorted(fingerprint_set - full_set)
+    print(f"[指纹检查] 全量扫描 {len(full_set)} 个时间戳, 指纹 {len(fingerprint_set)} 个; "
+          f"只在全量扫描中: {len(missing)}, 只在指纹中: {len(extra)}")
+    for t in missing:
+        print(f"    只在全量扫描中: {t}")
+    for t in extra:
+        print(f"    只在指纹中: {t}")
+    if not missing and not extra:
+        print("[指纹检查] 两种方式的时间戳完全一致。")
+    return {'full': len(full_set), 'fingerprint': len(fingerprint_set), 'missing': missing, 'extra': extra,
+            'identical': not missing and not extra}
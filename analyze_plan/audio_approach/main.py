@@ -13,6 +13,12 @@ from analyze_plan_function import download_impact_segments
 from analyze_plan_function import update_txt
 from analyze_plan_function import redownload_segments
 from analyze_plan_function import dl_target_audios
+from analyze_plan_function import extract_target_audios
+from analyze_plan_function import write_candidate_windows
+from analyze_plan_function import rethreshold_from_cache
+from analyze_plan_function import read_gameplay_segments
+from fingerprint_functions import find_impact_segments_fingerprint
+from fingerprint_functions import check_fingerprint_against_full_scan
 
 # "yt-dlp -F https://www.twitch.tv/videos/2386208922"  # 查看视频流信息
 # sb1        mhtml 110x62       0 │                  mhtml │ images      storyboard
@@ -32,8 +38,15 @@ if __name__ == "__main__":
     # 设置范围：找到那些您认为是正确检测 (True Positives) 的时间点，查看它们的 实际Prominences 值大概在什么范围。找到那些您认为是错误检测 (False Positives) 的时间点，查看它们的 实际Prominences 值又在什么范围。
     # Corr峰值 在该时间点附近找到的互相关函数的峰值大小。
     DISTANCE = 0.3 # 两个被识别为独立的峰值之间所需的最小时间间隔
+    Prominence_Window_Seconds = None # 全量扫描和峰值缓存: None 时 prominence 的基线到分段边界为止 (与之前的结果相同)
+    Fingerprint_Prominence_Window_Seconds = 4.0 # 指纹模式: prominence 的基线只在峰值前后各 2 秒内寻找；与全量扫描使用同一个值时结果一致 (Check_Fingerprint 两边都用这个值)
     Overlap_Seconds = 2.0 
     Segment_Duration_Seconds = 180.0
+    Workers = os.cpu_count() # 并行分析的进程数，1 为串行。分段之间相互独立，结果与串行完全一致
+    Rethreshold = False # True: 使用峰值缓存 (clips/<id>/peak_cache) 按新的 X/PRO/DISTANCE 重新生成 timestamps.txt，不再重新计算互相关。首次运行会自动建立缓存 (DISTANCE 调小后会重新建立)
+    Use_Fingerprint = False # True: 先用频谱指纹索引找候选位置，只在候选附近做互相关确认（多小时音频快很多）
+    Check_Fingerprint = False # True: 对每个音频同时运行全量扫描和指纹模式并比较时间戳 (结果在 clips/_fingerprint_check)，不写正式结果
+    Gameplay_Segments_Dir = None # 例如 ROOT + "\\clips_output": image_approach 的游戏画面分段 (<id>/gameplay_segments.txt) 存在时只分析分段内的音频 (本地视频需从头下载，时间与原视频相同)
 
     ROOT = "E:\\mande\\0_PLAN"
     URLROOT = "https://www.twitch.tv/videos/"
@@ -46,6 +59,8 @@ if __name__ == "__main__":
     # part1 下载
     # 下载目标音频
     # dl_target_audios(URLPATH, ROOT+"\\audio")
+    # 或者: 直接从 image_approach 已下载的完整视频中提取音轨（流复制，不需要再次下载）
+    # extract_target_audios(ROOT+"\\downloaded_videos", AUDIO_DIR, ROOT+"\\video_urls.txt", mode='copy')
 
     # part2 分析音频
     print("\n--- Part 2: 分析音频 (从文件名直接解析信息) ---")
@@ -109,17 +124,82 @@ if __name__ == "__main__":
         print(f"  对应的 Twitch Video ID: {audio_file_video_id}")
         print(f"  此音频片段在原始视频中的起始时间（秒）: {clip_original_start_s:.3f} (从文件名中的 '{clip_start_time_from_filename}' 解析为 '{clip_start_time_standard_format}')")
 
-        find_impact_segments(
-            twitch_url_for_analysis,
-            current_audio_path,
-            template_folder,
-            output_folder,
-            audio_clip_original_starttime_seconds=clip_original_start_s,
-            x=X,
-            dis=DISTANCE,
-            pro=PRO,
-            segment_duration_seconds = Segment_Duration_Seconds,
-            overlap_seconds = Overlap_Seconds
+        gameplay_segments = None
+        if Gameplay_Segments_Dir:
+            segments_path = os.path.join(Gameplay_Segments_Dir, audio_file_video_id, 'gameplay_segments.txt')
+            if os.path.exists(segments_path):
+                gameplay_segments = read_gameplay_segments(segments_path)
+
+        if Check_Fingerprint:
+            check_fingerprint_against_full_scan(
+                twitch_url_for_analysis,
+                current_audio_path,
+                template_folder,
+                output_folder,
+                audio_clip_original_starttime_seconds=clip_original_start_s,
+                x=X,
+                dis=DISTANCE,
+                pro=PRO,
+                segment_duration_seconds = Segment_Duration_Seconds,
+                overlap_seconds = Overlap_Seconds,
+                prominence_window_seconds = Fingerprint_Prominence_Window_Seconds,
+                workers = Workers,
+                gameplay_segments = gameplay_segments
+            )
+            continue
+        if Rethreshold:
+            detected_times = rethreshold_from_cache(
+                twitch_url_for_analysis,
+                current_audio_path,
+                template_folder,
+                output_folder,
+                audio_clip_original_starttime_seconds=clip_original_start_s,
+                x=X,
+                dis=DISTANCE,
+                pro=PRO,
+                segment_duration_seconds = Segment_Duration_Seconds,
+                overlap_seconds = Overlap_Seconds,
+                prominence_window_seconds = Prominence_Window_Seconds,
+                workers = Workers,
+                gameplay_segments = gameplay_segments
+            )
+        elif Use_Fingerprint:
+            detected_times = find_impact_segments_fingerprint(
+                twitch_url_for_analysis,
+                current_audio_path,
+                template_folder,
+                output_folder,
+                audio_clip_original_starttime_seconds=clip_original_start_s,
+                x=X,
+                dis=DISTANCE,
+                pro=PRO,
+                segment_duration_seconds = Segment_Duration_Seconds,
+                overlap_seconds = Overlap_Seconds,
+                prominence_window_seconds = Fingerprint_Prominence_Window_Seconds,
+                workers = Workers,
+                gameplay_segments = gameplay_segments
+            )
+        else:
+            detected_times = find_impact_segments(
+                twitch_url_for_analysis,
+                current_audio_path,
+                template_folder,
+                output_folder,
+                audio_clip_original_starttime_seconds=clip_original_start_s,
+                x=X,
+                dis=DISTANCE,
+                pro=PRO,
+                segment_duration_seconds = Segment_Duration_Seconds,
+                overlap_seconds = Overlap_Seconds,
+                workers = Workers,
+                gameplay_segments = gameplay_segments,
+                prominence_window_seconds = Prominence_Window_Seconds
+            )
+        # 混合模式: 输出候选窗口(本地视频时间)，image_approach 的 verify_shots_in_windows 只解码这些窗口
+        write_candidate_windows(
+            detected_times,
+            os.path.join(output_folder, audio_file_video_id, 'candidate_windows.txt'),
+            clip_start_seconds=clip_original_start_s
         )
 
     print("\n--- Part 2: 音频分析完成 ---")
@@ -8,8 +8,14 @@ import subprocess
 import sys # For platform-specific open
 
 # Assuming these files are in the same directory
-from analysis_functions import find_shooting_moments, WEAPON_METADATA # Import WEAPON_METADATA
+from analysis_functions import find_shooting_moments, has_resumable_checkpoint, verify_shots_in_windows, WEAPON_METADATA # Import WEAPON_METADATA
 from general_function import download_twitch, hms_to_seconds, seconds_to_hms #
+from download_functions import read_download_jobs, run_download_queue
+from pipeline_functions import run_pipeline, run_two_tier_ingest, clip_weapon_times
+from proxy_functions import build_hud_proxy
+from gameplay_segments import segment_gameplay
+from event_dataset import update_event_dataset
+from clip_plan import plan_weapon_clips, plan_time_file_clips, plan_range_file_clips, load_calibration, calibrate_clip_costs, write_clip_plan, format_estimate, CALIBRATION_FILENAME
 # Import the new merge function as well
 from clip_functions import clip_video_ffmpeg, generate_clips_from_multiple_weapon_times, clip_video_ffmpeg_merged, clip_video_ffmpeg_with_duration, process_and_merge_times, generate_clips_from_multiple_weapon_times_merge, generate_concatenated_video_from_timestamps #
 
@@ -56,6 +62,7 @@ class VideoProcessingGUI:
             "SIMILARITY_THRESHOLD_INFINITE": tk.StringVar(value="0.74"), #
             "COARSE_SCAN_INTERVAL_SECONDS": tk.StringVar(value="2.8"), #
             "FINE_SCAN_INTERVAL_SECONDS": tk.StringVar(value="0.1"), #
+            "MAX_COARSE_INTERVAL_SECONDS": tk.StringVar(value="0"),
             "CLIP_DURATION": tk.StringVar(value="1.0"), # New parameter
             "MERGE_THRESHOLD_FACTOR": tk.StringVar(value="3.0"), # New parameter (now in seconds)
             "START_TIME": tk.StringVar(value="00:00:00.000"), #
@@ -70,6 +77,15 @@ class VideoProcessingGUI:
         }
         self.part3_enabled = tk.BooleanVar(value=False) #
         self.part3_clip_mode = tk.StringVar(value="individual") #
+        self.pipeline_mode = tk.BooleanVar(value=False)
+        self.use_hud_proxy = tk.BooleanVar(value=False)
+        self.clip_dry_run = tk.BooleanVar(value=False)
+        self.use_pyav_decode = tk.BooleanVar(value=False)
+        self.keyframe_coarse = tk.BooleanVar(value=False)
+        self.skip_non_gameplay = tk.BooleanVar(value=False)
+        self.profile_analysis = tk.BooleanVar(value=False)
+        self.hybrid_audio_windows = tk.BooleanVar(value=False)
+        self.two_tier_ingest = tk.BooleanVar(value=False)
         
         self.video_checkbox_vars = {} #
         self.selected_weapons_vars = { #
@@ -152,7 +168,7 @@ class VideoProcessingGUI:
             [("Weapon image ROI (X1 Y1 X2 Y2):", ["BOW_ROI_X1", "BOW_ROI_Y1", "BOW_ROI_X2", "BOW_ROI_Y2"])],
             [("Bow Infinite ROI (X1 Y1 X2 Y2):", ["INFINITE_ROI_X1", "INFINITE_ROI_Y1", "INFINITE_ROI_X2", "INFINITE_ROI_Y2"])], #
             [("Weapon image Threshold:", ["BOW_SIMILARITY_THRESHOLD"]), ("Bow Infinite Thresh:", ["SIMILARITY_THRESHOLD_INFINITE"])],
-            [("Coarse Scan (s):", ["COARSE_SCAN_INTERVAL_SECONDS"]), ("Fine Scan (s):", ["FINE_SCAN_INTERVAL_SECONDS"])], #
+            [("Coarse Scan (s):", ["COARSE_SCAN_INTERVAL_SECONDS"]), ("Fine Scan (s):", ["FINE_SCAN_INTERVAL_SECONDS"]), ("Max Coarse (s, 0=fixed):", ["MAX_COARSE_INTERVAL_SECONDS"])], #
             [("Analysis Start Time (HH:MM:SS.mmm):", ["START_TIME"], 3)],
             [("Clip Duration (s):", ["CLIP_DURATION"]), ("Merge Threshold (s):", ["MERGE_THRESHOLD_FACTOR"])]
         ]
@@ -237,8 +253,18 @@ class VideoProcessingGUI:
             col_task += 1 
             if col_task >= 2: col_task = 0; row_task += 1 
         
+        ttk.Checkbutton(tasks_frame, text="Pipeline mode: analyze / clip each video as soon as it is downloaded (Parts 1+2[+3])", variable=self.pipeline_mode).grid(row=row_task+1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Analyze a small HUD-only proxy video (crop + grayscale + fine-scan fps, built once per video)", variable=self.use_hud_proxy).grid(row=row_task+2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Plan clips only (dry run): write clip_plan.json with a cost estimate instead of running ffmpeg (Parts 3/4/6)", variable=self.clip_dry_run).grid(row=row_task+3, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Decode with PyAV for analysis (multi-threaded, luma plane only, no BGR conversion; requires pip install av)", variable=self.use_pyav_decode).grid(row=row_task+4, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Keyframe-only coarse scan (PyAV decoding only; coarse samples at keyframes, never further apart than the coarse interval)", variable=self.keyframe_coarse).grid(row=row_task+5, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Skip non-gameplay parts (lobby / chatting / replays): low-rate HUD pre-pass, segments saved per video", variable=self.skip_non_gameplay).grid(row=row_task+6, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Profile Part 2 with cProfile (per-stage timings are always written to analysis_profile.json; this adds analysis_profile.prof)", variable=self.profile_analysis).grid(row=row_task+7, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Hybrid Part 2: only verify the audio candidate windows (<id>/candidate_windows.txt from audio_approach) instead of scanning the whole video", variable=self.hybrid_audio_windows).grid(row=row_task+8, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Two-tier download: download a low-res copy, analyze it, then download only the high-res sections around the shots (Parts 1+2; sections go to clips_output/<id>/sections)", variable=self.two_tier_ingest).grid(row=row_task+9, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+
         task_buttons_frame = ttk.Frame(tasks_frame) 
-        task_buttons_frame.grid(row=row_task+1, column=0, columnspan=2, pady=3) 
+        task_buttons_frame.grid(row=row_task+10, column=0, columnspan=2, pady=3) 
         ttk.Button(task_buttons_frame, text="Select All Parts", command=self.select_all_parts).pack(side=tk.LEFT, padx=5) 
         ttk.Button(task_buttons_frame, text="Deselect All Parts", command=self.deselect_all_parts).pack(side=tk.LEFT, padx=5) 
         
@@ -392,7 +418,7 @@ class VideoProcessingGUI:
                       "INFINITE_ROI_X1", "INFINITE_ROI_Y1", "INFINITE_ROI_X2", "INFINITE_ROI_Y2"]: #
                 config[k_int] = int(self.params[k_int].get()) #
             for k_float in ["BOW_SIMILARITY_THRESHOLD", "SIMILARITY_THRESHOLD_INFINITE", #
-                      "COARSE_SCAN_INTERVAL_SECONDS", "FINE_SCAN_INTERVAL_SECONDS",
+                      "COARSE_SCAN_INTERVAL_SECONDS", "FINE_SCAN_INTERVAL_SECONDS", "MAX_COARSE_INTERVAL_SECONDS",
                       "CLIP_DURATION", "MERGE_THRESHOLD_FACTOR"]: # Added CLIP_DURATION and MERGE_THRESHOLD_FACTOR
                 config[k_float] = float(self.params[k_float].get()) #
         except ValueError as e: #
@@ -411,11 +437,22 @@ class VideoProcessingGUI:
             messagebox.showwarning("No Parts Selected", "Please select at least one part to run.") #
             self.run_button.config(state=tk.NORMAL); return #
         config["selected_parts"] = selected_parts_set #
+        config["pipeline_mode"] = self.pipeline_mode.get() and '1' in selected_parts_set and '2' in selected_parts_set
+        config["two_tier_ingest"] = self.two_tier_ingest.get() and '1' in selected_parts_set and '2' in selected_parts_set
+        config["use_hud_proxy"] = self.use_hud_proxy.get()
+        config["clip_dry_run"] = self.clip_dry_run.get()
+        config["decode_backend"] = "pyav" if self.use_pyav_decode.get() else "opencv"
+        config["keyframe_coarse"] = self.keyframe_coarse.get()
+        config["skip_non_gameplay"] = self.skip_non_gameplay.get()
+        config["profile_analysis"] = self.profile_analysis.get()
+        config["hybrid_audio_windows"] = self.hybrid_audio_windows.get()
         
         config["selected_video_ids_for_processing"] = [ #
             video_id for video_id, var in self.video_checkbox_vars.items() if var.get() #
         ]
-        if any(p in selected_parts_set for p in ['2', '3', '4', '5', '6']): #
+        # 流水线模式下 Part 2/3 处理刚下载的视频，不需要在列表中选择
+        parts_needing_video_selection = ['4', '5', '6'] if config["pipeline_mode"] or config["two_tier_ingest"] else ['2', '3', '4', '5', '6']
+        if any(p in selected_parts_set for p in parts_needing_video_selection): #
             if not config["selected_video_ids_for_processing"] and self.video_checkbox_vars: # Check if checkboxes exist but none selected
                 messagebox.showwarning("No Videos Selected", "Please select videos from the list for Parts 2-6, or ensure the list is refreshed.") #
                 self.run_button.config(state=tk.NORMAL); return #
@@ -459,6 +496,7 @@ class VideoProcessingGUI:
         selected_video_ids_to_process = config.get("selected_video_ids_for_processing", []) #
         selected_weapons_for_analysis = config.get("selected_weapons_for_analysis", []) #
         part3_clip_mode_selected = config.get("part3_mode") #
+        clip_plan_jobs = [] # 试运行时 Part 3/4/6 的剪辑任务
         
         logic_logger.info(f"User selected Parts: {sorted(list(selected_parts))}") #
         if '3' in selected_parts:
@@ -468,35 +506,121 @@ class VideoProcessingGUI:
         if selected_video_ids_to_process and any(p in selected_parts for p in ['2','3','4','5','6']): 
             logic_logger.info(f"User selected Video IDs for processing (Parts 2-6): {selected_video_ids_to_process}") 
         
-        if '1' in selected_parts: 
+        # 单个视频的 Part 2 分析，Part 2 循环和流水线模式共用
+        def analyze_video(video_id, video_path_for_analysis):
+            video_specific_output_dir_part2 = os.path.join(output_root_folder, video_id)
+            os.makedirs(video_specific_output_dir_part2, exist_ok=True)
+            proxy_info = None
+            if config.get("use_hud_proxy"):
+                # HUD 代理视频: 原视频只解码一次，之后重复分析只读取很小的代理视频
+                video_path_for_analysis, proxy_info = build_hud_proxy(
+                    video_path_for_analysis, os.path.join(video_specific_output_dir_part2, "proxy"),
+                    [(config["NUMBER_ROI_X1"], config["NUMBER_ROI_Y1"], config["NUMBER_ROI_X2"], config["NUMBER_ROI_Y2"]),
+                     (config["BOW_ROI_X1"], config["BOW_ROI_Y1"], config["BOW_ROI_X2"], config["BOW_ROI_Y2"]),
+                     (config["INFINITE_ROI_X1"], config["INFINITE_ROI_Y1"], config["INFINITE_ROI_X2"], config["INFINITE_ROI_Y2"])],
+                    fps=1.0 / config["FINE_SCAN_INTERVAL_SECONDS"])
+            gameplay_segments = None
+            if config.get("skip_non_gameplay"):
+                logic_logger.info(f"{video_id}: 分析游戏画面分段 (低采样率检查 HUD 武器栏)")
+                gameplay_segments = segment_gameplay(
+                    video_path_for_analysis, video_specific_output_dir_part2, os.path.join(ROOT, "pic_template"),
+                    config["BOW_ROI_X1"], config["BOW_ROI_Y1"], config["BOW_ROI_X2"], config["BOW_ROI_Y2"],
+                    proxy_info=proxy_info, decode_backend=config.get("decode_backend", "opencv"))
+            if config.get("hybrid_audio_windows"):
+                # 混合模式: 只解码音频分析给出的候选窗口 (本地视频时间)。先找本视频的输出目录，再找 audio_approach 默认的 clips 目录
+                candidate_windows_file = next(
+                    (p for p in (os.path.join(video_specific_output_dir_part2, "candidate_windows.txt"),
+                                 os.path.join(ROOT, "clips", video_id, "candidate_windows.txt")) if os.path.exists(p)), None)
+                if candidate_windows_file:
+                    logic_logger.info(f"{video_id}: 混合模式，只验证候选窗口 {candidate_windows_file}")
+                    verify_shots_in_windows(
+                        video_path=video_path_for_analysis,
+                        root_pic_template_dir=os.path.join(ROOT, "pic_template"),
+                        selected_weapon_names=selected_weapons_for_analysis,
+                        video_output_dir=video_specific_output_dir_part2,
+                        candidate_windows_file=candidate_windows_file,
+                        weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
+                        number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
+                        number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
+                        mid_split_x=config["NUMBER_MID"],
+                        weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"],
+                        weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"],
+                        fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
+                        proxy_info=proxy_info,
+                        decode_backend=config.get("decode_backend", "opencv")
+                    )
+                    update_event_dataset(output_root_folder, video_id, audio_output_root=os.path.join(ROOT, "clips"))
+                    return
+                logic_logger.warning(f"{video_id}: 未找到 candidate_windows.txt (请先运行 audio_approach)，改为扫描整个视频。")
+            if has_resumable_checkpoint(video_specific_output_dir_part2):
+                logic_logger.info(f"{video_id}: 发现未完成的分析检查点，参数 (START_TIME、ROI、阈值等) 相同时将从中断处继续，否则重新开始。")
+            find_shooting_moments(
+                video_path=video_path_for_analysis,
+                root_pic_template_dir=os.path.join(ROOT, "pic_template"), 
+                selected_weapon_names=selected_weapons_for_analysis, 
+                video_output_dir=video_specific_output_dir_part2,
+                infinite_symbol_template_path=infinite_symbol_template_path, 
+                weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
+                similarity_threshold_infinite=config["SIMILARITY_THRESHOLD_INFINITE"],
+                number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
+                number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
+                mid_split_x=config["NUMBER_MID"],
+                weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"], 
+                weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"], 
+                infinite_roi_x1=config["INFINITE_ROI_X1"], infinite_roi_y1=config["INFINITE_ROI_Y1"], 
+                infinite_roi_x2=config["INFINITE_ROI_X2"], infinite_roi_y2=config["INFINITE_ROI_Y2"], 
+                coarse_interval_seconds=config["COARSE_SCAN_INTERVAL_SECONDS"],
+                fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
+                start_time=config["START_TIME"],
+                proxy_info=proxy_info,
+                resume=True,
+                decode_backend=config.get("decode_backend", "opencv"),
+                keyframe_coarse=config.get("keyframe_coarse", False),
+                max_coarse_interval_seconds=config["MAX_COARSE_INTERVAL_SECONDS"],
+                gameplay_segments=gameplay_segments,
+                cprofile=config.get("profile_analysis", False)
+            )
+            update_event_dataset(output_root_folder, video_id, audio_output_root=os.path.join(ROOT, "clips"))
+
+        pipeline_handled = False
+        if config.get("two_tier_ingest") and os.path.exists(URLPATH):
+            logic_logger.info("两级下载: 先下载并分析低分辨率版本，只下载射击时刻附近的高分辨率片段")
+            for job in read_download_jobs(URLPATH):
+                sections = run_two_tier_ingest(
+                    job["url"], job["video_id"], output_root_folder,
+                    analyze_fn=lambda lowres_path, video_output_dir, video_id=job["video_id"]: analyze_video(video_id, lowres_path),
+                    start_time=job["start"], end_time=job["end"])
+                logic_logger.info(f"{job['video_id']}: 两级下载完成，{len(sections)} 个高分辨率片段在 {os.path.join(output_root_folder, job['video_id'], 'sections')}")
+            pipeline_handled = True
+        elif config.get("pipeline_mode") and os.path.exists(URLPATH):
+            logic_logger.info("流水线模式: 下载、分析、剪辑同时进行，每个视频下载完成后立即分析")
+            pipeline_clip_fn = None
+            if '3' in selected_parts and part3_clip_mode_selected:
+                pipeline_clip_fn = lambda info: clip_weapon_times(
+                    info["parsed_id"], info["path"], os.path.join(output_root_folder, info["parsed_id"]),
+                    selected_weapons_for_analysis, part3_clip_mode_selected,
+                    clip_duration=config["CLIP_DURATION"], merge_threshold_factor=config["MERGE_THRESHOLD_FACTOR"])
+            run_pipeline(
+                read_download_jobs(URLPATH), video_download_base_dir,
+                analyze_fn=lambda info: analyze_video(info["parsed_id"], info["path"]),
+                clip_fn=pipeline_clip_fn,
+                download_workers=config.get("download_workers", 3))
+            pipeline_handled = True
+            self.master.after(0, self.refresh_video_checkboxes)
+
+        if '1' in selected_parts and not pipeline_handled: 
             downloaded_video_files_info = [] 
             if os.path.exists(URLPATH): 
-                with open(URLPATH, 'r', encoding='utf-8') as f: 
-                    for line_num, line in enumerate(f, 1): 
-                        line = line.strip() 
-                        if not line or line.startswith('#'): continue 
-                        try: 
-                            parts = line.split(',') 
-                            video_url = parts[0].strip() 
-                            parsed_video_id = urlparse(video_url).path.split('/')[-1] or f"unknown_video_{line_num}" 
-                            start_time_str, end_time_str = (parts[1].strip(), parts[2].strip()) if len(parts) == 3 else (None, None) 
-                            if start_time_str and end_time_str: 
-                                logic_logger.info(f"准备下载视频片段: {video_url} 从 {start_time_str} 到 {end_time_str}") 
-                                downloaded_file_path = download_twitch(video_url, video_download_base_dir, start_time_str, end_time_str) 
-                            elif len(parts) == 1: 
-                                logic_logger.info(f"准备下载完整视频: {video_url}") 
-                                downloaded_file_path = download_twitch(video_url, video_download_base_dir) 
-                            else: 
-                                logic_logger.warning(f"URL文件行格式错误: {line}，跳过。"); continue 
-                            if downloaded_file_path and os.path.exists(downloaded_file_path): 
-                                actual_filename = os.path.basename(downloaded_file_path) 
-                                downloaded_video_files_info.append({"parsed_id": parsed_video_id, "filename": actual_filename, "path": downloaded_file_path}) 
-                                logic_logger.info(f"视频 {parsed_video_id} (文件: {actual_filename}) 已下载或存在: {downloaded_file_path}") 
-                            else: logic_logger.error(f"视频 {video_url} 未能成功下载或找到。") 
-                        except Exception as e: logic_logger.error(f"处理URL文件行 '{line}' 时出错: {e}") 
+                # 多个下载同时进行，任务状态保存在 downloaded_videos/download_jobs.json，中断后重新运行会续传
+                download_jobs = read_download_jobs(URLPATH)
+                downloaded_video_files_info = run_download_queue(
+                    download_jobs, video_download_base_dir,
+                    max_workers=config.get("download_workers", 3),
+                    on_done=lambda info: self.master.after(0, self.refresh_video_checkboxes))
             else: logic_logger.error(f"错误: video_urls.txt 文件未找到于 {URLPATH}") 
             logic_logger.info("--- Part 1 完成 ---") 
             self.master.after(0, self.refresh_video_checkboxes) 
+        elif pipeline_handled: logic_logger.info("--- Part 1 已在流水线模式中完成 ---")
         else: logic_logger.info("--- 跳过 Part 1: 下载视频 ---") 
         
         def get_filename_for_id(video_id, base_dir): 
@@ -507,7 +631,7 @@ class VideoProcessingGUI:
                     if name_part == video_id and ext_part.lower() in ['.mp4', '.mkv', '.avi', '.mov']: return item 
             return None 
             
-        if '2' in selected_parts: 
+        if '2' in selected_parts and not pipeline_handled: 
             if not selected_video_ids_to_process: logic_logger.warning("Part 2: No videos selected. Skipping Part 2 as it depends on selection.") 
             elif not selected_weapons_for_analysis: logic_logger.warning("Part 2: No weapons selected for analysis. Skipping Part 2.")
             else: 
@@ -521,34 +645,14 @@ class VideoProcessingGUI:
                     if not filename_in_dir: logic_logger.warning(f"Part 2: Video file for ID '{video_id}' not found. Skipping."); continue 
                     video_path_for_analysis = os.path.join(video_download_base_dir, filename_in_dir) 
                     logic_logger.info(f"\n[Part 2] 分析视频文件: {filename_in_dir} (ID: {video_id})") 
-                    video_specific_output_dir_part2 = os.path.join(output_root_folder, video_id) 
-                    os.makedirs(video_specific_output_dir_part2, exist_ok=True) 
-                    
-                    find_shooting_moments(
-                        video_path=video_path_for_analysis,
-                        root_pic_template_dir=os.path.join(ROOT, "pic_template"), 
-                        selected_weapon_names=selected_weapons_for_analysis, 
-                        video_output_dir=video_specific_output_dir_part2,
-                        infinite_symbol_template_path=infinite_symbol_template_path, 
-                        weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
-                        similarity_threshold_infinite=config["SIMILARITY_THRESHOLD_INFINITE"],
-                        number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
-                        number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
-                        mid_split_x=config["NUMBER_MID"],
-                        weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"], 
-                        weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"], 
-                        infinite_roi_x1=config["INFINITE_ROI_X1"], infinite_roi_y1=config["INFINITE_ROI_Y1"], 
-                        infinite_roi_x2=config["INFINITE_ROI_X2"], infinite_roi_y2=config["INFINITE_ROI_Y2"], 
-                        coarse_interval_seconds=config["COARSE_SCAN_INTERVAL_SECONDS"],
-                        fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
-                        start_time=config["START_TIME"]
-                    )
+                    analyze_video(video_id, video_path_for_analysis)
                     processed_videos_in_part2 += 1 
                 if processed_videos_in_part2 == 0 and selected_video_ids_to_process : logic_logger.info(f"Part 2: 没有选定视频被成功分析。") 
             logic_logger.info("--- Part 2 (分析) 完成 ---") 
+        elif pipeline_handled: logic_logger.info("--- Part 2 已在流水线模式中完成 ---")
         else: logic_logger.info("--- 跳过 Part 2: 分析视频 ---") 
         
-        if '3' in selected_parts: 
+        if '3' in selected_parts and not pipeline_handled: 
             if not selected_video_ids_to_process:
                 logic_logger.warning("Part 3: No videos selected. Skipping.")
             elif not selected_weapons_for_analysis:
@@ -612,7 +716,11 @@ class VideoProcessingGUI:
                             final_clips_output_path = os.path.join(video_specific_output_dir_p3_base, clips_subfolder_name)
                             os.makedirs(final_clips_output_path, exist_ok=True)
 
-                        if part3_clip_mode_selected == "individual":
+                        if config.get("clip_dry_run"):
+                            plan_output_folder = final_clips_output_path if part3_clip_mode_selected in ("individual", "merged") else video_specific_output_dir_p3_base
+                            clip_plan_jobs.extend(plan_weapon_clips(part3_clip_mode_selected, video_id, video_path_for_clipping, weapon_time_sources_for_this_video,
+                                                                    plan_output_folder, config["CLIP_DURATION"], config["MERGE_THRESHOLD_FACTOR"]))
+                        elif part3_clip_mode_selected == "individual":
                             generate_clips_from_multiple_weapon_times(
                                 input_video_path=video_path_for_clipping,
                                 weapon_time_sources=weapon_time_sources_for_this_video,
@@ -639,6 +747,8 @@ class VideoProcessingGUI:
                     else:
                         logic_logger.info(f"Part 3: 没有找到有效的武器时间文件为视频 ID '{video_id}' 进行剪辑 (模式: {part3_clip_mode_selected}).")
                 logic_logger.info(f"--- Part 3 (剪辑 - Mode: {part3_clip_mode_selected}) 完成 ---")
+        elif pipeline_handled:
+            logic_logger.info("--- Part 3 已在流水线模式中完成 ---")
         else:
             logic_logger.info("--- 跳过 Part 3: 合并排序武器剪辑 ---")
         
@@ -661,7 +771,10 @@ class VideoProcessingGUI:
                         logic_logger.warning(f"Part 4: infinite_2.txt for {video_id} (Bow) at '{infinite_txt_path_for_clipping}' missing or empty. Skipping.")
                         continue 
                     # Note: clip_video_ffmpeg_with_duration does not take clip_duration from config currently. It reads duration from the txt file.
-                    clip_video_ffmpeg_with_duration(video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4) 
+                    if config.get("clip_dry_run"):
+                        clip_plan_jobs.extend(plan_range_file_clips(video_id, video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4))
+                    else:
+                        clip_video_ffmpeg_with_duration(video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4) 
                     processed_clips_in_part4 +=1 
                 if processed_clips_in_part4 == 0 and selected_video_ids_to_process: logic_logger.info(f"Part 4: 没有选定视频被剪辑 (Bow Infinite)。") 
             logic_logger.info("--- Part 4 (BOW INFINITE剪辑) 完成 ---") 
@@ -706,12 +819,29 @@ class VideoProcessingGUI:
                     if not (os.path.exists(sum_txt_path_for_clipping) and os.path.getsize(sum_txt_path_for_clipping) > 0): 
                         logic_logger.warning(f"Part 6: shooting_bow_sum.txt for {video_id} at '{sum_txt_path_for_clipping}' missing or empty. Skipping.")
                         continue 
-                    clip_video_ffmpeg(video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, clip_duration=config["CLIP_DURATION"], weapon_name="bow_sum") 
+                    if config.get("clip_dry_run"):
+                        clip_plan_jobs.extend(plan_time_file_clips(video_id, video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, config["CLIP_DURATION"]))
+                    else:
+                        clip_video_ffmpeg(video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, clip_duration=config["CLIP_DURATION"], weapon_name="bow_sum") 
                     processed_clips_in_part6 +=1 
                 if processed_clips_in_part6 == 0 and selected_video_ids_to_process: logic_logger.info(f"Part 6: 没有选定视频被剪辑 (Bow Merged)。") 
             logic_logger.info("--- Part 6 (BOW SUM剪辑) 完成 ---") 
         else: logic_logger.info("--- 跳过 Part 6: BOW SUM剪辑 ---") 
         
+        if config.get("clip_dry_run"):
+            if clip_plan_jobs:
+                calibration_path = os.path.join(output_root_folder, CALIBRATION_FILENAME)
+                calibration = load_calibration(calibration_path)
+                if not calibration.get("calibrated"):
+                    logic_logger.info(f"[剪辑计划] 本机还没有校准数据，用 {clip_plan_jobs[0]['source']} 测量剪辑耗时...")
+                    calibration = calibrate_clip_costs(clip_plan_jobs[0]["source"], calibration_path)
+                plan_path = os.path.join(output_root_folder, "clip_plan.json")
+                plan = write_clip_plan(plan_path, clip_plan_jobs, calibration)
+                logic_logger.info(f"[剪辑计划] 已写入 {plan_path}: {format_estimate(plan['estimate'])}")
+                logic_logger.info(f"[剪辑计划] 执行计划: python clip_plan.py \"{plan_path}\" --shard 0/1 --workers 2")
+            else:
+                logic_logger.info("[剪辑计划] 没有需要剪辑的任务，clip_plan.json 未生成。")
+
         logic_logger.info(f"\n脚本运行结束。选择运行的Parts: {sorted(list(selected_parts))}") 
         self.master.after(0, lambda: self.run_button.config(state=tk.NORMAL)) 
 
@@ -11,8 +11,14 @@ import sys # For platform-specific open
 # analysis_functions と general_function, clip_functions は同じディレクトリにあると仮定します
 # また、WEAPON_METADATA はこのスクリプト内で定義されるため、analysis_functions からのインポートは変更されます
 # from analysis_functions import find_shooting_moments, WEAPON_METADATA # Import WEAPON_METADATA
-from analysis_functions import find_shooting_moments, WEAPON_METADATA
+from analysis_functions import find_shooting_moments, has_resumable_checkpoint, verify_shots_in_windows, WEAPON_METADATA
 from general_function import download_twitch, hms_to_seconds, seconds_to_hms #
+from download_functions import read_download_jobs, run_download_queue
+from pipeline_functions import run_pipeline, run_two_tier_ingest, clip_weapon_times
+from proxy_functions import build_hud_proxy
+from gameplay_segments import segment_gameplay
+from event_dataset import update_event_dataset
+from clip_plan import plan_weapon_clips, plan_time_file_clips, plan_range_file_clips, load_calibration, calibrate_clip_costs, write_clip_plan, format_estimate, CALIBRATION_FILENAME
 # Import the new merge function as well
 from clip_functions import clip_video_ffmpeg, generate_clips_from_multiple_weapon_times, clip_video_ffmpeg_merged, clip_video_ffmpeg_with_duration, process_and_merge_times, generate_clips_from_multiple_weapon_times_merge, generate_concatenated_video_from_timestamps #
 
@@ -59,6 +65,7 @@ class VideoProcessingGUI:
             "SIMILARITY_THRESHOLD_INFINITE": tk.StringVar(value="0.74"), #
             "COARSE_SCAN_INTERVAL_SECONDS": tk.StringVar(value="2.8"), #
             "FINE_SCAN_INTERVAL_SECONDS": tk.StringVar(value="0.1"), #
+            "MAX_COARSE_INTERVAL_SECONDS": tk.StringVar(value="0"),
             "CLIP_DURATION": tk.StringVar(value="1.0"), # 新しいパラメータ
             "MERGE_THRESHOLD_FACTOR": tk.StringVar(value="3.0"), # 新しいパラメータ (秒単位に変更)
             "START_TIME": tk.StringVar(value="00:00:00.000"), #
@@ -73,6 +80,15 @@ class VideoProcessingGUI:
         }
         self.part3_enabled = tk.BooleanVar(value=False) #
         self.part3_clip_mode = tk.StringVar(value="individual") #
+        self.pipeline_mode = tk.BooleanVar(value=False)
+        self.use_hud_proxy = tk.BooleanVar(value=False)
+        self.clip_dry_run = tk.BooleanVar(value=False)
+        self.use_pyav_decode = tk.BooleanVar(value=False)
+        self.keyframe_coarse = tk.BooleanVar(value=False)
+        self.skip_non_gameplay = tk.BooleanVar(value=False)
+        self.profile_analysis = tk.BooleanVar(value=False)
+        self.hybrid_audio_windows = tk.BooleanVar(value=False)
+        self.two_tier_ingest = tk.BooleanVar(value=False)
         
         self.video_checkbox_vars = {} #
         self.selected_weapons_vars = { #
@@ -155,7 +171,7 @@ class VideoProcessingGUI:
             [("武器画像ROI (X1 Y1 X2 Y2):", ["BOW_ROI_X1", "BOW_ROI_Y1", "BOW_ROI_X2", "BOW_ROI_Y2"])],
             [("ボウ無限ROI (X1 Y1 X2 Y2):", ["INFINITE_ROI_X1", "INFINITE_ROI_Y1", "INFINITE_ROI_X2", "INFINITE_ROI_Y2"])], #
             [("武器画像しきい値:", ["BOW_SIMILARITY_THRESHOLD"]), ("ボウ無限しきい値:", ["SIMILARITY_THRESHOLD_INFINITE"])],
-            [("粗スキャン(秒):", ["COARSE_SCAN_INTERVAL_SECONDS"]), ("詳細スキャン(秒):", ["FINE_SCAN_INTERVAL_SECONDS"])], #
+            [("粗スキャン(秒):", ["COARSE_SCAN_INTERVAL_SECONDS"]), ("詳細スキャン(秒):", ["FINE_SCAN_INTERVAL_SECONDS"]), ("最大粗スキャン(秒, 0=固定):", ["MAX_COARSE_INTERVAL_SECONDS"])], #
             [("分析開始時間 (HH:MM:SS.mmm):", ["START_TIME"], 3)],
             [("クリップ時間(秒):", ["CLIP_DURATION"]), ("マージしきい値(秒):", ["MERGE_THRESHOLD_FACTOR"])]
         ]
@@ -240,8 +256,18 @@ class VideoProcessingGUI:
             col_task += 1 
             if col_task >= 2: col_task = 0; row_task += 1 
         
+        ttk.Checkbutton(tasks_frame, text="パイプラインモード: ダウンロード完了した動画から順に分析/クリップ (パート1+2[+3])", variable=self.pipeline_mode).grid(row=row_task+1, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="HUDプロキシ動画で分析 (右下HUDのみ・グレースケール・精密スキャンfps、動画ごとに一度だけ生成)", variable=self.use_hud_proxy).grid(row=row_task+2, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="クリップ計画のみ作成 (ドライラン): ffmpeg を実行せず clip_plan.json とコスト見積もりを出力 (パート3/4/6)", variable=self.clip_dry_run).grid(row=row_task+3, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="解析時に PyAV でデコード (マルチスレッド、輝度プレーンのみ使用し BGR 変換なし; pip install av が必要)", variable=self.use_pyav_decode).grid(row=row_task+4, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="粗スキャンはキーフレームのみデコード (PyAV デコード時のみ; キーフレームで抽出し、間隔は粗スキャン間隔以下)", variable=self.keyframe_coarse).grid(row=row_task+5, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="ゲーム画面以外をスキップ (ロビー / 雑談 / リプレイ): 低サンプリングで HUD を事前スキャンし、区間を動画ごとに保存", variable=self.skip_non_gameplay).grid(row=row_task+6, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="Part 2 を cProfile で計測 (各段階の所要時間は常に analysis_profile.json に保存、チェックすると analysis_profile.prof も保存)", variable=self.profile_analysis).grid(row=row_task+7, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="ハイブリッド Part 2: 音声の候補区間 (audio_approach が出力する <id>/candidate_windows.txt) だけを検証し、動画全体はスキャンしない", variable=self.hybrid_audio_windows).grid(row=row_task+8, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+        ttk.Checkbutton(tasks_frame, text="2段階ダウンロード: 低解像度版をダウンロードして分析し、射撃時刻付近の高解像度区間だけをダウンロード (Part 1+2、区間は clips_output/<id>/sections に保存)", variable=self.two_tier_ingest).grid(row=row_task+9, column=0, columnspan=2, sticky=tk.W, padx=5, pady=1)
+
         task_buttons_frame = ttk.Frame(tasks_frame) 
-        task_buttons_frame.grid(row=row_task+1, column=0, columnspan=2, pady=3) 
+        task_buttons_frame.grid(row=row_task+10, column=0, columnspan=2, pady=3) 
         ttk.Button(task_buttons_frame, text="全パート選択", command=self.select_all_parts).pack(side=tk.LEFT, padx=5) 
         ttk.Button(task_buttons_frame, text="全パート選択解除", command=self.deselect_all_parts).pack(side=tk.LEFT, padx=5) 
         
@@ -395,7 +421,7 @@ class VideoProcessingGUI:
                       "INFINITE_ROI_X1", "INFINITE_ROI_Y1", "INFINITE_ROI_X2", "INFINITE_ROI_Y2"]: #
                 config[k_int] = int(self.params[k_int].get()) #
             for k_float in ["BOW_SIMILARITY_THRESHOLD", "SIMILARITY_THRESHOLD_INFINITE", #
-                      "COARSE_SCAN_INTERVAL_SECONDS", "FINE_SCAN_INTERVAL_SECONDS",
+                      "COARSE_SCAN_INTERVAL_SECONDS", "FINE_SCAN_INTERVAL_SECONDS", "MAX_COARSE_INTERVAL_SECONDS",
                       "CLIP_DURATION", "MERGE_THRESHOLD_FACTOR"]: # CLIP_DURATION と MERGE_THRESHOLD_FACTOR を追加
                 config[k_float] = float(self.params[k_float].get()) #
         except ValueError as e: #
@@ -414,11 +440,22 @@ class VideoProcessingGUI:
             messagebox.showwarning("パート未選択", "実行するパートを少なくとも1つ選択してください。") #
             self.run_button.config(state=tk.NORMAL); return #
         config["selected_parts"] = selected_parts_set #
+        config["pipeline_mode"] = self.pipeline_mode.get() and '1' in selected_parts_set and '2' in selected_parts_set
+        config["two_tier_ingest"] = self.two_tier_ingest.get() and '1' in selected_parts_set and '2' in selected_parts_set
+        config["use_hud_proxy"] = self.use_hud_proxy.get()
+        config["clip_dry_run"] = self.clip_dry_run.get()
+        config["decode_backend"] = "pyav" if self.use_pyav_decode.get() else "opencv"
+        config["keyframe_coarse"] = self.keyframe_coarse.get()
+        config["skip_non_gameplay"] = self.skip_non_gameplay.get()
+        config["profile_analysis"] = self.profile_analysis.get()
+        config["hybrid_audio_windows"] = self.hybrid_audio_windows.get()
         
         config["selected_video_ids_for_processing"] = [ #
             video_id for video_id, var in self.video_checkbox_vars.items() if var.get() #
         ]
-        if any(p in selected_parts_set for p in ['2', '3', '4', '5', '6']): #
+        # パイプラインモードではパート2/3はダウンロードした動画を処理するため、リストでの選択は不要
+        parts_needing_video_selection = ['4', '5', '6'] if config["pipeline_mode"] or config["two_tier_ingest"] else ['2', '3', '4', '5', '6']
+        if any(p in selected_parts_set for p in parts_needing_video_selection): #
             if not config["selected_video_ids_for_processing"] and self.video_checkbox_vars: # チェックボックスが存在するが何も選択されていない場合
                 messagebox.showwarning("動画未選択", "パート2-6用にリストから動画を選択するか、リストが更新されていることを確認してください。") #
                 self.run_button.config(state=tk.NORMAL); return #
@@ -466,6 +503,7 @@ class VideoProcessingGUI:
         selected_video_ids_to_process = config.get("selected_video_ids_for_processing", []) #
         selected_weapons_for_analysis = config.get("selected_weapons_for_analysis", []) #
         part3_clip_mode_selected = config.get("part3_mode") #
+        clip_plan_jobs = [] # ドライラン時のパート3/4/6のクリップタスク
         
         logic_logger.info(f"ユーザー選択パート: {sorted(list(selected_parts))}") #
         if '3' in selected_parts:
@@ -475,35 +513,121 @@ class VideoProcessingGUI:
         if selected_video_ids_to_process and any(p in selected_parts for p in ['2','3','4','5','6']): 
             logic_logger.info(f"ユーザー選択 処理用動画ID (パート2-6): {selected_video_ids_to_process}") 
         
-        if '1' in selected_parts: 
+        # 1本の動画のパート2分析。パート2のループとパイプラインモードで共用
+        def analyze_video(video_id, video_path_for_analysis):
+            video_specific_output_dir_part2 = os.path.join(output_root_folder, video_id)
+            os.makedirs(video_specific_output_dir_part2, exist_ok=True)
+            proxy_info = None
+            if config.get("use_hud_proxy"):
+                # HUD 代理视频: 原视频只解码一次，之后重复分析只读取很小的代理视频
+                video_path_for_analysis, proxy_info = build_hud_proxy(
+                    video_path_for_analysis, os.path.join(video_specific_output_dir_part2, "proxy"),
+                    [(config["NUMBER_ROI_X1"], config["NUMBER_ROI_Y1"], config["NUMBER_ROI_X2"], config["NUMBER_ROI_Y2"]),
+                     (config["BOW_ROI_X1"], config["BOW_ROI_Y1"], config["BOW_ROI_X2"], config["BOW_ROI_Y2"]),
+                     (config["INFINITE_ROI_X1"], config["INFINITE_ROI_Y1"], config["INFINITE_ROI_X2"], config["INFINITE_ROI_Y2"])],
+                    fps=1.0 / config["FINE_SCAN_INTERVAL_SECONDS"])
+            gameplay_segments = None
+            if config.get("skip_non_gameplay"):
+                logic_logger.info(f"{video_id}: ゲーム画面区間を解析中 (低サンプリングで HUD 武器欄を確認)")
+                gameplay_segments = segment_gameplay(
+                    video_path_for_analysis, video_specific_output_dir_part2, os.path.join(ROOT, "pic_template"),
+                    config["BOW_ROI_X1"], config["BOW_ROI_Y1"], config["BOW_ROI_X2"], config["BOW_ROI_Y2"],
+                    proxy_info=proxy_info, decode_backend=config.get("decode_backend", "opencv"))
+            if config.get("hybrid_audio_windows"):
+                # ハイブリッドモード: 音声解析の候補区間 (ローカル動画の時間) だけをデコード。まず動画の出力フォルダ、次に audio_approach 既定の clips フォルダを探す
+                candidate_windows_file = next(
+                    (p for p in (os.path.join(video_specific_output_dir_part2, "candidate_windows.txt"),
+                                 os.path.join(ROOT, "clips", video_id, "candidate_windows.txt")) if os.path.exists(p)), None)
+                if candidate_windows_file:
+                    logic_logger.info(f"{video_id}: ハイブリッドモード、候補区間のみ検証 {candidate_windows_file}")
+                    verify_shots_in_windows(
+                        video_path=video_path_for_analysis,
+                        root_pic_template_dir=os.path.join(ROOT, "pic_template"),
+                        selected_weapon_names=selected_weapons_for_analysis,
+                        video_output_dir=video_specific_output_dir_part2,
+                        candidate_windows_file=candidate_windows_file,
+                        weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
+                        number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
+                        number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
+                        mid_split_x=config["NUMBER_MID"],
+                        weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"],
+                        weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"],
+                        fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
+                        proxy_info=proxy_info,
+                        decode_backend=config.get("decode_backend", "opencv")
+                    )
+                    update_event_dataset(output_root_folder, video_id, audio_output_root=os.path.join(ROOT, "clips"))
+                    return
+                logic_logger.warning(f"{video_id}: candidate_windows.txt が見つかりません (先に audio_approach を実行してください)。動画全体をスキャンします。")
+            if has_resumable_checkpoint(video_specific_output_dir_part2):
+                logic_logger.info(f"{video_id}: 未完了の分析チェックポイントが見つかりました。パラメータ (START_TIME・ROI・しきい値など) が同じ場合は中断した位置から再開し、異なる場合は最初からやり直します。")
+            find_shooting_moments(
+                video_path=video_path_for_analysis,
+                root_pic_template_dir=os.path.join(ROOT, "pic_template"), 
+                selected_weapon_names=selected_weapons_for_analysis, 
+                video_output_dir=video_specific_output_dir_part2,
+                infinite_symbol_template_path=infinite_symbol_template_path, 
+                weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
+                similarity_threshold_infinite=config["SIMILARITY_THRESHOLD_INFINITE"],
+                number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
+                number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
+                mid_split_x=config["NUMBER_MID"],
+                weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"], 
+                weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"], 
+                infinite_roi_x1=config["INFINITE_ROI_X1"], infinite_roi_y1=config["INFINITE_ROI_Y1"], 
+                infinite_roi_x2=config["INFINITE_ROI_X2"], infinite_roi_y2=config["INFINITE_ROI_Y2"], 
+                coarse_interval_seconds=config["COARSE_SCAN_INTERVAL_SECONDS"],
+                fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
+                start_time=config["START_TIME"],
+                proxy_info=proxy_info,
+                resume=True,
+                decode_backend=config.get("decode_backend", "opencv"),
+                keyframe_coarse=config.get("keyframe_coarse", False),
+                max_coarse_interval_seconds=config["MAX_COARSE_INTERVAL_SECONDS"],
+                gameplay_segments=gameplay_segments,
+                cprofile=config.get("profile_analysis", False)
+            )
+            update_event_dataset(output_root_folder, video_id, audio_output_root=os.path.join(ROOT, "clips"))
+
+        pipeline_handled = False
+        if config.get("two_tier_ingest") and os.path.exists(URLPATH):
+            logic_logger.info("2段階ダウンロード: 低解像度版をダウンロード・分析し、射撃時刻付近の高解像度区間だけをダウンロードします")
+            for job in read_download_jobs(URLPATH):
+                sections = run_two_tier_ingest(
+                    job["url"], job["video_id"], output_root_folder,
+                    analyze_fn=lambda lowres_path, video_output_dir, video_id=job["video_id"]: analyze_video(video_id, lowres_path),
+                    start_time=job["start"], end_time=job["end"])
+                logic_logger.info(f"{job['video_id']}: 2段階ダウンロード完了、高解像度区間 {len(sections)} 個を {os.path.join(output_root_folder, job['video_id'], 'sections')} に保存")
+            pipeline_handled = True
+        elif config.get("pipeline_mode") and os.path.exists(URLPATH):
+            logic_logger.info("パイプラインモード: ダウンロード・分析・クリップを並行実行し、ダウンロード完了した動画から分析します")
+            pipeline_clip_fn = None
+            if '3' in selected_parts and part3_clip_mode_selected:
+                pipeline_clip_fn = lambda info: clip_weapon_times(
+                    info["parsed_id"], info["path"], os.path.join(output_root_folder, info["parsed_id"]),
+                    selected_weapons_for_analysis, part3_clip_mode_selected,
+                    clip_duration=config["CLIP_DURATION"], merge_threshold_factor=config["MERGE_THRESHOLD_FACTOR"])
+            run_pipeline(
+                read_download_jobs(URLPATH), video_download_base_dir,
+                analyze_fn=lambda info: analyze_video(info["parsed_id"], info["path"]),
+                clip_fn=pipeline_clip_fn,
+                download_workers=config.get("download_workers", 3))
+            pipeline_handled = True
+            self.master.after(0, self.refresh_video_checkboxes)
+
+        if '1' in selected_parts and not pipeline_handled: 
             downloaded_video_files_info = [] 
             if os.path.exists(URLPATH): 
-                with open(URLPATH, 'r', encoding='utf-8') as f: 
-                    for line_num, line in enumerate(f, 1): 
-                        line = line.strip() 
-                        if not line or line.startswith('#'): continue 
-                        try: 
-                            parts = line.split(',') 
-                            video_url = parts[0].strip() 
-                            parsed_video_id = urlparse(video_url).path.split('/')[-1] or f"unknown_video_{line_num}" 
-                            start_time_str, end_time_str = (parts[1].strip(), parts[2].strip()) if len(parts) == 3 else (None, None) 
-                            if start_time_str and end_time_str: 
-                                logic_logger.info(f"ビデオクリップをダウンロード準備中: {video_url} {start_time_str} から {end_time_str} まで") 
-                                downloaded_file_path = download_twitch(video_url, video_download_base_dir, start_time_str, end_time_str) 
-                            elif len(parts) == 1: 
-                                logic_logger.info(f"フルビデオをダウンロード準備中: {video_url}") 
-                                downloaded_file_path = download_twitch(video_url, video_download_base_dir) 
-                            else: 
-                                logic_logger.warning(f"URLファイル行のフォーマットエラー: {line}、スキップします。"); continue 
-                            if downloaded_file_path and os.path.exists(downloaded_file_path): 
-                                actual_filename = os.path.basename(downloaded_file_path) 
-                                downloaded_video_files_info.append({"parsed_id": parsed_video_id, "filename": actual_filename, "path": downloaded_file_path}) 
-                                logic_logger.info(f"ビデオ {parsed_video_id} (ファイル: {actual_filename}) はダウンロード済みか存在します: {downloaded_file_path}") 
-                            else: logic_logger.error(f"ビデオ {video_url} のダウンロードまたは検索に失敗しました。") 
-                        except Exception as e: logic_logger.error(f"URLファイル行 '{line}' の処理中にエラーが発生しました: {e}") 
+                # 複数のダウンロードを同時に実行。状態は downloaded_videos/download_jobs.json に保存され、中断後の再実行で再開します
+                download_jobs = read_download_jobs(URLPATH)
+                downloaded_video_files_info = run_download_queue(
+                    download_jobs, video_download_base_dir,
+                    max_workers=config.get("download_workers", 3),
+                    on_done=lambda info: self.master.after(0, self.refresh_video_checkboxes))
             else: logic_logger.error(f"エラー: video_urls.txt ファイルが {URLPATH} に見つかりません") 
             logic_logger.info("--- パート1 完了 ---") 
             self.master.after(0, self.refresh_video_checkboxes) 
+        elif pipeline_handled: logic_logger.info("--- パート1 パイプラインモードで完了 ---")
         else: logic_logger.info("--- パート1 スキップ: 動画ダウンロード ---") 
         
         def get_filename_for_id(video_id, base_dir): 
@@ -514,7 +638,7 @@ class VideoProcessingGUI:
                     if name_part == video_id and ext_part.lower() in ['.mp4', '.mkv', '.avi', '.mov']: return item 
             return None 
             
-        if '2' in selected_parts: 
+        if '2' in selected_parts and not pipeline_handled: 
             if not selected_video_ids_to_process: logic_logger.warning("パート2: 動画が選択されていません。選択に依存するためパート2をスキップします。") 
             elif not selected_weapons_for_analysis: logic_logger.warning("パート2: 分析用の武器が選択されていません。パート2をスキップします。")
             else: 
@@ -528,34 +652,14 @@ class VideoProcessingGUI:
                     if not filename_in_dir: logic_logger.warning(f"パート2: ID '{video_id}' の動画ファイルが見つかりません。スキップします。"); continue 
                     video_path_for_analysis = os.path.join(video_download_base_dir, filename_in_dir) 
                     logic_logger.info(f"\n[パート2] 動画ファイル分析: {filename_in_dir} (ID: {video_id})") 
-                    video_specific_output_dir_part2 = os.path.join(output_root_folder, video_id) 
-                    os.makedirs(video_specific_output_dir_part2, exist_ok=True) 
-                    
-                    find_shooting_moments(
-                        video_path=video_path_for_analysis,
-                        root_pic_template_dir=os.path.join(ROOT, "pic_template"), 
-                        selected_weapon_names=selected_weapons_for_analysis, 
-                        video_output_dir=video_specific_output_dir_part2,
-                        infinite_symbol_template_path=infinite_symbol_template_path, 
-                        weapon_activation_similarity_threshold=config["BOW_SIMILARITY_THRESHOLD"],
-                        similarity_threshold_infinite=config["SIMILARITY_THRESHOLD_INFINITE"],
-                        number_roi_x1=config["NUMBER_ROI_X1"], number_roi_y1=config["NUMBER_ROI_Y1"],
-                        number_roi_x2=config["NUMBER_ROI_X2"], number_roi_y2=config["NUMBER_ROI_Y2"],
-                        mid_split_x=config["NUMBER_MID"],
-                        weapon_roi_x1=config["BOW_ROI_X1"], weapon_roi_y1=config["BOW_ROI_Y1"], 
-                        weapon_roi_x2=config["BOW_ROI_X2"], weapon_roi_y2=config["BOW_ROI_Y2"], 
-                        infinite_roi_x1=config["INFINITE_ROI_X1"], infinite_roi_y1=config["INFINITE_ROI_Y1"], 
-                        infinite_roi_x2=config["INFINITE_ROI_X2"], infinite_roi_y2=config["INFINITE_ROI_Y2"], 
-                        coarse_interval_seconds=config["COARSE_SCAN_INTERVAL_SECONDS"],
-                        fine_interval_seconds=config["FINE_SCAN_INTERVAL_SECONDS"],
-                        start_time=config["START_TIME"]
-                    )
+                    analyze_video(video_id, video_path_for_analysis)
                     processed_videos_in_part2 += 1 
                 if processed_videos_in_part2 == 0 and selected_video_ids_to_process : logic_logger.info(f"パート2: 選択された動画は正常に分析されませんでした。") 
             logic_logger.info("--- パート2 (分析) 完了 ---") 
+        elif pipeline_handled: logic_logger.info("--- パート2 パイプラインモードで完了 ---")
         else: logic_logger.info("--- パート2 スキップ: 動画分析 ---") 
         
-        if '3' in selected_parts: 
+        if '3' in selected_parts and not pipeline_handled: 
             if not selected_video_ids_to_process:
                 logic_logger.warning("パート3: 動画が選択されていません。スキップします。")
             elif not selected_weapons_for_analysis:
@@ -619,7 +723,11 @@ class VideoProcessingGUI:
                             final_clips_output_path = os.path.join(video_specific_output_dir_p3_base, clips_subfolder_name)
                             os.makedirs(final_clips_output_path, exist_ok=True)
 
-                        if part3_clip_mode_selected == "individual":
+                        if config.get("clip_dry_run"):
+                            plan_output_folder = final_clips_output_path if part3_clip_mode_selected in ("individual", "merged") else video_specific_output_dir_p3_base
+                            clip_plan_jobs.extend(plan_weapon_clips(part3_clip_mode_selected, video_id, video_path_for_clipping, weapon_time_sources_for_this_video,
+                                                                    plan_output_folder, config["CLIP_DURATION"], config["MERGE_THRESHOLD_FACTOR"]))
+                        elif part3_clip_mode_selected == "individual":
                             generate_clips_from_multiple_weapon_times(
                                 input_video_path=video_path_for_clipping,
                                 weapon_time_sources=weapon_time_sources_for_this_video,
@@ -646,6 +754,8 @@ class VideoProcessingGUI:
                     else:
                         logic_logger.info(f"パート3: 動画ID '{video_id}' のクリップ用の有効な武器時間ファイルが見つかりませんでした (モード: {part3_clip_mode_selected})。")
                 logic_logger.info(f"--- パート3 (クリップ - モード: {part3_clip_mode_selected}) 完了 ---")
+        elif pipeline_handled:
+            logic_logger.info("--- パート3 パイプラインモードで完了 ---")
         else:
             logic_logger.info("--- パート3 スキップ: 武器クリップのマージソート ---")
         
@@ -668,7 +778,10 @@ class VideoProcessingGUI:
                         logic_logger.warning(f"パート4: {video_id} (ボウ) の infinite_2.txt が '{infinite_txt_path_for_clipping}' に見つからないか空です。スキップします。")
                         continue 
                     # 注意: clip_video_ffmpeg_with_duration は現在configからclip_durationを取得しません。txtファイルからdurationを読み取ります。
-                    clip_video_ffmpeg_with_duration(video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4) 
+                    if config.get("clip_dry_run"):
+                        clip_plan_jobs.extend(plan_range_file_clips(video_id, video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4))
+                    else:
+                        clip_video_ffmpeg_with_duration(video_path_for_clipping, infinite_txt_path_for_clipping, video_specific_output_dir_p4) 
                     processed_clips_in_part4 +=1 
                 if processed_clips_in_part4 == 0 and selected_video_ids_to_process: logic_logger.info(f"パート4: 選択された動画はクリップされませんでした (ボウ無限)。") 
             logic_logger.info("--- パート4 (ボウ無限クリップ) 完了 ---") 
@@ -713,12 +826,29 @@ class VideoProcessingGUI:
                     if not (os.path.exists(sum_txt_path_for_clipping) and os.path.getsize(sum_txt_path_for_clipping) > 0): 
                         logic_logger.warning(f"パート6: {video_id} の shooting_bow_sum.txt が '{sum_txt_path_for_clipping}' に見つからないか空です。スキップします。")
                         continue 
-                    clip_video_ffmpeg(video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, clip_duration=config["CLIP_DURATION"], weapon_name="bow_sum") 
+                    if config.get("clip_dry_run"):
+                        clip_plan_jobs.extend(plan_time_file_clips(video_id, video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, config["CLIP_DURATION"]))
+                    else:
+                        clip_video_ffmpeg(video_path_for_clipping, sum_txt_path_for_clipping, video_specific_output_dir_p6, clip_duration=config["CLIP_DURATION"], weapon_name="bow_sum") 
                     processed_clips_in_part6 +=1 
                 if processed_clips_in_part6 == 0 and selected_video_ids_to_process: logic_logger.info(f"パート6: 選択された動画はクリップされませんでした (ボウマージ)。") 
             logic_logger.info("--- パート6 (ボウSUMクリップ) 完了 ---") 
         else: logic_logger.info("--- パート6 スキップ: ボウSUMクリップ ---") 
         
+        if config.get("clip_dry_run"):
+            if clip_plan_jobs:
+                calibration_path = os.path.join(output_root_folder, CALIBRATION_FILENAME)
+                calibration = load_calibration(calibration_path)
+                if not calibration.get("calibrated"):
+                    logic_logger.info(f"[クリップ計画] このマシンの校正データがないため、{clip_plan_jobs[0]['source']} でクリップ処理時間を測定します...")
+                    calibration = calibrate_clip_costs(clip_plan_jobs[0]["source"], calibration_path)
+                plan_path = os.path.join(output_root_folder, "clip_plan.json")
+                plan = write_clip_plan(plan_path, clip_plan_jobs, calibration)
+                logic_logger.info(f"[クリップ計画] {plan_path} に書き出しました: {format_estimate(plan['estimate'])}")
+                logic_logger.info(f"[クリップ計画] 実行方法: python clip_plan.py \"{plan_path}\" --shard 0/1 --workers 2")
+            else:
+                logic_logger.info("[クリップ計画] クリップするタスクがないため、clip_plan.json は作成されません。")
+
         logic_logger.info(f"\nスクリプトの実行が終了しました。選択された実行パート: {sorted(list(selected_parts))}") 
         self.master.after(0, lambda: self.run_button.config(state=tk.NORMAL)) 
 
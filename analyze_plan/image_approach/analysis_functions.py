@@ -1,10 +1,18 @@
 import os
+import json
+import time
+import bisect
 import logging
+import functools
 import cv2
 import numpy as np
 from general_function import (
-    seconds_to_hms,hms_to_seconds,
+    seconds_to_hms,hms_to_seconds,read_time_windows,
 )
+from event_store import EventStore
+from frame_sources import open_frame_source, ProfiledCapture
+from coarse_schedule import AdaptiveCoarseSchedule
+from stage_profiler import StageProfiler
 
 logger = logging.getLogger(__name__)
 
@@ -42,29 +50,138 @@ WEAPON_METADATA = {
     "r99": {"suffix": "r99", "has_infinite": False, "display_name": "R-99 SMG", "scan_logic_type": "rapid_fire", "display_name_ch": "R-99 冲锋枪", "display_name_jp": "R-99 SMG"},
 }
 
-def compare_score_iou(frame_gray_processed, template_image_path, debug=False):
-    try:
-        template_original = cv2.imread(template_image_path, cv2.IMREAD_UNCHANGED)
-        if template_original is None:
-            logger.error(f"[图片比较_IOU] 无法加载模板图片: {template_image_path}")
-            return 0.0 # Return a score instead of False
+# find_shooting_moments 的检查点文件 (video_output_dir 中)，分析完整结束后删除
+CHECKPOINT_FILENAME = "analysis_checkpoint.json"
+PROFILE_FILENAME = "analysis_profile.json"
+
+# 所有 ROI 坐标和 pic_template 中的模板都是在这个分辨率下截取的
+REFERENCE_RESOLUTION = (1920, 1080)
+
+# 二值化模板缓存 (模板路径, 缩放比例, 目标尺寸) -> 二值图，同一进程中每个模板每个尺寸只读取和缩放一次。
+# 有上限 (LRU)，GUI 中连续分析不同分辨率的视频时旧尺寸的模板会被淘汰
+TEMPLATE_CACHE_SIZE = 512
+
+
+def normalize_roi(roi, reference_resolution=REFERENCE_RESOLUTION):
+    """把参考分辨率 (1920x1080) 下的像素 ROI (x1, y1, x2, y2) 转换为 0~1 的归一化坐标。"""
+    ref_w, ref_h = reference_resolution
+    x1, y1, x2, y2 = roi
+    return (x1 / ref_w, y1 / ref_h, x2 / ref_w, y2 / ref_h)
+
+
+def roi_to_pixels(roi, frame_width, frame_height, normalized=False, reference_resolution=REFERENCE_RESOLUTION):
+    """
+    把 ROI 转换为当前视频分辨率下的像素坐标。
+    normalized 为 True 时 roi 是 0~1 的归一化坐标 (normalize_roi)，否则是参考分辨率下的像素坐标并按比例缩放。
+    """
+    x1, y1, x2, y2 = roi
+    if normalized:
+        sx, sy = frame_width, frame_height
+    else:
+        sx, sy = frame_width / reference_resolution[0], frame_height / reference_resolution[1]
+    return (int(round(x1 * sx)), int(round(y1 * sy)), int(round(x2 * sx)), int(round(y2 * sy)))
+
+
+def _analysis_scale(cap, proxy_info=None, reference_resolution=REFERENCE_RESOLUTION):
+    # 根据视频分辨率得到 (宽, 高, 模板缩放比例)；与参考分辨率相同或无法读取时缩放比例为 None (不缩放)
+    # HUD 代理视频只有裁剪后的区域，分辨率取原视频的 (proxy_info)
+    if proxy_info:
+        frame_width, frame_height = proxy_info["source_width"], proxy_info["source_height"]
+    else:
+        frame_width = cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0
+        frame_height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0
+    if frame_width <= 0 or frame_height <= 0:
+        logger.warning(f"无法读取视频分辨率，按参考分辨率 {reference_resolution[0]}x{reference_resolution[1]} 处理。")
+        return reference_resolution[0], reference_resolution[1], None
+    if (int(frame_width), int(frame_height)) == tuple(reference_resolution):
+        return int(frame_width), int(frame_height), None
+    template_scale = (round(frame_width / reference_resolution[0], 6), round(frame_height / reference_resolution[1], 6))
+    logger.info(f"视频分辨率 {int(frame_width)}x{int(frame_height)}，ROI 和模板按 {template_scale[0]:.3f}x{template_scale[1]:.3f} 缩放。")
+    return int(frame_width), int(frame_height), template_scale
+
+
+def _resolve_rois(frame_width, frame_height, number_roi, mid_split_x, other_rois, proxy_info=None, roi_normalized=False):
+    # ROI 换算到视频像素坐标；HUD 代理视频再减去裁剪起点。返回 (数字ROI, 分割x, [其他ROI...])
+    # roi_normalized: 所有 ROI 和 mid_split_x 都是 0~1 的归一化坐标
+    offset_x, offset_y = (proxy_info["crop_x"], proxy_info["crop_y"]) if proxy_info else (0, 0)
+
+    def to_frame(roi):
+        x1, y1, x2, y2 = roi_to_pixels(roi, frame_width, frame_height, roi_normalized)
+        return (x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y)
+
+    mid_split_px = int(round(mid_split_x * (frame_width if roi_normalized else frame_width / REFERENCE_RESOLUTION[0]))) - offset_x
+    return to_frame(number_roi), mid_split_px, [to_frame(roi) for roi in other_rois]
+
+
+def _to_gray(roi):
+    # PyAV 亮度平面 (decode_backend="pyav") 和 HUD 代理视频等灰度帧已经是二维数组，不需要颜色转换
+    if roi.ndim == 2:
+        return roi
+    return cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _load_template_binary(template_image_path, template_scale=None, target_size=None):
+    if target_size is not None:
+        # 由于 ROI 坐标取整，缩放后的模板可能与 ROI 相差 1 像素，再对齐到 ROI 尺寸
+        base = _load_template_binary(template_image_path, template_scale)
+        if base is None:
+            return None
+        return cv2.resize(base, target_size, interpolation=cv2.INTER_NEAREST)
+
+    template_original = cv2.imread(template_image_path, cv2.IMREAD_UNCHANGED)
+    if template_original is None:
+        logger.error(f"[图片比较_IOU] 无法加载模板图片: {template_image_path}")
+        return None
+
+    if len(template_original.shape) == 3 and template_original.shape[2] == 4: # BGRA
+        template_gray = cv2.cvtColor(template_original[:,:,:3], cv2.COLOR_BGR2GRAY)
+    elif len(template_original.shape) == 3: # BGR
+        template_gray = cv2.cvtColor(template_original, cv2.COLOR_BGR2GRAY)
+    else: # Grayscale
+        template_gray = template_original
+
+    if template_scale is not None:
+        # 先缩放灰度图再二值化，边缘比直接缩放二值图更接近低分辨率视频中的 Otsu 结果
+        th, tw = template_gray.shape[:2]
+        scaled_size = (max(1, int(round(tw * template_scale[0]))), max(1, int(round(th * template_scale[1]))))
+        template_gray = cv2.resize(template_gray, scaled_size, interpolation=cv2.INTER_AREA)
+
+    _, template_binary = cv2.threshold(template_gray, 127, 255, cv2.THRESH_BINARY)
+    return template_binary
 
-        if len(template_original.shape) == 3 and template_original.shape[2] == 4: # BGRA
-            template_gray = cv2.cvtColor(template_original[:,:,:3], cv2.COLOR_BGR2GRAY)
-        elif len(template_original.shape) == 3: # BGR
-            template_gray = cv2.cvtColor(template_original, cv2.COLOR_BGR2GRAY)
-        else: # Grayscale
-            template_gray = template_original
 
-        _, template_binary = cv2.threshold(template_gray, 127, 255, cv2.THRESH_BINARY)
+def build_template_pyramid(root_pic_template_dir, template_scale=None):
+    """预先读取 root_pic_template_dir 下 (含 left/right 子目录) 的所有模板，生成 template_scale 对应的一层并缓存。"""
+    # 每个视频开始分析时调用: 清空之前的视频留下的缓存，两次分析之间修改或补充的模板图片也会重新读取
+    _load_template_binary.cache_clear()
+    count = 0
+    for dirpath, _, filenames in os.walk(root_pic_template_dir):
+        for filename in filenames:
+            if filename.lower().endswith('.png'):
+                if _load_template_binary(os.path.join(dirpath, filename), template_scale) is not None:
+                    count += 1
+    logger.info(f"模板缓存: {count} 个模板 (缩放比例: {template_scale if template_scale else '原始尺寸'})")
+    return count
+
+
+def compare_score_iou(frame_gray_processed, template_image_path, debug=False, template_scale=None):
+    # template_scale: (x比例, y比例)，低分辨率视频时模板按此比例缩放；None 表示使用原始模板
+    try:
+        template_binary = _load_template_binary(template_image_path, template_scale)
+        if template_binary is None:
+            return 0.0 # Return a score instead of False
         roi_binary = frame_gray_processed 
 
         th, tw = template_binary.shape[:2]
         fh, fw = roi_binary.shape[:2]
 
         if fh != th or fw != tw:
-            logger.debug(f"[图片比较_IOU] 尺寸不匹配: Frame ROI ({fh}x{fw}) vs Template ({th}x{tw}) for {os.path.basename(template_image_path)}. 返回0分.")
-            return 0.0
+            if template_scale is not None and abs(fh - th) <= 1 and abs(fw - tw) <= 1:
+                template_binary = _load_template_binary(template_image_path, template_scale, (fw, fh))
+            else:
+                logger.debug(f"[图片比较_IOU] 尺寸不匹配: Frame ROI ({fh}x{fw}) vs Template ({th}x{tw}) for {os.path.basename(template_image_path)}. 返回0分.")
+                return 0.0
 
 
         intersection = cv2.bitwise_and(roi_binary, template_binary)
@@ -93,7 +210,8 @@ def compare_score_iou(frame_gray_processed, template_image_path, debug=False):
 def check_roi_against_template(frame, template_path,
     roi_x1, roi_y1, roi_x2, roi_y2,
     threshold = 0.7, # Note: variable name is 'threashold' in original, kept for consistency if it's a typo there
-    debug_image_prefix = None
+    debug_image_prefix = None,
+    template_scale = None,
 ):
     try:
         fh, fw = frame.shape[:2]
@@ -106,7 +224,7 @@ def check_roi_against_template(frame, template_path,
             logger.error("[ROI检查] 提取的ROI为空")
             return False
 
-        gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        gray_roi = _to_gray(roi)
         _, preprocessed_roi_otsu = cv2.threshold(gray_roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
         if debug_image_prefix: # 保存调试图像的逻辑保持不变
@@ -119,7 +237,7 @@ def check_roi_against_template(frame, template_path,
             except Exception as e:
                 logger.error(f"[ROI检查] 无法保存某些基础调试图像: {e}")
 
-        score = compare_score_iou(preprocessed_roi_otsu, template_path) # Use the IOU score function
+        score = compare_score_iou(preprocessed_roi_otsu, template_path, template_scale=template_scale) # Use the IOU score function
         if score > threshold: # Compare with the passed threshold
             # logger.info(f"[DEBUG ROI检查] score {score} > threshold {threshold} 匹配模板 {os.path.basename(template_path)}")
             return True
@@ -140,6 +258,7 @@ def read_number_single(
     lorr, # lorr means left or right digit
     root_pic_template_dir, # Added: base path for number templates "E:\\mande\\0_PLAN\\pic_template"
     debug_image_prefix=None,
+    template_scale=None,
 ):
     try:
         fh, fw = frame.shape[:2]
@@ -151,7 +270,7 @@ def read_number_single(
         if roi.size == 0:
             logger.error("[提取数字] 提取的ROI为空")
             return None
-        gray_roi = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        gray_roi = _to_gray(roi)
         _, preprocessed_roi_otsu = cv2.threshold(gray_roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
         if debug_image_prefix: # 保存调试图像的逻辑保持不变
@@ -183,7 +302,7 @@ def read_number_single(
         for filename in sorted(os.listdir(template_dir)): 
             if filename.lower().endswith(valid_extensions):
                 template_path = os.path.join(template_dir, filename)
-                curscore = compare_score_iou(preprocessed_roi_otsu, template_path) # Use IOU score
+                curscore = compare_score_iou(preprocessed_roi_otsu, template_path, template_scale=template_scale) # Use IOU score
                 if curscore > tmpscore:
                     tmpscore = curscore
                     digit_name = os.path.splitext(filename)[0][0] 
@@ -202,18 +321,18 @@ def read_number_single(
 
 def read_number_two(frame, full_roi_x1, full_roi_y1, full_roi_x2, full_roi_y2, mid_split_x,
                     root_pic_template_dir, # Added
-                    debug_image_prefix_base=None):
+                    debug_image_prefix_base=None, template_scale=None):
     left_debug_prefix = f"{debug_image_prefix_base}_left_digit" if debug_image_prefix_base else None
     right_debug_prefix = f"{debug_image_prefix_base}_right_digit" if debug_image_prefix_base else None
 
     digit1 = read_number_single(frame,full_roi_x1, full_roi_y1,
                                            mid_split_x, full_roi_y2,'left',
                                            root_pic_template_dir, # Pass through
-                                           debug_image_prefix=left_debug_prefix)
+                                           debug_image_prefix=left_debug_prefix, template_scale=template_scale)
     digit2 = read_number_single(frame,mid_split_x, full_roi_y1,
                                            full_roi_x2, full_roi_y2,'right',
                                            root_pic_template_dir, # Pass through
-                                           debug_image_prefix=right_debug_prefix)
+                                           debug_image_prefix=right_debug_prefix, template_scale=template_scale)
     if digit1 is not None and digit2 is not None:
         combined_number_str = f"{digit1}{digit2}"
         try:
@@ -238,7 +357,23 @@ def find_shooting_moments(video_path,
                           weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2,
                           infinite_roi_x1, infinite_roi_y1, infinite_roi_x2, infinite_roi_y2,
                           coarse_interval_seconds=3.0,
-                          fine_interval_seconds=0.1, start_time="00:00:00.000"):
+                          fine_interval_seconds=0.1, start_time="00:00:00.000",
+                          frame_source=None, proxy_info=None, resume=False, decode_backend="opencv",
+                          keyframe_coarse=False, max_coarse_interval_seconds=None, gameplay_segments=None,
+                          cprofile=False, roi_normalized=False):
+    # frame_source: 可选，与 cv2.VideoCapture 接口相同的帧来源 (例如 frame_sources.LiveSegmentCapture，边下载边分析)。
+    # 为 None 时用 decode_backend ("opencv" 或 "pyav"，见 frame_sources.open_frame_source) 打开 video_path。
+    # "pyav" 时直接分析解码器输出的亮度平面 (Y)，整帧的 YUV->BGR 转换和每个 ROI 的 cvtColor 都不再需要。
+    # proxy_info: video_path 是 HUD 代理视频时传入 proxy_functions.build_hud_proxy 返回的信息，ROI 按裁剪位置偏移。
+    # resume: video_output_dir 中有参数 (包括 start_time、ROI、阈值、proxy_info) 相同的检查点 (analysis_checkpoint.json) 时从中断的位置继续。
+    # keyframe_coarse: 粗扫描只解码关键帧 (需要 PyAVCapture.read_keyframe)，每个采样点取粗扫描间隔内最后一个关键帧，
+    # 采样间隔不超过 coarse_interval_seconds；精扫描只在数字变化的两个关键帧之间进行。
+    # max_coarse_interval_seconds: 大于 coarse_interval_seconds 时使用自适应粗扫描间隔 (coarse_schedule.AdaptiveCoarseSchedule)，
+    # 长时间没有已选武器时步长逐渐增加到这个值 (最大漏检窗口)，弹药数变化后缩短。
+    # gameplay_segments: 可选，游戏画面分段 [(start_sec, end_sec)] (gameplay_segments.segment_gameplay)，只扫描分段内的帧。
+    # 各阶段的耗时和计数 (stage_profiler.StageProfiler) 每分钟输出到日志，结束时写入 analysis_profile.json；
+    # cprofile: 同时用 cProfile 记录粗扫描循环，结果保存为 analysis_profile.prof。
+    # roi_normalized: ROI 和 mid_split_x 是 0~1 的归一化坐标 (normalize_roi)；默认为 1920x1080 下的像素坐标。
     version_tag = "20250528_MultiWeaponLogic" # 更新版本标签
     logger.info(f"\n[{version_tag}] Initiating for video: {video_path}")
     logger.info(f"分析的武器: {selected_weapon_names}")
@@ -250,7 +385,7 @@ def find_shooting_moments(video_path,
     logger.info(f"数字ROI (x1,y1,x2,y2,m): ({number_roi_x1},{number_roi_y1},{number_roi_x2},{number_roi_y2}, {mid_split_x}).")
     logger.info(f"粗扫描间隔: {coarse_interval_seconds}s, 精扫描间隔: {fine_interval_seconds}s. 开始时间: {start_time}")
 
-    cap = cv2.VideoCapture(video_path)
+    cap = frame_source if frame_source is not None else open_frame_source(video_path, decode_backend, gray=True)
     if not cap.isOpened():
         logger.error(f"错误: 无法打开视频 {video_path}")
         return
@@ -267,11 +402,40 @@ def find_shooting_moments(video_path,
         return
     logger.info(f"视频 FPS: {fps}, 总帧数: {total_frames}")
 
+    # ROI 是 1920x1080 下的像素坐标 (roi_normalized 时为归一化坐标)，按视频实际分辨率换算；模板按同一比例缩放
+    frame_width, frame_height, template_scale = _analysis_scale(cap, proxy_info)
+    (number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2), mid_split_x, \
+        [(weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2), (infinite_roi_x1, infinite_roi_y1, infinite_roi_x2, infinite_roi_y2)] = _resolve_rois(
+            frame_width, frame_height, (number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2), mid_split_x,
+            [(weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2), (infinite_roi_x1, infinite_roi_y1, infinite_roi_x2, infinite_roi_y2)],
+            proxy_info, roi_normalized)
+    if proxy_info:
+        logger.info(f"HUD代理视频: 原视频 {frame_width}x{frame_height}, 裁剪起点 ({proxy_info['crop_x']},{proxy_info['crop_y']})")
+    build_template_pyramid(root_pic_template_dir, template_scale)
+    if "bow" in selected_weapon_names and infinite_symbol_template_path:
+        _load_template_binary(infinite_symbol_template_path, template_scale)
+
     frame_skip_coarse = max(1, int(fps * coarse_interval_seconds))
     frame_skip_fine = max(1, int(fps * fine_interval_seconds))
     logger.info(f"粗步长: {frame_skip_coarse} frames, 精步长: {frame_skip_fine} frames")
+    if keyframe_coarse and not hasattr(cap, "read_keyframe"):
+        logger.warning("关键帧粗扫描需要 PyAV 解码 (decode_backend=\"pyav\")，改为按固定间隔粗扫描。")
+        keyframe_coarse = False
+    if keyframe_coarse:
+        logger.info("粗扫描: 只解码关键帧")
+    coarse_schedule = None
+    if max_coarse_interval_seconds and max_coarse_interval_seconds > coarse_interval_seconds:
+        coarse_schedule = AdaptiveCoarseSchedule(fps, coarse_interval_seconds, max_coarse_interval_seconds)
+        logger.info(f"自适应粗扫描间隔: {coarse_schedule.min_step / fps:.2f}s ~ {max_coarse_interval_seconds}s")
+    segment_frames = None
+    if gameplay_segments is not None:
+        segment_frames = sorted((int(start * fps), int(end * fps)) for start, end in gameplay_segments)
+        segment_ends = [end for _, end in segment_frames]
+        gameplay_seconds = sum(end - start for start, end in gameplay_segments)
+        logger.info(f"游戏画面分段: {len(segment_frames)} 段, 共 {gameplay_seconds:.0f} 秒 (视频 {total_frames / fps:.0f} 秒)，只分析分段内的画面")
 
     shooting_times_by_weapon = {name: [] for name in selected_weapon_names}
+    shot_scores = {} # {(武器名, 射击时刻): 武器ROI的IoU}，写入事件日志的 score
     prev_number_coarse_by_weapon = {name: 10000 for name in selected_weapon_names}
     prev_number_coarse_frame_by_weapon = {name: 0 for name in selected_weapon_names}
     last_known_active_frame_by_weapon = {name: 0 for name in selected_weapon_names}
@@ -283,17 +447,40 @@ def find_shooting_moments(video_path,
     current_frame_num = int(hms_to_seconds(start_time) * fps)
     last_coarse_log_frame = -frame_skip_coarse * 10 
     
-    WRITE_TXT_COUNTS = 20 
+    WRITE_TXT_COUNTS = 20 # 每隔多少次粗扫描把新事件追加到 events.jsonl
     coarse_loop_iteration_counter = 0
+    weapon_suffixes = {name: meta['suffix'] for name, meta in WEAPON_METADATA.items()}
+    event_store = EventStore(video_output_dir, weapon_suffixes)
+
+    # 检查点与事件日志同时写入: 事件先落盘，再记录下一个要处理的帧和粗扫描状态
+    checkpoint_path = os.path.join(video_output_dir, CHECKPOINT_FILENAME)
+    # 影响扫描位置和识别结果的参数都记录在检查点中，任何一个不同都从 start_time 重新开始，
+    # 不同设置的事件不会混在同一次分析中 (ROI 为换算后的像素坐标，分段保存为 JSON 读回后相同的列表)
+    checkpoint_params = {"video": os.path.basename(video_path), "selected_weapon_names": sorted(selected_weapon_names),
+                         "start_seconds": round(hms_to_seconds(start_time), 3),
+                         "coarse_interval_seconds": coarse_interval_seconds, "fine_interval_seconds": fine_interval_seconds,
+                         "weapon_activation_similarity_threshold": weapon_activation_similarity_threshold,
+                         "similarity_threshold_infinite": similarity_threshold_infinite,
+                         "number_roi": [int(number_roi_x1), int(number_roi_y1), int(number_roi_x2), int(number_roi_y2), int(mid_split_x)],
+                         "weapon_roi": [int(weapon_roi_x1), int(weapon_roi_y1), int(weapon_roi_x2), int(weapon_roi_y2)],
+                         "infinite_roi": [int(infinite_roi_x1), int(infinite_roi_y1), int(infinite_roi_x2), int(infinite_roi_y2)],
+                         "proxy_info": proxy_info or None,
+                         "keyframe_coarse": bool(keyframe_coarse),
+                         "max_coarse_interval_seconds": max_coarse_interval_seconds if coarse_schedule is not None else None,
+                         "gameplay_segments": [[round(start, 3), round(end, 3)] for start, end in gameplay_segments]
+                                              if gameplay_segments is not None else None}
+    checkpoint = _load_checkpoint(checkpoint_path, checkpoint_params) if resume else None
+    if checkpoint:
+        current_frame_num = checkpoint["next_frame"]
+        coarse_loop_iteration_counter = checkpoint["coarse_loop_iteration_counter"]
+        prev_number_coarse_by_weapon.update(checkpoint["prev_number_coarse_by_weapon"])
+        prev_number_coarse_frame_by_weapon.update(checkpoint["prev_number_coarse_frame_by_weapon"])
+        last_known_active_frame_by_weapon.update(checkpoint["last_known_active_frame_by_weapon"])
+        prev_frame_had_infinite_coarse_bow = checkpoint["prev_frame_had_infinite_coarse_bow"]
+        logger.info(f"从检查点恢复: Frame {current_frame_num} ({seconds_to_hms(current_frame_num / fps)}), 上个数字: {prev_number_coarse_by_weapon}")
 
-    all_weapon_template_paths = {}
     # 确保 WEAPON_METADATA 是最新的，包含所有武器及其 'suffix'
-    for name, meta in WEAPON_METADATA.items(): 
-        path = os.path.join(root_pic_template_dir, f"template_{meta['suffix']}.png")
-        if os.path.exists(path):
-            all_weapon_template_paths[name] = path
-        else:
-            logger.warning(f"武器模板缺失: {path} for {name} (display: {meta.get('display_name', 'N/A')}). 该武器将无法被检测。")
+    all_weapon_template_paths = _load_weapon_template_paths(root_pic_template_dir)
 
 
     if not any(name in all_weapon_template_paths for name in selected_weapon_names):
@@ -303,12 +490,39 @@ def find_shooting_moments(video_path,
 
     roi_x1_w, roi_y1_w, roi_x2_w, roi_y2_w = int(weapon_roi_x1), int(weapon_roi_y1), int(weapon_roi_x2), int(weapon_roi_y2)
 
+    # 阶段耗时: decode (seek + 解码) 由 ProfiledCapture 记录，其余阶段在调用处记录
+    profiler = StageProfiler(os.path.basename(video_path), cprofile=cprofile)
+    cap = ProfiledCapture(cap, profiler)
+    timed_iou = profiler.timed("weapon_iou", compare_score_iou)
+    timed_read_number = profiler.timed("ocr", read_number_two)
+    timed_check_infinite = profiler.timed("infinite_check", check_roi_against_template)
+
+    prev_coarse_frame = current_frame_num - frame_skip_coarse
+    read_failed = False
     while current_frame_num < total_frames:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_num)
-        ret, frame = cap.read()
+        if segment_frames is not None:
+            seg_index = bisect.bisect_left(segment_ends, current_frame_num)
+            if seg_index >= len(segment_frames):
+                logger.info(f"[Analysis 粗] 最后一个游戏画面分段已结束 @ F{current_frame_num}. Ending.")
+                break
+            if current_frame_num < segment_frames[seg_index][0]:
+                logger.info(f"[Analysis 粗] 跳过非游戏画面 {seconds_to_hms(current_frame_num / fps)} -> {seconds_to_hms(segment_frames[seg_index][0] / fps)}")
+                current_frame_num = segment_frames[seg_index][0]
+                prev_coarse_frame = current_frame_num - frame_skip_coarse # 跳过的部分不做精扫描
+        if keyframe_coarse:
+            ret, frame, key_frame_num = cap.read_keyframe(current_frame_num, prev_coarse_frame)
+            if ret:
+                current_frame_num = key_frame_num
+        else:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame_num)
+            ret, frame = cap.read()
         if not ret:
             logger.info(f"[Analysis 粗] Error reading frame {current_frame_num}. Ending.")
+            read_failed = True
             break
+        # 与上一个粗扫描采样点的距离，决定精扫描的范围 (固定间隔时等于 frame_skip_coarse)
+        coarse_span = max(1, current_frame_num - prev_coarse_frame)
+        prev_coarse_frame = current_frame_num
         
         timestamp_sec = current_frame_num / fps
         if current_frame_num >= last_coarse_log_frame + (frame_skip_coarse * 5) : 
@@ -336,11 +550,13 @@ def find_shooting_moments(video_path,
             coarse_loop_iteration_counter += 1
             continue
             
-        gray_weapon_roi = cv2.cvtColor(weapon_roi_current_frame, cv2.COLOR_BGR2GRAY)
+        t0 = time.perf_counter()
+        gray_weapon_roi = _to_gray(weapon_roi_current_frame)
         _, preprocessed_weapon_roi_otsu = cv2.threshold(gray_weapon_roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        profiler.add("gray_otsu", t0)
 
         for w_name, w_template_path in all_weapon_template_paths.items():
-            iou_score = compare_score_iou(preprocessed_weapon_roi_otsu, w_template_path)
+            iou_score = timed_iou(preprocessed_weapon_roi_otsu, w_template_path, template_scale=template_scale)
             if iou_score > max_iou_score:
                 max_iou_score = iou_score
                 if iou_score > weapon_activation_similarity_threshold:
@@ -355,7 +571,7 @@ def find_shooting_moments(video_path,
             fine_scan_reason = None
             triggering_weapon_for_fine_scan = None
             
-            current_number_coarse = read_number_two(frame, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir)
+            current_number_coarse = timed_read_number(frame, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=template_scale)
             prev_number_for_this_weapon = prev_number_coarse_by_weapon[current_active_weapon_name]
 
             detected_shot_in_coarse = False
@@ -369,9 +585,9 @@ def find_shooting_moments(video_path,
                 logger.info(f"[Analysis 粗] Weapon '{current_active_weapon_name}' 数字变化触发精扫描 @ F{current_frame_num} ({seconds_to_hms(timestamp_sec)}). Num: {prev_number_for_this_weapon} -> {current_number_coarse}.")
             
             elif current_active_weapon_name == "bow" and WEAPON_METADATA["bow"]["has_infinite"]:
-                is_infinite_active = check_roi_against_template(frame, infinite_symbol_template_path, 
+                is_infinite_active = timed_check_infinite(frame, infinite_symbol_template_path, 
                                                                 infinite_roi_x1, infinite_roi_y1, infinite_roi_x2, infinite_roi_y2, 
-                                                                threshold=similarity_threshold_infinite)
+                                                                threshold=similarity_threshold_infinite, template_scale=template_scale)
                 if not prev_frame_had_infinite_coarse_bow and is_infinite_active:
                     fine_scan_reason = "infinite_bow"
                     triggering_weapon_for_fine_scan = "bow" 
@@ -381,6 +597,9 @@ def find_shooting_moments(video_path,
                         logger.info(f"[Analysis 粗] Bow ∞时刻 记录下 {seconds_to_hms(bow_infinite_time)} @ F{current_frame_num}.")
             
             if fine_scan_reason and triggering_weapon_for_fine_scan:
+                fine_scan_started = time.perf_counter()
+                profiler.count("fine_scans")
+                profiler.count(f"fine_scans_{fine_scan_reason}")
                 fine_scan_start_frame = max(0, prev_number_coarse_frame_by_weapon[triggering_weapon_for_fine_scan]) 
                 fine_scan_end_frame = min(total_frames - 1, current_frame_num)
                 
@@ -396,96 +615,128 @@ def find_shooting_moments(video_path,
 
                 weapon_template_for_fine_scan = all_weapon_template_paths.get(triggering_weapon_for_fine_scan)
 
-                last_processed_fine_frame_rev = fine_scan_end_frame 
-                for fn_fine in range(fine_scan_end_frame, max(0, fine_scan_end_frame - frame_skip_coarse - frame_skip_fine-1) , -frame_skip_fine):
-                    if fn_fine < 0 or fn_fine >= last_processed_fine_frame_rev : break 
-                    last_processed_fine_frame_rev = fn_fine
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, fn_fine)
-                    ret_f, frame_f = cap.read()
-                    if not ret_f: continue
-                    ts_fine_sec = fn_fine / fps
-
-                    weapon_roi_fine = frame_f[roi_y1_w:roi_y2_w, roi_x1_w:roi_x2_w]
-                    if weapon_roi_fine.size == 0: continue
-                    gray_weapon_roi_fine = cv2.cvtColor(weapon_roi_fine, cv2.COLOR_BGR2GRAY)
-                    _, prep_weapon_roi_otsu_fine = cv2.threshold(gray_weapon_roi_fine, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+                bisect_shot_frame = None
+                if fine_scan_reason == "shot" and current_scan_logic == "standard" and weapon_template_for_fine_scan \
+                        and prev_number_for_this_weapon == current_number_coarse + 1:
+                    # 标准武器只减 1: 在反向扫描的同一组精扫描帧上二分查找数字变化的位置，读取次数 O(log n)
+                    bisect_started = time.perf_counter()
+                    grid_frames = list(range(fine_scan_end_frame, max(0, fine_scan_end_frame - coarse_span - frame_skip_fine-1), -frame_skip_fine))
+                    bisect_shot_frame, bisect_reads = _bisect_number_change(
+                        lambda fn: _read_weapon_number_at(cap, fn, weapon_template_for_fine_scan, roi_x1_w, roi_y1_w, roi_x2_w, roi_y2_w,
+                                                          weapon_activation_similarity_threshold, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2,
+                                                          mid_split_x, root_pic_template_dir, template_scale, profiler),
+                        grid_frames, prev_number_for_this_weapon, current_number_coarse)
+                    profiler.add_span("fine_bisect", bisect_started)
+                    profiler.count("bisect_reads", bisect_reads)
+                    if bisect_shot_frame is not None:
+                        ts_fine_sec = bisect_shot_frame / fps
+                        shot_time = max(0, ts_fine_sec - 0.3)
+                        if shot_time not in shooting_times_by_weapon[triggering_weapon_for_fine_scan]:
+                            shooting_times_by_weapon[triggering_weapon_for_fine_scan].append(shot_time)
+                            shot_scores[(triggering_weapon_for_fine_scan, shot_time)] = max_iou_score # 二分查找不保留IoU，用粗扫描帧的IoU
+                            logger.info(f"[Analysis 精 (BISECT)] Weapon '{triggering_weapon_for_fine_scan}' 检测到射击! F {bisect_shot_frame} ({seconds_to_hms(ts_fine_sec)}). Num: {prev_number_for_this_weapon} -> {current_number_coarse}. 记录: {seconds_to_hms(shot_time)} (读取 {bisect_reads}/{len(grid_frames)} 帧)")
+                    else:
+                        profiler.count("bisect_fallbacks")
+                        logger.info(f"[Analysis 精 (BISECT)] 二分查找遇到无法识别或意外的数字 (读取 {bisect_reads} 帧)，改为逐帧扫描。")
+
+                if bisect_shot_frame is None:
+                    last_processed_fine_frame_rev = fine_scan_end_frame 
+                    for fn_fine in range(fine_scan_end_frame, max(0, fine_scan_end_frame - coarse_span - frame_skip_fine-1) , -frame_skip_fine):
+                        if fn_fine < 0 or fn_fine >= last_processed_fine_frame_rev : break 
+                        last_processed_fine_frame_rev = fn_fine
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, fn_fine)
+                        ret_f, frame_f = cap.read()
+                        if not ret_f: continue
+                        ts_fine_sec = fn_fine / fps
+
+                        weapon_roi_fine = frame_f[roi_y1_w:roi_y2_w, roi_x1_w:roi_x2_w]
+                        if weapon_roi_fine.size == 0: continue
+                        t0 = time.perf_counter()
+                        gray_weapon_roi_fine = _to_gray(weapon_roi_fine)
+                        _, prep_weapon_roi_otsu_fine = cv2.threshold(gray_weapon_roi_fine, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+                        profiler.add("gray_otsu", t0)
                     
-                    is_trigger_weapon_active_fine = False
-                    if weapon_template_for_fine_scan:
-                         iou_fine = compare_score_iou(prep_weapon_roi_otsu_fine, weapon_template_for_fine_scan)
-                         if iou_fine > weapon_activation_similarity_threshold:
-                             is_trigger_weapon_active_fine = True
+                        is_trigger_weapon_active_fine = False
+                        if weapon_template_for_fine_scan:
+                             iou_fine = timed_iou(prep_weapon_roi_otsu_fine, weapon_template_for_fine_scan, template_scale=template_scale)
+                             if iou_fine > weapon_activation_similarity_threshold:
+                                 is_trigger_weapon_active_fine = True
                     
-                    if is_trigger_weapon_active_fine:
-                        current_number_fine = read_number_two(frame_f, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir)
-                        if current_number_fine is not None:
-                            shot_detected_reversed = False
-                            if prev_number_fine_scan is not None:
-                                if current_scan_logic == "standard":
-                                    # prev_number_fine_scan is number at later time in video, current_number_fine is earlier
-                                    if prev_number_fine_scan + 1 == current_number_fine:
-                                        shot_detected_reversed = True
-                                elif current_scan_logic == "rapid_fire":
-                                    # current_number_fine (ammo earlier) - prev_number_fine_scan (ammo later) should be 1 to 3
-                                    if 0 < (current_number_fine - prev_number_fine_scan) <= 3:
-                                        shot_detected_reversed = True
+                        if is_trigger_weapon_active_fine:
+                            current_number_fine = timed_read_number(frame_f, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=template_scale)
+                            if current_number_fine is not None:
+                                shot_detected_reversed = False
+                                if prev_number_fine_scan is not None:
+                                    if current_scan_logic == "standard":
+                                        # prev_number_fine_scan is number at later time in video, current_number_fine is earlier
+                                        if prev_number_fine_scan + 1 == current_number_fine:
+                                            shot_detected_reversed = True
+                                    elif current_scan_logic == "rapid_fire":
+                                        # current_number_fine (ammo earlier) - prev_number_fine_scan (ammo later) should be 1 to 3
+                                        if 0 < (current_number_fine - prev_number_fine_scan) <= 3:
+                                            shot_detected_reversed = True
                             
-                            if shot_detected_reversed:
-                                shot_time = max(0, ts_fine_sec - 0.3) 
-                                if shot_time not in shooting_times_by_weapon[triggering_weapon_for_fine_scan]:
-                                    shooting_times_by_weapon[triggering_weapon_for_fine_scan].append(shot_time)
-                                    logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] Weapon '{triggering_weapon_for_fine_scan}' 检测到射击! F {fn_fine} ({seconds_to_hms(ts_fine_sec)}). Num: {current_number_fine} -> {prev_number_fine_scan}. 记录: {seconds_to_hms(shot_time)}")
+                                if shot_detected_reversed:
+                                    shot_time = max(0, ts_fine_sec - 0.3) 
+                                    if shot_time not in shooting_times_by_weapon[triggering_weapon_for_fine_scan]:
+                                        shooting_times_by_weapon[triggering_weapon_for_fine_scan].append(shot_time)
+                                        shot_scores[(triggering_weapon_for_fine_scan, shot_time)] = iou_fine
+                                        logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] Weapon '{triggering_weapon_for_fine_scan}' 检测到射击! F {fn_fine} ({seconds_to_hms(ts_fine_sec)}). Num: {current_number_fine} -> {prev_number_fine_scan}. 记录: {seconds_to_hms(shot_time)}")
                             
-                            if current_number_fine == prev_number_coarse_by_weapon[triggering_weapon_for_fine_scan] and fine_scan_reason == "shot":
-                                logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 反向扫描时找到粗扫描的起始数字 {current_number_fine}. Weapon '{triggering_weapon_for_fine_scan}'.")
-                                break 
-                            prev_number_fine_scan = current_number_fine 
+                                if current_number_fine == prev_number_coarse_by_weapon[triggering_weapon_for_fine_scan] and fine_scan_reason == "shot":
+                                    logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 反向扫描时找到粗扫描的起始数字 {current_number_fine}. Weapon '{triggering_weapon_for_fine_scan}'.")
+                                    break 
+                                prev_number_fine_scan = current_number_fine 
                 
-                prev_number_fine_scan_fwd = prev_number_coarse_by_weapon[triggering_weapon_for_fine_scan]
-                logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 正向扫描开始. Weapon '{triggering_weapon_for_fine_scan}'. 上一个数字重置为: {prev_number_fine_scan_fwd}")
+                    prev_number_fine_scan_fwd = prev_number_coarse_by_weapon[triggering_weapon_for_fine_scan]
+                    logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 正向扫描开始. Weapon '{triggering_weapon_for_fine_scan}'. 上一个数字重置为: {prev_number_fine_scan_fwd}")
                 
-                for fn_fine in range(fine_scan_start_frame, min(min(total_frames,fine_scan_start_frame + frame_skip_coarse + frame_skip_fine + 1),last_processed_fine_frame_rev+1), frame_skip_fine):
-                    if fn_fine < 0: continue
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, fn_fine)
-                    ret_f, frame_f = cap.read()
-                    if not ret_f: continue
-                    ts_fine_sec = fn_fine / fps
+                    for fn_fine in range(fine_scan_start_frame, min(min(total_frames,fine_scan_start_frame + coarse_span + frame_skip_fine + 1),last_processed_fine_frame_rev+1), frame_skip_fine):
+                        if fn_fine < 0: continue
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, fn_fine)
+                        ret_f, frame_f = cap.read()
+                        if not ret_f: continue
+                        ts_fine_sec = fn_fine / fps
                     
-                    weapon_roi_fine_fwd = frame_f[roi_y1_w:roi_y2_w, roi_x1_w:roi_x2_w]
-                    if weapon_roi_fine_fwd.size == 0: continue
-                    gray_weapon_roi_fine_fwd = cv2.cvtColor(weapon_roi_fine_fwd, cv2.COLOR_BGR2GRAY)
-                    _, prep_weapon_roi_otsu_fine_fwd = cv2.threshold(gray_weapon_roi_fine_fwd, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+                        weapon_roi_fine_fwd = frame_f[roi_y1_w:roi_y2_w, roi_x1_w:roi_x2_w]
+                        if weapon_roi_fine_fwd.size == 0: continue
+                        t0 = time.perf_counter()
+                        gray_weapon_roi_fine_fwd = _to_gray(weapon_roi_fine_fwd)
+                        _, prep_weapon_roi_otsu_fine_fwd = cv2.threshold(gray_weapon_roi_fine_fwd, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+                        profiler.add("gray_otsu", t0)
                     
-                    is_trigger_weapon_active_fine_fwd = False
-                    if weapon_template_for_fine_scan:
-                         iou_fine_fwd = compare_score_iou(prep_weapon_roi_otsu_fine_fwd, weapon_template_for_fine_scan)
-                         if iou_fine_fwd > weapon_activation_similarity_threshold:
-                             is_trigger_weapon_active_fine_fwd = True
-
-                    if is_trigger_weapon_active_fine_fwd:
-                        current_number_fine_fwd = read_number_two(frame_f, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir)
-                        if current_number_fine_fwd is not None:
-                            shot_detected_forward = False
-                            if prev_number_fine_scan_fwd is not None: 
-                                if current_scan_logic == "standard":
-                                    # prev_number_fine_scan_fwd is number at earlier time, current_number_fine_fwd is later
-                                    if prev_number_fine_scan_fwd - 1 == current_number_fine_fwd:
-                                        shot_detected_forward = True
-                                elif current_scan_logic == "rapid_fire":
-                                    # prev_number_fine_scan_fwd (ammo earlier) - current_number_fine_fwd (ammo later) should be 1 to 3
-                                    if 0 < (prev_number_fine_scan_fwd - current_number_fine_fwd) <= 3:
-                                        shot_detected_forward = True
+                        is_trigger_weapon_active_fine_fwd = False
+                        if weapon_template_for_fine_scan:
+                             iou_fine_fwd = timed_iou(prep_weapon_roi_otsu_fine_fwd, weapon_template_for_fine_scan, template_scale=template_scale)
+                             if iou_fine_fwd > weapon_activation_similarity_threshold:
+                                 is_trigger_weapon_active_fine_fwd = True
+
+                        if is_trigger_weapon_active_fine_fwd:
+                            current_number_fine_fwd = timed_read_number(frame_f, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=template_scale)
+                            if current_number_fine_fwd is not None:
+                                shot_detected_forward = False
+                                if prev_number_fine_scan_fwd is not None: 
+                                    if current_scan_logic == "standard":
+                                        # prev_number_fine_scan_fwd is number at earlier time, current_number_fine_fwd is later
+                                        if prev_number_fine_scan_fwd - 1 == current_number_fine_fwd:
+                                            shot_detected_forward = True
+                                    elif current_scan_logic == "rapid_fire":
+                                        # prev_number_fine_scan_fwd (ammo earlier) - current_number_fine_fwd (ammo later) should be 1 to 3
+                                        if 0 < (prev_number_fine_scan_fwd - current_number_fine_fwd) <= 3:
+                                            shot_detected_forward = True
                             
-                            if shot_detected_forward:
-                                shot_time = max(0, ts_fine_sec - 0.3)
-                                if shot_time not in shooting_times_by_weapon[triggering_weapon_for_fine_scan]:
-                                    shooting_times_by_weapon[triggering_weapon_for_fine_scan].append(shot_time)
-                                    logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] Weapon '{triggering_weapon_for_fine_scan}' 检测到射击! F {fn_fine} ({seconds_to_hms(ts_fine_sec)}). Num: {prev_number_fine_scan_fwd} -> {current_number_fine_fwd}. 记录: {seconds_to_hms(shot_time)}")
+                                if shot_detected_forward:
+                                    shot_time = max(0, ts_fine_sec - 0.3)
+                                    if shot_time not in shooting_times_by_weapon[triggering_weapon_for_fine_scan]:
+                                        shooting_times_by_weapon[triggering_weapon_for_fine_scan].append(shot_time)
+                                        shot_scores[(triggering_weapon_for_fine_scan, shot_time)] = iou_fine_fwd
+                                        logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] Weapon '{triggering_weapon_for_fine_scan}' 检测到射击! F {fn_fine} ({seconds_to_hms(ts_fine_sec)}). Num: {prev_number_fine_scan_fwd} -> {current_number_fine_fwd}. 记录: {seconds_to_hms(shot_time)}")
                             
-                            if current_number_fine_fwd == current_number_coarse and fine_scan_reason == "shot": 
-                                logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 正向扫描时找到粗扫描的结束数字 {current_number_fine_fwd}. Weapon '{triggering_weapon_for_fine_scan}'.")
-                                break 
-                            prev_number_fine_scan_fwd = current_number_fine_fwd
+                                if current_number_fine_fwd == current_number_coarse and fine_scan_reason == "shot": 
+                                    logger.info(f"[Analysis 精 ({current_scan_logic.upper()})] 正向扫描时找到粗扫描的结束数字 {current_number_fine_fwd}. Weapon '{triggering_weapon_for_fine_scan}'.")
+                                    break 
+                                prev_number_fine_scan_fwd = current_number_fine_fwd
+                profiler.add_span("fine_scan", fine_scan_started)
             
             if current_number_coarse is not None:
                 prev_number_coarse_by_weapon[current_active_weapon_name] = current_number_coarse
@@ -505,121 +756,309 @@ def find_shooting_moments(video_path,
                # logger.debug(f"[Analysis 粗] Bow不再是激活武器或未被选择, 重置无限符号标记 @ F{current_frame_num}")
 
 
+        next_coarse_step = frame_skip_coarse
+        if coarse_schedule is not None:
+            selected_weapon_active = active_weapon_name_this_frame in selected_weapon_names
+            next_coarse_step = coarse_schedule.next_step(current_frame_num, selected_weapon_active,
+                                                         event=selected_weapon_active and fine_scan_reason is not None)
+
         if coarse_loop_iteration_counter > 0 and coarse_loop_iteration_counter % WRITE_TXT_COUNTS == 0:
-            for w_name_selected in selected_weapon_names:
-                if shooting_times_by_weapon[w_name_selected]:
-                    current_shooting_output_txt_path = os.path.join(video_output_dir, f"shooting_{WEAPON_METADATA[w_name_selected]['suffix']}.txt") # Use suffix for filename consistency if desired, or just w_name_selected
-                    unique_times_to_write = list(set(shooting_times_by_weapon[w_name_selected]))
-                    
-                    # Read existing times to avoid duplicates if appending, or ensure overwrite is intended.
-                    # Current final write logic overwrites, so periodic append is okay.
-                    with open(current_shooting_output_txt_path, 'a', encoding='utf-8') as f: 
-                        for t_shot in unique_times_to_write:
-                            f.write(f"{seconds_to_hms(t_shot)}\n")
-                    logger.info(f"写入 {len(unique_times_to_write)} 个 {w_name_selected} 射击时刻到 {current_shooting_output_txt_path} (临时)")
-                    shooting_times_by_weapon[w_name_selected].clear() 
-
-            if "bow" in selected_weapon_names and WEAPON_METADATA["bow"]["has_infinite"] and infinite_symbo_times_bow:
-                current_infinite_output_txt_path = os.path.join(video_output_dir, "infinite.txt") 
-                unique_inf_times = list(set(infinite_symbo_times_bow))
-                with open(current_infinite_output_txt_path, 'a', encoding='utf-8') as f: 
-                    for t_inf in unique_inf_times:
-                        f.write(f"{seconds_to_hms(t_inf)}\n")
-                logger.info(f"写入 {len(unique_inf_times)} 个 Bow ∞ 时刻到 {current_infinite_output_txt_path} (临时)")
-                infinite_symbo_times_bow.clear()
+            t0 = time.perf_counter()
+            _flush_events(event_store, shooting_times_by_weapon, infinite_symbo_times_bow, shot_scores)
+            _save_checkpoint(checkpoint_path, dict(
+                checkpoint_params,
+                next_frame=current_frame_num + next_coarse_step,
+                coarse_loop_iteration_counter=coarse_loop_iteration_counter + 1,
+                prev_number_coarse_by_weapon=prev_number_coarse_by_weapon,
+                prev_number_coarse_frame_by_weapon=prev_number_coarse_frame_by_weapon,
+                last_known_active_frame_by_weapon=last_known_active_frame_by_weapon,
+                prev_frame_had_infinite_coarse_bow=prev_frame_had_infinite_coarse_bow,
+                updated=time.time()))
+            profiler.add("event_write", t0)
 
+        profiler.count("coarse_samples")
+        profiler.maybe_log(f"F{current_frame_num}/{total_frames}")
         coarse_loop_iteration_counter += 1
-        current_frame_num += frame_skip_coarse
+        current_frame_num += next_coarse_step
 
     cap.release()
+    schedule_summary = coarse_schedule.log_summary() if coarse_schedule is not None else None
 
-    all_combined_shooting_times = [] 
+    t0 = time.perf_counter()
+    _flush_events(event_store, shooting_times_by_weapon, infinite_symbo_times_bow, shot_scores)
+    if read_failed:
+        # 读取失败 (视频不完整、解码错误) 不算分析完成: 检查点记录读取失败的帧，下次从这里继续
+        _save_checkpoint(checkpoint_path, dict(
+            checkpoint_params,
+            next_frame=current_frame_num,
+            coarse_loop_iteration_counter=coarse_loop_iteration_counter,
+            prev_number_coarse_by_weapon=prev_number_coarse_by_weapon,
+            prev_number_coarse_frame_by_weapon=prev_number_coarse_frame_by_weapon,
+            last_known_active_frame_by_weapon=last_known_active_frame_by_weapon,
+            prev_frame_had_infinite_coarse_bow=prev_frame_had_infinite_coarse_bow,
+            updated=time.time()))
+    event_store.export_legacy_txt({name: weapon_suffixes[name] for name in selected_weapon_names},
+                                  include_infinite="bow" in selected_weapon_names and WEAPON_METADATA["bow"]["has_infinite"])
+    profiler.add("event_write", t0)
+    profiler.counters.update(cap.decoder_stats())
+    # 武器和 ∞ 符号的模板比较次数 (数字识别内部的比较算在 ocr 中)
+    profiler.counters["template_comparisons"] = profiler.stage_calls.get("weapon_iou", 0) + profiler.stage_calls.get("infinite_check", 0)
+    if schedule_summary is not None:
+        profiler.counters["adaptive_schedule_ratio"] = schedule_summary["ratio"]
+    profiler.finish(os.path.join(video_output_dir, PROFILE_FILENAME))
+    if read_failed:
+        logger.warning(f"视频在 Frame {current_frame_num}/{total_frames} ({seconds_to_hms(current_frame_num / fps)}) 读取失败，"
+                       f"保留检查点 {checkpoint_path}，下次从这里继续。")
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path) # 分析完整结束 (到达视频末尾或最后一个游戏画面分段之后)，下次从头开始
 
-    for w_name_final in selected_weapon_names:
-        # Use weapon's suffix from WEAPON_METADATA for the output filename, or just w_name_final if preferred
-        # Original code in GUI uses `shooting_{weapon_name_to_clip}.txt` where weapon_name_to_clip is the internal key.
-        # For consistency, let's stick to internal key for filename.
-        final_shooting_output_txt_path = os.path.join(video_output_dir, f"shooting_{w_name_final}.txt")
-        existing_times_sec = []
-        if os.path.exists(final_shooting_output_txt_path):
-            try:
-                with open(final_shooting_output_txt_path, 'r', encoding='utf-8') as f_read:
-                    for line in f_read:
-                        line = line.strip()
-                        if line: existing_times_sec.append(hms_to_seconds(line))
-            except Exception as e:
-                logger.error(f"读取现有时间文件 {final_shooting_output_txt_path} 失败: {e}")
-
-        combined_w_times = shooting_times_by_weapon[w_name_final] + existing_times_sec
-        unique_shooting_times_w = sorted(list(set(combined_w_times)))
-
-        if not unique_shooting_times_w:
-            logger.info(f"武器 '{w_name_final}' 没有检测到射击时刻。{final_shooting_output_txt_path} 将为空或不创建。")
-            if os.path.exists(final_shooting_output_txt_path): 
-                try: 
-                    # Only remove if it's truly empty or only contains whitespace after this session
-                    if os.path.getsize(final_shooting_output_txt_path) == 0:
-                        os.remove(final_shooting_output_txt_path)
-                    else: # Check content if not zero size
-                        with open(final_shooting_output_txt_path, 'r', encoding='utf-8') as f_check:
-                            if not f_check.read().strip():
-                                os.remove(final_shooting_output_txt_path)
-
-                except OSError as e: logger.error(f"无法删除空的 {final_shooting_output_txt_path}: {e}")
+    logger.info(f"Video {video_path} analysis COMPLETED ({version_tag}).")
+
+def _save_checkpoint(checkpoint_path, state):
+    # 先写临时文件再替换，程序中断时检查点不会损坏
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _load_checkpoint(checkpoint_path, expected_params):
+    # 只有视频、开始时间、武器选择、ROI、阈值和扫描参数都相同时才恢复，否则从头 (start_time) 开始
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"检查点文件 {checkpoint_path} 无法读取 ({e})，从头开始分析。")
+        return None
+    mismatched = [key for key, value in expected_params.items() if checkpoint.get(key) != value]
+    if mismatched:
+        logger.info(f"检查点 {checkpoint_path} 的参数与本次不同 ({', '.join(mismatched)})，从头开始分析。")
+        return None
+    return checkpoint
+
+
+def has_resumable_checkpoint(video_output_dir):
+    """video_output_dir 中是否有未完成的分析检查点。"""
+    return os.path.exists(os.path.join(video_output_dir, CHECKPOINT_FILENAME))
+
+
+def _flush_events(event_store, shooting_times_by_weapon, infinite_times_bow, shot_scores=None):
+    # 把内存中的新时刻交给事件日志并追加到磁盘，只处理新事件；清空内存列表
+    # shot_scores: {(武器名, 射击时刻): 武器ROI的IoU}，作为事件的 score，已写入的条目删除
+    shot_scores = shot_scores if shot_scores is not None else {}
+    new_count = 0
+    for w_name, times in shooting_times_by_weapon.items():
+        new_count += sum(event_store.add("shot", w_name, t, score=shot_scores.pop((w_name, t), None)) for t in times)
+        times.clear()
+    new_count += sum(event_store.add("infinite", "bow", t) for t in infinite_times_bow)
+    infinite_times_bow.clear()
+    written = event_store.flush()
+    if written:
+        logger.info(f"写入 {written} 个新事件到 {event_store.path} (新射击时刻 {new_count})")
+
+
+def _load_weapon_template_paths(root_pic_template_dir):
+    # 所有武器模板路径 {武器名: 路径}，缺失的模板只记录警告
+    weapon_template_paths = {}
+    for name, meta in WEAPON_METADATA.items():
+        path = os.path.join(root_pic_template_dir, f"template_{meta['suffix']}.png")
+        if os.path.exists(path):
+            weapon_template_paths[name] = path
         else:
-            logger.info(f"武器 '{w_name_final}' 检测到 {len(unique_shooting_times_w)} 个独立射击时刻。")
-            with open(final_shooting_output_txt_path, 'w', encoding='utf-8') as f:
-                for t_shot in unique_shooting_times_w:
-                    f.write(f"{seconds_to_hms(t_shot)}\n")
-            logger.info(f"{w_name_final} 射击时刻已保存到: {final_shooting_output_txt_path}")
-            all_combined_shooting_times.extend(unique_shooting_times_w) 
-
-    if all_combined_shooting_times:
-        unique_all_weapons_times = sorted(list(set(all_combined_shooting_times)))
-        all_weapons_txt_path = os.path.join(video_output_dir, "all_weapons.txt")
-        with open(all_weapons_txt_path, 'w', encoding='utf-8') as f_all:
-            for t_shot_all in unique_all_weapons_times:
-                f_all.write(f"{seconds_to_hms(t_shot_all)}\n")
-        logger.info(f"所有选定武器的 {len(unique_all_weapons_times)} 个射击时刻已合并保存到: {all_weapons_txt_path}")
-    else:
-        logger.info("没有为任何选定武器检测到射击时刻，all_weapons.txt 将不被创建。")
-        all_weapons_txt_path = os.path.join(video_output_dir, "all_weapons.txt")
-        if os.path.exists(all_weapons_txt_path):
-            try: os.remove(all_weapons_txt_path)
-            except OSError as e: logger.error(f"无法删除空的 all_weapons.txt: {e}")
+            logger.warning(f"武器模板缺失: {path} for {name} (display: {meta.get('display_name', 'N/A')}). 该武器将无法被检测。")
+    return weapon_template_paths
 
 
-    if "bow" in selected_weapon_names and WEAPON_METADATA["bow"]["has_infinite"]:
-        final_infinite_output_txt_path = os.path.join(video_output_dir, "infinite.txt") 
-        existing_inf_times_sec = []
-        if os.path.exists(final_infinite_output_txt_path):
-            try:
-                with open(final_infinite_output_txt_path, 'r', encoding='utf-8') as f_read_inf:
-                    for line in f_read_inf:
-                        line = line.strip()
-                        if line: existing_inf_times_sec.append(hms_to_seconds(line))
-            except Exception as e:
-                 logger.error(f"读取现有无限时间文件 {final_infinite_output_txt_path} 失败: {e}")
-        
-        combined_inf_times = infinite_symbo_times_bow + existing_inf_times_sec
-        unique_infinite_start_times_bow = sorted(list(set(combined_inf_times)))
-
-        if not unique_infinite_start_times_bow:
-            logger.info(f"没有检测到Bow ∞ 大符号开始时刻。{final_infinite_output_txt_path} 将为空或不创建。")
-            if os.path.exists(final_infinite_output_txt_path):
-                try: 
-                    if os.path.getsize(final_infinite_output_txt_path) == 0:
-                        os.remove(final_infinite_output_txt_path)
-                    else:
-                         with open(final_infinite_output_txt_path, 'r', encoding='utf-8') as f_check_inf:
-                            if not f_check_inf.read().strip():
-                                os.remove(final_infinite_output_txt_path)
-                except OSError as e: logger.error(f"无法删除空的 {final_infinite_output_txt_path}: {e}")
+def _identify_active_weapon(frame, weapon_template_paths, roi_x1, roi_y1, roi_x2, roi_y2, threshold, template_scale=None):
+    # 与粗扫描相同: 武器ROI二值化后和所有武器模板比较IoU，最高分且超过阈值的武器为当前武器
+    return _identify_active_weapon_with_score(frame, weapon_template_paths, roi_x1, roi_y1, roi_x2, roi_y2,
+                                              threshold, template_scale)[0]
+
+
+def _identify_active_weapon_with_score(frame, weapon_template_paths, roi_x1, roi_y1, roi_x2, roi_y2, threshold, template_scale=None):
+    # 返回 (当前武器或 None, 最高IoU)
+    fh, fw = frame.shape[:2]
+    if not (0 <= roi_x1 < fw and 0 <= roi_y1 < fh and roi_x1 < roi_x2 and roi_y1 < roi_y2 and roi_x2 <= fw and roi_y2 <= fh):
+        logger.error(f"武器ROI坐标 ({roi_x1},{roi_y1},{roi_x2},{roi_y2}) 超出帧边界 ({fw},{fh})")
+        return None, -1.0
+    weapon_roi = frame[roi_y1:roi_y2, roi_x1:roi_x2]
+    if weapon_roi.size == 0:
+        return None, -1.0
+    gray_weapon_roi = _to_gray(weapon_roi)
+    _, preprocessed_weapon_roi_otsu = cv2.threshold(gray_weapon_roi, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    best_name, max_iou_score = None, -1.0
+    for w_name, w_template_path in weapon_template_paths.items():
+        iou_score = compare_score_iou(preprocessed_weapon_roi_otsu, w_template_path, template_scale=template_scale)
+        if iou_score > max_iou_score:
+            max_iou_score = iou_score
+            best_name = w_name
+    return (best_name if max_iou_score > threshold else None), max_iou_score
+
+
+def _read_weapon_number_at(cap, frame_num, weapon_template_path, roi_x1, roi_y1, roi_x2, roi_y2, threshold,
+                           number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=None,
+                           profiler=None):
+    # 精扫描的一次读取: seek 到 frame_num，指定武器激活时返回弹药数，否则 (或读不到数字) 返回 None
+    # profiler: 可选 StageProfiler，记录 gray_otsu / weapon_iou / ocr 的耗时 (解码由 ProfiledCapture 记录)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+    ret, frame = cap.read()
+    if not ret:
+        return None
+    weapon_roi = frame[roi_y1:roi_y2, roi_x1:roi_x2]
+    if weapon_roi.size == 0:
+        return None
+    t0 = time.perf_counter()
+    _, preprocessed_weapon_roi_otsu = cv2.threshold(_to_gray(weapon_roi), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if profiler is not None:
+        profiler.add("gray_otsu", t0)
+        t0 = time.perf_counter()
+    iou_score = compare_score_iou(preprocessed_weapon_roi_otsu, weapon_template_path, template_scale=template_scale)
+    if profiler is not None:
+        profiler.add("weapon_iou", t0)
+    if iou_score <= threshold:
+        return None
+    t0 = time.perf_counter()
+    number = read_number_two(frame, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=template_scale)
+    if profiler is not None:
+        profiler.add("ocr", t0)
+    return number
+
+
+def _bisect_number_change(read_number_at, grid_frames, old_number, new_number):
+    """
+    标准武器的精扫描 (两次粗扫描之间只减 1): grid_frames 为按时间倒序的精扫描帧，grid_frames[0] 是显示
+    new_number 的粗扫描帧。二分查找最后一个仍显示 old_number 的帧 (与逐帧反向扫描记录的帧相同)。
+    read_number_at(帧号) 返回数字或 None。返回 (帧号, 读取次数)；最早的帧不是 old_number、
+    或中间读到其他数字 / 读不到时返回 (None, 读取次数)，由调用方改为逐帧扫描。
+    """
+    if len(grid_frames) < 2:
+        return None, 0
+    reads = 1
+    if read_number_at(grid_frames[-1]) != old_number:
+        return None, reads
+    new_pos, old_pos = 0, len(grid_frames) - 1 # grid_frames[new_pos] 显示 new_number，grid_frames[old_pos] 显示 old_number
+    while old_pos - new_pos > 1:
+        mid = (new_pos + old_pos) // 2
+        number = read_number_at(grid_frames[mid])
+        reads += 1
+        if number == new_number:
+            new_pos = mid
+        elif number == old_number:
+            old_pos = mid
         else:
-            logger.info(f"检测到 {len(unique_infinite_start_times_bow)} 个Bow ∞ 大符号开始时刻。")
-            with open(final_infinite_output_txt_path, 'w', encoding='utf-8') as f:
-                for t_inf_start in unique_infinite_start_times_bow:
-                    f.write(f"{seconds_to_hms(t_inf_start)}\n")
-            logger.info(f"Bow ∞ 大符号开始时刻已保存到: {final_infinite_output_txt_path}")
+            return None, reads
+    return grid_frames[old_pos], reads
+
+
+def _is_ammo_decrement(earlier_number, later_number, scan_logic):
+    # standard: 每次射击子弹数恰好减1；rapid_fire: 两次采样之间可能射出 1~3 发
+    if scan_logic == "rapid_fire":
+        return 0 < (earlier_number - later_number) <= 3
+    return earlier_number - 1 == later_number
+
+
+def verify_shots_in_windows(video_path,
+                            root_pic_template_dir,
+                            selected_weapon_names,
+                            video_output_dir,
+                            candidate_windows_file,
+                            weapon_activation_similarity_threshold,
+                            number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x,
+                            weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2,
+                            fine_interval_seconds=0.1, proxy_info=None, decode_backend="opencv", roi_normalized=False):
+    """
+    混合模式的图像验证: 只解码音频给出的候选窗口 (candidate_windows.txt)，
+    在窗口内按精扫描步长检查武器ROI和弹药数递减 (read_number_two)。ROI 参数 (roi_normalized) 与 find_shooting_moments 相同。
+    解码量与射击次数成正比，而不是与视频长度成正比。
+    与 find_shooting_moments 的精扫描相同，记录仍显示旧数字的最后一个采样帧 (减 0.3 秒)，
+    结果写入同一个事件日志，保存到 shooting_{suffix}.txt 和 all_weapons.txt。
+    """
+    logger.info(f"[混合验证] 视频: {video_path}, 候选窗口文件: {candidate_windows_file}")
+    if not os.path.exists(candidate_windows_file):
+        logger.error(f"候选窗口文件不存在: {candidate_windows_file}")
+        return
+    windows = read_time_windows(candidate_windows_file)
+    if not windows:
+        logger.info(f"候选窗口文件 {candidate_windows_file} 中没有有效窗口。")
+        return
+
+    cap = open_frame_source(video_path, decode_backend, gray=True)
+    if not cap.isOpened():
+        logger.error(f"错误: 无法打开视频 {video_path}")
+        return
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if not fps or total_frames == 0:
+        logger.error(f"错误: 无法读取视频FPS或总帧数 {video_path}")
+        cap.release()
+        return
+    frame_skip_fine = max(1, int(fps * fine_interval_seconds))
+
+    frame_width, frame_height, template_scale = _analysis_scale(cap, proxy_info)
+    (number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2), mid_split_x, \
+        [(weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2)] = _resolve_rois(
+            frame_width, frame_height, (number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2), mid_split_x,
+            [(weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2)], proxy_info, roi_normalized)
+    build_template_pyramid(root_pic_template_dir, template_scale)
+
+    weapon_template_paths = _load_weapon_template_paths(root_pic_template_dir)
+    if not any(name in weapon_template_paths for name in selected_weapon_names):
+        logger.error("所有选定武器的模板均缺失！无法继续分析。")
+        cap.release()
+        return
+    roi_x1_w, roi_y1_w, roi_x2_w, roi_y2_w = int(weapon_roi_x1), int(weapon_roi_y1), int(weapon_roi_x2), int(weapon_roi_y2)
+
+    shooting_times_by_weapon = {name: [] for name in selected_weapon_names}
+    shot_scores = {} # {(武器名, 射击时刻): 武器ROI的IoU}
+    decoded_frames = 0
+    for window_idx, (window_start_sec, window_end_sec) in enumerate(windows, 1):
+        start_frame = int(window_start_sec * fps)
+        end_frame = min(total_frames - 1, int(window_end_sec * fps))
+        if start_frame >= total_frames:
+            break
+        # 每个窗口只 seek 一次，之后顺序解码；不需要分析的帧用 grab() 跳过，不做颜色转换
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        prev_weapon, prev_number = None, None
+        fn = start_frame
+        stream_ended = False
+        while fn <= end_frame and not stream_ended:
+            ret, frame = cap.read()
+            decoded_frames += 1
+            if not ret:
+                break
+            active_weapon, weapon_iou = _identify_active_weapon_with_score(frame, weapon_template_paths, roi_x1_w, roi_y1_w, roi_x2_w, roi_y2_w,
+                                                                           weapon_activation_similarity_threshold, template_scale)
+            if active_weapon in shooting_times_by_weapon:
+                current_number = read_number_two(frame, number_roi_x1, number_roi_y1, number_roi_x2, number_roi_y2, mid_split_x, root_pic_template_dir, template_scale=template_scale)
+                if current_number is not None:
+                    scan_logic = WEAPON_METADATA[active_weapon].get("scan_logic_type", "standard")
+                    if active_weapon == prev_weapon and prev_number is not None and _is_ammo_decrement(prev_number, current_number, scan_logic):
+                        # 上一个采样帧仍显示旧数字，与精扫描 (逆向扫描/二分) 记录的帧相同
+                        shot_time = max(0, (fn - frame_skip_fine) / fps - 0.3)
+                        if shot_time not in shooting_times_by_weapon[active_weapon]:
+                            shooting_times_by_weapon[active_weapon].append(shot_time)
+                            shot_scores[(active_weapon, shot_time)] = weapon_iou
+                            logger.info(f"[混合验证] 窗口 {window_idx}: Weapon '{active_weapon}' 检测到射击! F {fn} ({seconds_to_hms(fn / fps)}). Num: {prev_number} -> {current_number}. 记录: {seconds_to_hms(shot_time)}")
+                    prev_weapon, prev_number = active_weapon, current_number
+            else:
+                prev_weapon, prev_number = None, None # 切换武器或无武器时重新建立基准数字
+            for _ in range(frame_skip_fine - 1):
+                decoded_frames += 1
+                if not cap.grab():
+                    stream_ended = True
+                    break
+            fn += frame_skip_fine
+    cap.release()
+
+    logger.info(f"[混合验证] {len(windows)} 个窗口共解码 {decoded_frames} 帧 (视频总帧数 {total_frames}, 占 {decoded_frames / total_frames:.2%})")
 
-    logger.info(f"Video {video_path} analysis COMPLETED ({version_tag}).")
\ No newline at end of file
+    event_store = EventStore(video_output_dir, {name: meta['suffix'] for name, meta in WEAPON_METADATA.items()})
+    for w_name, times in shooting_times_by_weapon.items():
+        new_count = sum(event_store.add("shot", w_name, t_shot, score=shot_scores.get((w_name, t_shot)), detector="hybrid")
+                        for t_shot in times)
+        logger.info(f"[混合验证] 武器 '{w_name}': {len(set(times))} 个射击时刻 ({new_count} 个新事件)")
+    event_store.export_legacy_txt({name: WEAPON_METADATA[name]['suffix'] for name in selected_weapon_names})
+    return shooting_times_by_weapon
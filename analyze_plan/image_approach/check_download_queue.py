@@ -0,0 +1,129 @@
+"""
+用假下载器 (fake_downloader.py) 检查 run_download_queue，不访问网络:
+1. 并发: 多个视频同时下载，总耗时明显小于逐个下载
+2. 重试: 前两次调用失败，按 backoff_seconds * 2^n 等待后第三次成功；重试次数用完时状态为 failed
+3. 续传: download_jobs.json 中 running 状态的任务和 .part 文件，重新运行时从 .part 继续，已存在的视频跳过
+用法: python check_download_queue.py  (全部通过时返回 0)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from download_functions import run_download_queue, load_job_state, JOB_STATE_FILENAME
+
+logger = logging.getLogger(__name__)
+
+FAKE_DOWNLOADER_CMD = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_downloader.py")]
+FAKE_FILE_SIZE = 10 * 1024 # fake_downloader 写入 10 个 1 KB 的块
+
+
+def _jobs(video_ids):
+    return [{"url": f"https://www.twitch.tv/videos/{video_id}", "video_id": video_id, "start": None, "end": None}
+            for video_id in video_ids]
+
+
+def _run(output_dir, video_ids, env, **kwargs):
+    old_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        started = time.perf_counter()
+        infos = run_download_queue(_jobs(video_ids), output_dir, downloader_cmd=FAKE_DOWNLOADER_CMD, **kwargs)
+        return infos, time.perf_counter() - started
+    finally:
+        for key, value in old_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def check_concurrency(work_dir, n_videos=4, seconds=1.0):
+    output_dir = os.path.join(work_dir, "concurrency")
+    video_ids = [f"c{i}" for i in range(n_videos)]
+    infos, elapsed = _run(output_dir, video_ids, {"FAKE_DL_SECONDS": str(seconds)}, max_workers=n_videos)
+    errors = []
+    if sorted(info["parsed_id"] for info in infos) != video_ids:
+        errors.append(f"完成的视频 {[info['parsed_id'] for info in infos]} != {video_ids}")
+    if elapsed >= n_videos * seconds * 0.6:
+        errors.append(f"{n_videos} 个视频并发下载用时 {elapsed:.2f}s，接近逐个下载的 {n_videos * seconds:.1f}s")
+    logger.info(f"[并发] {n_videos} 个视频, 并发 {n_videos}, 用时 {elapsed:.2f}s (逐个下载约 {n_videos * seconds:.1f}s)")
+    return errors
+
+
+def check_retry(work_dir, backoff_seconds=0.2):
+    output_dir = os.path.join(work_dir, "retry")
+    env = {"FAKE_DL_SECONDS": "0.1", "FAKE_DL_FAIL_ATTEMPTS": "2"}
+    infos, elapsed = _run(output_dir, ["r1"], env, max_retries=3, backoff_seconds=backoff_seconds)
+    entry = load_job_state(os.path.join(output_dir, JOB_STATE_FILENAME)).get("r1", {})
+    errors = []
+    if [info["parsed_id"] for info in infos] != ["r1"] or entry.get("status") != "done":
+        errors.append(f"失败两次后应在第三次成功，状态: {entry}")
+    if entry.get("attempts") != 3:
+        errors.append(f"尝试次数 {entry.get('attempts')} != 3")
+    expected_wait = backoff_seconds + backoff_seconds * 2 # 第一次失败后等待 backoff，第二次后等待 2 * backoff
+    if elapsed < expected_wait:
+        errors.append(f"用时 {elapsed:.2f}s 小于重试等待时间 {expected_wait:.2f}s")
+
+    # 重试次数用完: 1 次重试 (共 2 次尝试) 都失败
+    infos, _ = _run(output_dir, ["r2"], env, max_retries=1, backoff_seconds=backoff_seconds)
+    entry = load_job_state(os.path.join(output_dir, JOB_STATE_FILENAME)).get("r2", {})
+    if infos or entry.get("status") != "failed" or entry.get("attempts") != 2:
+        errors.append(f"重试次数用完后应为 failed (2 次尝试)，状态: {entry}")
+    logger.info(f"[重试] 第三次成功, 用时 {elapsed:.2f}s (等待 {expected_wait:.2f}s); 重试用完后状态 {entry.get('status')}")
+    return errors
+
+
+def check_resume(work_dir, resumed_blocks=3):
+    output_dir = os.path.join(work_dir, "resume")
+    os.makedirs(output_dir, exist_ok=True)
+    # 上次运行: s1 已下载完成，s2 下载到一半时中断 (running 状态 + .part 文件)
+    with open(os.path.join(output_dir, "s1.mp4"), 'wb') as f:
+        f.write(b"\0" * FAKE_FILE_SIZE)
+    with open(os.path.join(output_dir, "s2.mp4.part"), 'wb') as f:
+        f.write(b"\0" * (resumed_blocks * 1024))
+    state = {video_id: {"url": job["url"], "start": None, "end": None, "status": status, "attempts": 1}
+             for video_id, job, status in zip(["s1", "s2"], _jobs(["s1", "s2"]), ["done", "running"])}
+    with open(os.path.join(output_dir, JOB_STATE_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+    infos, _ = _run(output_dir, ["s1", "s2"], {"FAKE_DL_SECONDS": "0.5"})
+    by_id = {info["parsed_id"]: info for info in infos}
+    state = load_job_state(os.path.join(output_dir, JOB_STATE_FILENAME))
+    errors = []
+    if not by_id.get("s1", {}).get("skipped"):
+        errors.append(f"已存在的 s1 应跳过下载: {by_id.get('s1')}")
+    if by_id.get("s2", {}).get("resumed_bytes") != resumed_blocks * 1024:
+        errors.append(f"s2 应从 {resumed_blocks * 1024} 字节的 .part 继续: {by_id.get('s2')}")
+    s2_path = os.path.join(output_dir, "s2.mp4")
+    if not os.path.exists(s2_path) or os.path.getsize(s2_path) != FAKE_FILE_SIZE or os.path.exists(s2_path + ".part"):
+        errors.append("s2 续传后的文件不完整或 .part 文件仍然存在")
+    if any(entry.get("status") != "done" for entry in state.values()):
+        errors.append(f"download_jobs.json 中的状态应全部为 done: {state}")
+    logger.info(f"[续传] s1 跳过, s2 从 {by_id.get('s2', {}).get('resumed_bytes')} 字节继续")
+    return errors
+
+
+def main(argv):
+    work_dir = tempfile.mkdtemp(prefix="download_queue_check_")
+    failures = {}
+    try:
+        for name, check in (("并发", check_concurrency), ("重试", check_retry), ("续传", check_resume)):
+            errors = check(work_dir)
+            if errors:
+                failures[name] = errors
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for name, errors in failures.items():
+        for error in errors:
+            logger.error(f"[{name}] {error}")
+    print("下载队列检查: " + ("全部通过" if not failures else f"失败 {list(failures)}"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,143 @@
+"""
+用 simulate_live_download 检查 LiveSegmentCapture (边下载边分析的帧来源)，不访问网络:
+把一个视频切成几个无损分段 (FFV1 .mkv)，按间隔逐个复制到分段目录，同时用 LiveSegmentCapture 读取，
+与直接用 cv2.VideoCapture 读取同一个视频比较:
+1. 帧数: 读到的帧数和结束后的 CAP_PROP_FRAME_COUNT 等于直接读取的帧数，结束前为 LIVE_FRAME_COUNT
+2. 帧内容: 每一帧与直接读取的帧相同；跳转 (CAP_PROP_POS_FRAMES) 后读到的帧也相同
+3. 结束: 收到结束标记后 read()/grab() 立即返回 False，不再等待新分段
+用法: python check_live_capture.py [视频路径]  (不给视频时生成一个测试视频；全部通过时返回 0)
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import cv2
+import numpy as np
+
+from frame_sources import LiveSegmentCapture, simulate_live_download, LIVE_FRAME_COUNT
+
+logger = logging.getLogger(__name__)
+
+
+def _make_test_video(path, seconds=6.0, fps=30.0, size=(320, 240)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    for i in range(int(seconds * fps)):
+        frame = np.full((size[1], size[0], 3), (i * 3) % 256, np.uint8)
+        cv2.putText(frame, str(i), (20, size[1] // 2), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+
+def _read_all_frames(video_path):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames, fps
+
+
+def _write_segments(frames, fps, segments_dir, segment_seconds):
+    # 无损编码，分段中的帧与直接读取的帧逐像素相同
+    os.makedirs(segments_dir, exist_ok=True)
+    frames_per_segment = max(1, int(round(segment_seconds * fps)))
+    height, width = frames[0].shape[:2]
+    for seg_index, start in enumerate(range(0, len(frames), frames_per_segment)):
+        writer = cv2.VideoWriter(os.path.join(segments_dir, f"seg_{seg_index:05d}.mkv"), cv2.VideoWriter_fourcc(*'FFV1'), fps, (width, height))
+        for frame in frames[start:start + frames_per_segment]:
+            writer.write(frame)
+        writer.release()
+    return (len(frames) + frames_per_segment - 1) // frames_per_segment
+
+
+def check_live_capture(video_path, work_dir, segment_seconds=2.0, interval_seconds=0.5, poll_seconds=0.1):
+    errors = []
+    reference_frames, fps = _read_all_frames(video_path)
+    if not reference_frames:
+        return [f"无法读取视频 {video_path}"]
+    segments_dir = os.path.join(work_dir, "segments")
+    live_dir = os.path.join(work_dir, "live")
+    n_segments = _write_segments(reference_frames, fps, segments_dir, segment_seconds)
+    logger.info(f"直接读取: {len(reference_frames)} 帧, FPS {fps}; 切成 {n_segments} 个分段")
+
+    writer_thread = simulate_live_download(segments_dir, live_dir, interval_seconds=interval_seconds)
+    cap = LiveSegmentCapture(live_dir, poll_seconds=poll_seconds, idle_timeout_seconds=30.0)
+    if not cap.isOpened():
+        return ["LiveSegmentCapture 没有打开第一个分段"]
+    if abs(cap.get(cv2.CAP_PROP_FPS) - fps) > 1e-3:
+        errors.append(f"FPS {cap.get(cv2.CAP_PROP_FPS)} != {fps}")
+    if n_segments > 1 and cap.get(cv2.CAP_PROP_FRAME_COUNT) != LIVE_FRAME_COUNT:
+        errors.append(f"下载结束前 CAP_PROP_FRAME_COUNT 应为 LIVE_FRAME_COUNT，实际 {cap.get(cv2.CAP_PROP_FRAME_COUNT)}")
+
+    # 顺序读取，隔一帧用 grab() 跳过 (与精扫描相同)，读取的帧与直接读取比较
+    frame_index = 0
+    mismatched = []
+    while True:
+        if frame_index % 2 == 0:
+            ret, frame = cap.read()
+            if ret and frame_index < len(reference_frames) and not np.array_equal(frame, reference_frames[frame_index]):
+                mismatched.append(frame_index)
+        else:
+            ret = cap.grab()
+        if not ret:
+            break
+        frame_index += 1
+    writer_thread.join()
+    if frame_index != len(reference_frames):
+        errors.append(f"读到 {frame_index} 帧，直接读取 {len(reference_frames)} 帧")
+    if mismatched:
+        errors.append(f"{len(mismatched)} 帧与直接读取的不同 (例如 {mismatched[:5]})")
+    if cap.get(cv2.CAP_PROP_FRAME_COUNT) != len(reference_frames):
+        errors.append(f"结束后 CAP_PROP_FRAME_COUNT {cap.get(cv2.CAP_PROP_FRAME_COUNT)} != {len(reference_frames)}")
+
+    # 结束后继续读取: 立即返回 False
+    started = time.perf_counter()
+    ret_read, frame = cap.read()
+    ret_grab = cap.grab()
+    elapsed = time.perf_counter() - started
+    if ret_read or frame is not None or ret_grab:
+        errors.append("结束后 read()/grab() 仍然返回了帧")
+    if elapsed > poll_seconds * 5:
+        errors.append(f"结束后 read()/grab() 等待了 {elapsed:.2f}s")
+
+    # 跳转: 每个分段的中间一帧和整个视频的最后一帧 (跨分段跳转)
+    frames_per_segment = max(1, int(round(segment_seconds * fps)))
+    seek_frames = sorted({min(len(reference_frames) - 1, start + frames_per_segment // 2)
+                          for start in range(0, len(reference_frames), frames_per_segment)} | {len(reference_frames) - 1})
+    for target in seek_frames:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        ret, frame = cap.read()
+        if not ret or not np.array_equal(frame, reference_frames[target]):
+            errors.append(f"跳转到第 {target} 帧后读到的帧与直接读取的不同")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, len(reference_frames))
+    if cap.read()[0]:
+        errors.append("跳转到最后一帧之后 read() 仍然返回了帧")
+    cap.release()
+    logger.info(f"LiveSegmentCapture: {frame_index} 帧, 跳转检查 {len(seek_frames)} 处, 结束后读取用时 {elapsed * 1000:.1f}ms")
+    return errors
+
+
+def main(argv):
+    work_dir = tempfile.mkdtemp(prefix="live_capture_check_")
+    try:
+        video_path = argv[0] if argv else os.path.join(work_dir, "test_video.mp4")
+        if not argv:
+            _make_test_video(video_path)
+        errors = check_live_capture(video_path, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    for error in errors:
+        logger.error(error)
+    print("LiveSegmentCapture 检查: " + ("全部通过" if not errors else f"{len(errors)} 项失败"))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
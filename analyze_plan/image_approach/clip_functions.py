@@ -2,9 +2,11 @@ import os
 import logging
 import subprocess
 import sys
+import numpy as np
 from general_function import (
-    seconds_to_hms,hms_to_seconds,hmsff_to_seconds
+    seconds_to_hms,hms_to_seconds,hmsff_to_seconds,read_hms_file,hms_lines_to_ms,ms_to_hms_strings
 )
+from interval_functions import read_weapon_time_sources, merge_intervals, unique_sorted_ms, group_label_names
 
 logger = logging.getLogger(__name__)
 
@@ -23,40 +25,16 @@ def generate_clips_from_multiple_weapon_times(input_video_path, weapon_time_sour
         logger.error(f"错误: 输入视频文件未找到 {input_video_path}")
         return
 
-    all_timestamps_info = [] # Will store dicts: {'time_sec': float, 'weapon_name': str, 'original_hms': str}
-    
-    for source_info in weapon_time_sources:
-        file_path = source_info['file_path']
-        weapon_name = source_info['weapon_name']
-        
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            logger.info(f"时间文件 {os.path.basename(file_path)} (武器: {weapon_name}) 不存在或为空，跳过。")
-            continue
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                logger.info(f"读取时间文件: {file_path} (武器: {weapon_name})")
-                for line_num, line_content in enumerate(f, 1):
-                    start_hms = line_content.strip()
-                    if not start_hms:
-                        continue
-                    try:
-                        start_sec = hms_to_seconds(start_hms)
-                        all_timestamps_info.append({
-                            'time_sec': start_sec,
-                            'weapon_name': weapon_name,
-                            'original_hms': start_hms 
-                        })
-                    except ValueError as e:
-                        logger.warning(f"解析时间戳 '{start_hms}' 错误 (来自 {os.path.basename(file_path)}, 行 {line_num}, 武器: {weapon_name}): {e}。跳过此时间戳。")
-        except Exception as e:
-            logger.error(f"读取时间文件 {file_path} (武器: {weapon_name}) 时出错: {e}")
-
-    if not all_timestamps_info:
+    times_ms, labels, weapon_names, hms_strings = read_weapon_time_sources(weapon_time_sources)
+    if times_ms.size == 0:
         logger.info(f"没有从提供的源文件中收集到有效的时间戳进行剪辑。视频: {os.path.basename(input_video_path)}")
         return
 
-    # 按时间顺序对所有收集到的时间戳进行排序
-    all_timestamps_info.sort(key=lambda x: x['time_sec'])
+    # 按时间顺序对所有收集到的时间戳进行排序 (稳定排序，同一时间保持武器顺序)
+    # Will store dicts: {'time_sec': float, 'weapon_name': str, 'original_hms': str}
+    times_list, labels_list = times_ms.tolist(), labels.tolist()
+    all_timestamps_info = [{'time_sec': times_list[k] / 1000.0, 'weapon_name': weapon_names[labels_list[k]], 'original_hms': hms_strings[k]}
+                           for k in np.argsort(times_ms, kind='stable').tolist()]
     
     # 可选：去重逻辑。如果多个武器在完全相同的时间（精确到毫秒）有记录，
     # 当前逻辑会为每个记录创建一个片段，文件名中包含各自的武器名。
@@ -307,23 +285,9 @@ def clip_video_ffmpeg_merged(input_video_path, shooting_times_file, output_folde
     # Read and parse timestamps
     valid_timestamps_with_indices = []
     try:
-        with open(shooting_times_file, 'r', encoding='utf-8') as f:
-            raw_lines = f.readlines()
-        
-        for original_line_idx, line_content in enumerate(raw_lines):
-            start_hms = line_content.strip()
-            if not start_hms: # Skip empty or whitespace-only lines
-                continue
-            try:
-                start_sec = hms_to_seconds(start_hms)
-                valid_timestamps_with_indices.append({
-                    'time_sec': start_sec,
-                    'original_hms': start_hms,
-                    'original_line_num': original_line_idx + 1 # 1-based line number
-                })
-            except ValueError as e: # Catch errors from hms_to_seconds
-                logger.error(f"警告: 解析时间戳 '{start_hms}' (原始行 {original_line_idx + 1}) 错误: {e}。跳过此行。")
-                continue
+        times_ms, hms_strings, line_nums = read_hms_file(shooting_times_file) # 空行跳过，无效行记录警告后跳过
+        valid_timestamps_with_indices = [{'time_sec': t_ms / 1000.0, 'original_hms': start_hms, 'original_line_num': line_num}
+                                         for t_ms, start_hms, line_num in zip(times_ms.tolist(), hms_strings, line_nums)]
     except Exception as e:
         logger.error(f"读取或解析时间戳文件 {shooting_times_file} 时出错: {e}")
         return
@@ -336,45 +300,14 @@ def clip_video_ffmpeg_merged(input_video_path, shooting_times_file, output_folde
     logger.info(f"共找到 {len(valid_timestamps_with_indices)} 个有效标记点。片段基础时长: {clip_duration}s。")
     logger.info(f"尝试合并时间差小于等于 {clip_duration}s 的连续片段，并保持原视频格式。")
 
+    if np.any(np.diff(times_ms) < 0):
+        logger.info(f"警告: {shooting_times_file} 中的时间戳顺序错乱，已按时间排序后再合并。")
+    # 相邻时间差 <= clip_duration 的合并为一组 (与其他合并模式使用同一个区间合并)
+    intervals = merge_intervals(times_ms, merge_gap_ms=int(round(clip_duration * 1000)))
+    order = intervals["order"].tolist()
     processed_groups_count = 0
-    current_group_infos = [] # Stores dicts for the current group being formed
-
-    for i in range(len(valid_timestamps_with_indices)):
-        current_ts_info = valid_timestamps_with_indices[i]
-
-        if not current_group_infos:
-            # This is the first timestamp for a new potential group
-            current_group_infos.append(current_ts_info)
-        else:
-            # A group is already started. Compare current_ts_info with the *previous timestamp in the file list*.
-            # previous_ts_in_file is valid_timestamps_with_indices[i-1]
-            # This is safe because if current_group_infos is not empty, it implies i > 0.
-            previous_ts_in_file = valid_timestamps_with_indices[i-1] 
-            
-            time_diff_with_prev_in_file = current_ts_info['time_sec'] - previous_ts_in_file['time_sec']
-
-            if time_diff_with_prev_in_file <= clip_duration and time_diff_with_prev_in_file >= 0: # also ensure time moves forward
-                # Merge: Add current timestamp to the ongoing group
-                current_group_infos.append(current_ts_info)
-            else:
-                # Time difference is too large, or time moved backward (anomalous data).
-                # End of current group: Process it.
-                if time_diff_with_prev_in_file < 0:
-                     logger.info(f"警告: 时间戳顺序错乱或重复。当前时间 {current_ts_info['original_hms']} (行 {current_ts_info['original_line_num']}) "
-                                   f"早于或等于前一时间 {previous_ts_in_file['original_hms']} (行 {previous_ts_in_file['original_line_num']})。"
-                                   f"将结束当前片段组并开始新组。")
-
-                if _process_merged_clip_group(
-                    current_group_infos, input_video_path, video_name_no_ext,
-                    input_video_extension, output_folder, clip_duration
-                ):
-                    processed_groups_count += 1
-                
-                # Start a new group with the current timestamp
-                current_group_infos = [current_ts_info]
-    
-    # After the loop, process any remaining group in current_group_infos
-    if current_group_infos:
+    for first, last in zip(intervals["first_index"].tolist(), intervals["last_index"].tolist()):
+        current_group_infos = [valid_timestamps_with_indices[k] for k in order[first:last + 1]]
         if _process_merged_clip_group(
             current_group_infos, input_video_path, video_name_no_ext,
             input_video_extension, output_folder, clip_duration
@@ -514,6 +447,7 @@ def clip_video_ffmpeg_with_duration(input_video_path, shooting_times_file, outpu
 def process_and_merge_times(shooting_times_file, infinite_file2):
 
     lista = []
+    lista_line_nums = []
     list_b_internal = []
 
     # 1. Process shooting_times_file
@@ -541,14 +475,15 @@ def process_and_merge_times(shooting_times_file, infinite_file2):
                         logger.warning(f"Line {line_num} in {shooting_times_file} ('{line_content}') has an unexpected structure (more than one ' - ' separator). Skipping.")
                         continue
 
-                    for ts_str in timestamps_to_add_from_line:
-                        try:
-                            hms_to_seconds(ts_str) # Validate format by attempting conversion
-                            lista.append(ts_str)
-                        except ValueError as e:
-                            logger.warning(f"Invalid timestamp format for '{ts_str}' from line {line_num} in {shooting_times_file}: {e}. Skipping this timestamp.")
+                    lista.extend(timestamps_to_add_from_line)
+                    lista_line_nums.extend([line_num] * len(timestamps_to_add_from_line))
         except Exception as e:
             logger.error(f"Error reading {shooting_times_file}: {e}")
+    # Validate format of all collected timestamps at once
+    lista_ms, lista_errors = hms_lines_to_ms(lista)
+    for idx, message in lista_errors.items():
+        logger.warning(f"Invalid timestamp format for '{lista[idx]}' from line {lista_line_nums[idx]} in {shooting_times_file}: {message}. Skipping this timestamp.")
+    lista_ms = lista_ms[lista_ms >= 0]
 
     # 2. Process infinite_file2
     if not os.path.exists(infinite_file2):
@@ -589,14 +524,15 @@ def process_and_merge_times(shooting_times_file, infinite_file2):
             logger.error(f"Error reading {infinite_file2}: {e}")
 
     # 3. Merge, Deduplicate, and Sort
-    combined_list = lista + list_b_internal
+    list_b_ms, _ = hms_lines_to_ms(list_b_internal) # produced by seconds_to_hms; negative results are dropped
+    combined_ms = np.concatenate((lista_ms, list_b_ms[list_b_ms >= 0]))
     
-    if not combined_list:
+    if combined_ms.size == 0:
         logger.info("No time data collected from any file. Output file will not be created/modified.")
         return
 
-    # Deduplicate by converting to a set and back to a list, then sort.
-    unique_sorted_times = sorted(list(set(combined_list)))
+    # Deduplicate (same millisecond) and sort with the shared interval engine.
+    unique_sorted_times = ms_to_hms_strings(unique_sorted_ms(combined_ms))
 
     # 4. Write to output file
     output_dir = os.path.dirname(shooting_times_file)
@@ -673,39 +609,11 @@ def generate_clips_from_multiple_weapon_times_merge(input_video_path, weapon_tim
         logger.error(f"错误: 输入视频文件未找到 {input_video_path}")
         return
 
-    all_timestamps_info = [] 
-    for source_info in weapon_time_sources:
-        file_path = source_info['file_path']
-        weapon_name = source_info['weapon_name']
-        
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            logger.info(f"时间文件 {os.path.basename(file_path)} (武器: {weapon_name}) 不存在或为空，跳过。")
-            continue
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                logger.info(f"读取时间文件: {file_path} (武器: {weapon_name})")
-                for line_num, line_content in enumerate(f, 1):
-                    start_hms = line_content.strip()
-                    if not start_hms:
-                        continue
-                    try:
-                        start_sec = hms_to_seconds(start_hms)
-                        all_timestamps_info.append({
-                            'time_sec': start_sec,
-                            'weapon_name': weapon_name,
-                            'original_hms': start_hms 
-                        })
-                    except ValueError as e:
-                        logger.warning(f"解析时间戳 '{start_hms}' 错误 (来自 {os.path.basename(file_path)}, 行 {line_num}, 武器: {weapon_name}): {e}。跳过此时间戳。")
-        except Exception as e:
-            logger.error(f"读取时间文件 {file_path} (武器: {weapon_name}) 时出错: {e}")
-
-    if not all_timestamps_info:
+    times_ms, labels, weapon_names, hms_strings = read_weapon_time_sources(weapon_time_sources)
+    if times_ms.size == 0:
         logger.info(f"没有从提供的源文件中收集到有效的时间戳进行剪辑。视频: {os.path.basename(input_video_path)}")
         return
 
-    all_timestamps_info.sort(key=lambda x: x['time_sec'])
-    
     os.makedirs(output_folder, exist_ok=True)
     video_name_no_ext = os.path.splitext(os.path.basename(input_video_path))[0]
     input_video_extension = os.path.splitext(input_video_path)[1]
@@ -716,55 +624,38 @@ def generate_clips_from_multiple_weapon_times_merge(input_video_path, weapon_tim
     # effective_merge_threshold is now directly merge_threshold_factor (in seconds)
     effective_merge_threshold_seconds = merge_threshold_factor 
     logger.info(f"开始合并剪辑视频: {os.path.basename(input_video_path)}, "
-                  f"共 {len(all_timestamps_info)} 个原始时间点 (来自所有选定武器, 已排序). "
+                  f"共 {times_ms.size} 个原始时间点 (来自所有选定武器, 已排序). "
                   f"基础片段时长 (加在最后事件后): {clip_duration}s. 合并时间阈值 (秒): {effective_merge_threshold_seconds}s.")
-    
-    clips_created_count = 0
-    merged_group_global_idx = 0 
-    
-    i = 0
-    while i < len(all_timestamps_info):
-        current_group_timestamps_info = [all_timestamps_info[i]] 
-        # group_first_event_start_time_sec is the actual start time of the first event in the group
-        group_first_event_start_time_sec = all_timestamps_info[i]['time_sec']
-        
-        j = i + 1
-        while j < len(all_timestamps_info):
-            next_ts_info = all_timestamps_info[j]
-            time_diff_with_last_in_group_start = next_ts_info['time_sec'] - current_group_timestamps_info[-1]['time_sec']
-
-            if time_diff_with_last_in_group_start >= 0 and \
-               time_diff_with_last_in_group_start <= effective_merge_threshold_seconds + clip_duration: # Use direct seconds threshold
-                current_group_timestamps_info.append(next_ts_info)
-                j += 1
-            else:
-                break 
-        
-        merged_group_global_idx += 1 
-        
-        # Adjust the actual start time for FFmpeg by pulling it back
-        adjusted_ffmpeg_start_time_sec = max(0, group_first_event_start_time_sec - merge_threshold_factor)
 
-        # The clip conceptually ends 'clip_duration' seconds AFTER the LAST timestamp in the group started.
-        group_conceptual_end_time_sec = current_group_timestamps_info[-1]['time_sec'] + clip_duration
-        
-        # Calculate new duration based on adjusted start and conceptual end
-        adjusted_ffmpeg_duration_sec = group_conceptual_end_time_sec - adjusted_ffmpeg_start_time_sec
+    # 相邻事件间隔 <= 阈值 + clip_duration 的合并；片段从首个事件前 merge_threshold_factor 秒开始，到最后事件后 clip_duration 秒结束
+    intervals = merge_intervals(times_ms, merge_gap_ms=int(round((effective_merge_threshold_seconds + clip_duration) * 1000)),
+                                pre_ms=int(round(merge_threshold_factor * 1000)), post_ms=int(round(clip_duration * 1000)),
+                                labels=labels, n_labels=len(weapon_names))
+    group_weapons = group_label_names(intervals, weapon_names)
+    order = intervals["order"].tolist()
+    first_index, last_index = intervals["first_index"].tolist(), intervals["last_index"].tolist()
+    first_ms, start_ms, end_ms = intervals["first_ms"].tolist(), intervals["start_ms"].tolist(), intervals["end_ms"].tolist()
 
+    clips_created_count = 0
+    for group_idx in range(len(first_ms)):
+        merged_group_global_idx = group_idx + 1
+        # group_first_event_start_time_sec is the actual start time of the first event in the group
+        group_first_event_start_time_sec = first_ms[group_idx] / 1000.0
+        adjusted_ffmpeg_start_time_sec = start_ms[group_idx] / 1000.0
+        adjusted_ffmpeg_duration_sec = (end_ms[group_idx] - start_ms[group_idx]) / 1000.0
 
         if adjusted_ffmpeg_duration_sec <= 0.001: 
-            original_hms_list = [ts['original_hms'] for ts in current_group_timestamps_info]
+            original_hms_list = [hms_strings[k] for k in order[first_index[group_idx]:last_index[group_idx] + 1]]
             logger.warning(f"计算出的合并片段时长过短或为零/负数 ({adjusted_ffmpeg_duration_sec:.3f}s) "
                            f"for group originally starting {seconds_to_hms(group_first_event_start_time_sec)} "
                            f"(FFmpeg start: {seconds_to_hms(adjusted_ffmpeg_start_time_sec)}, Orig HMS: {', '.join(original_hms_list)}). 跳过此组。")
-            i = j 
             continue
 
         # Filename uses the original start time of the first event for clarity
         formatted_original_start_time_for_filename = seconds_to_hms(group_first_event_start_time_sec)
         safe_time_str_for_filename = formatted_original_start_time_for_filename.replace(':', '').replace('.', '')
         
-        weapon_names_in_group = sorted(list(set([ts['weapon_name'][:3].lower() for ts in current_group_timestamps_info]))) 
+        weapon_names_in_group = sorted(set(name[:3].lower() for name in group_weapons[group_idx]))
         weapons_str_part = "_".join(weapon_names_in_group)
         if not weapons_str_part: weapons_str_part = "multiw"
 
@@ -773,19 +664,17 @@ def generate_clips_from_multiple_weapon_times_merge(input_video_path, weapon_tim
 
         if os.path.exists(output_clip_path):
             logger.info(f"合并片段 {output_clip_path} 已存在，跳过。")
-        elif _generate_merged_clip_ffmpeg_command( # This helper function is assumed to be defined elsewhere
+        elif _generate_merged_clip_ffmpeg_command(
             input_video_path, 
             adjusted_ffmpeg_start_time_sec, # Use adjusted start for ffmpeg
             adjusted_ffmpeg_duration_sec,   # Use adjusted duration for ffmpeg
             output_clip_path
         ):
             clips_created_count += 1
-            
-        i = j 
 
     if clips_created_count > 0:
         logger.info(f"合并剪辑完成。共创建 {clips_created_count} 个新片段。")
-    elif all_timestamps_info : 
+    else:
         logger.info(f"未创建新片段 (可能所有目标片段已存在或在处理过程中发生错误)。")
 
 
@@ -806,36 +695,11 @@ def generate_concatenated_video_from_timestamps(
         logger.error(f"错误: 输入视频文件未找到 {input_video_path}")
         return
 
-    all_timestamps_info = []
-    for source_info in weapon_time_sources:
-        file_path = source_info['file_path']
-        weapon_name = source_info['weapon_name']
-        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-            continue
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line_num, line_content in enumerate(f, 1):
-                    start_hms = line_content.strip()
-                    if not start_hms:
-                        continue
-                    try:
-                        start_sec = hms_to_seconds(start_hms)
-                        all_timestamps_info.append({
-                            'time_sec': start_sec,
-                            'weapon_name': weapon_name,
-                            'original_hms': start_hms
-                        })
-                    except ValueError as e:
-                        logger.warning(f"解析时间戳 '{start_hms}' 错误 (来自 {os.path.basename(file_path)}, 行 {line_num}): {e}。跳过。")
-        except Exception as e:
-            logger.error(f"读取时间文件 {file_path} 时出错: {e}")
-
-    if not all_timestamps_info:
+    times_ms, _, _, _ = read_weapon_time_sources(weapon_time_sources, log_skipped=False)
+    if times_ms.size == 0:
         logger.info(f"未收集到有效时间戳进行处理: {os.path.basename(input_video_path)}")
         return
 
-    all_timestamps_info.sort(key=lambda x: x['time_sec'])
-
     os.makedirs(output_folder, exist_ok=True)
     video_name_no_ext = os.path.splitext(os.path.basename(input_video_path))[0]
     input_video_extension = os.path.splitext(input_video_path)[1]
@@ -858,44 +722,22 @@ def generate_concatenated_video_from_timestamps(
     # effective_merge_threshold is now directly merge_threshold_factor (in seconds)
     effective_merge_threshold_seconds = merge_threshold_factor
     logger.info(f"准备合并视频片段 (中间文件模式): {os.path.basename(input_video_path)}, "
-                  f"{len(all_timestamps_info)} 个原始时间点. 合并阈值 (秒): {effective_merge_threshold_seconds}s.")
+                  f"{times_ms.size} 个原始时间点. 合并阈值 (秒): {effective_merge_threshold_seconds}s.")
 
+    # 与 generate_clips_from_multiple_weapon_times_merge 相同的分组和区间
+    intervals = merge_intervals(times_ms, merge_gap_ms=int(round((effective_merge_threshold_seconds + clip_duration) * 1000)),
+                                pre_ms=int(round(merge_threshold_factor * 1000)), post_ms=int(round(clip_duration * 1000)))
     segments_to_process = []
-    i = 0
-    while i < len(all_timestamps_info):
-        current_group_timestamps_info = [all_timestamps_info[i]]
-        # group_first_event_start_time_sec is the actual start time of the first event in the group
-        group_first_event_start_time_sec = all_timestamps_info[i]['time_sec']
-        
-        j = i + 1
-        while j < len(all_timestamps_info):
-            next_ts_info = all_timestamps_info[j]
-            time_diff_with_last_in_group_start = next_ts_info['time_sec'] - current_group_timestamps_info[-1]['time_sec']
-            if time_diff_with_last_in_group_start >= 0 and \
-               time_diff_with_last_in_group_start <= effective_merge_threshold_seconds + clip_duration: #condition of merge
-                current_group_timestamps_info.append(next_ts_info)
-                j += 1
-            else:
-                break
-        
-        # Adjust the actual start time for the segment by pulling it back
-        adjusted_segment_start_time_sec = max(0, group_first_event_start_time_sec - merge_threshold_factor)
-
-        # The segment conceptually ends 'clip_duration' seconds AFTER the LAST timestamp in the group started.
-        segment_conceptual_end_time_sec = current_group_timestamps_info[-1]['time_sec'] + clip_duration
-        
-        # Calculate new duration based on adjusted start and conceptual end
-        adjusted_segment_duration_sec = segment_conceptual_end_time_sec - adjusted_segment_start_time_sec
-
+    for first_ms, start_ms, end_ms in zip(intervals["first_ms"].tolist(), intervals["start_ms"].tolist(), intervals["end_ms"].tolist()):
+        adjusted_segment_duration_sec = (end_ms - start_ms) / 1000.0
         if adjusted_segment_duration_sec > 0.001:
             segments_to_process.append({
-                'start_sec': adjusted_segment_start_time_sec, # Use adjusted start for segment
+                'start_sec': start_ms / 1000.0, # Use adjusted start for segment
                 'duration_sec': adjusted_segment_duration_sec # Use adjusted duration for segment
             })
         else:
             logger.warning(f"片段时长无效 ({adjusted_segment_duration_sec:.3f}s) "
-                           f"原起始于 {seconds_to_hms(group_first_event_start_time_sec)} (FFmpeg start: {seconds_to_hms(adjusted_segment_start_time_sec)}). 跳过。")
-        i = j
+                           f"原起始于 {seconds_to_hms(first_ms / 1000.0)} (FFmpeg start: {seconds_to_hms(start_ms / 1000.0)}). 跳过。")
 
     if not segments_to_process:
         logger.info(f"无有效片段可合并生成中间文件: {os.path.basename(input_video_path)}")
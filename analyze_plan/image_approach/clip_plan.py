@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import zlib
+import platform
+import argparse
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from general_function import seconds_to_hms, read_hms_file, hms_lines_to_ms
+from interval_functions import read_weapon_time_sources, merge_intervals, group_label_names
+from remux_functions import PacketRemuxer, pyav_available, CLIP_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+# 剪辑计划: Part 3/4/6 启动 ffmpeg 之前先生成所有剪辑任务的列表 (JSON)，不运行 ffmpeg。
+# 每个任务: 源视频、开始时间、时长、输出路径、copy (直接复制流) 还是 encode (重新编码)。
+# 输出文件名与 clip_functions 中对应的函数相同，已经剪辑好的文件在计划中算作完成。
+# 用本机测得的校准数据 (clip_calibration.json) 估算总输出时长、磁盘占用和耗时。
+# run_clip_plan 执行计划: 已存在的输出跳过 (可以中断后继续)，shard_index/shard_count 把任务分给多台机器或多个进程。
+# backend='pyav' 时 copy 任务在进程内剪辑 (remux_functions.PacketRemuxer)，每个源视频只打开一次。
+#   python clip_plan.py clip_plan.json --shard 0/2 --workers 2 --backend pyav
+
+CLIP_PLAN_VERSION = 1
+CALIBRATION_FILENAME = "clip_calibration.json"
+# 与 generate_concatenated_video_from_timestamps 的中间文件编码参数相同
+ENCODE_ARGS = ['-vf', 'setpts=PTS-STARTPTS', '-af', 'asetpts=PTS-STARTPTS', '-c:v', 'libx264', '-preset', 'medium',
+               '-crf', '19', '-c:a', 'aac', '-b:a', '192k']
+# 没有校准数据时使用的保守估计
+DEFAULT_CALIBRATION = {
+    "per_job_seconds": 0.3, # 每次启动 ffmpeg 的固定开销
+    "copy_seconds_per_output_second": 0.02,
+    "encode_seconds_per_output_second": 0.5,
+    "encode_bytes_per_second": 1.5e6,
+    "calibrated": False,
+}
+DEFAULT_SOURCE_BYTES_PER_SECOND = 1.0e6
+
+_CREATION_FLAGS = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+
+
+def _video_extension(input_video_path):
+    return os.path.splitext(input_video_path)[1] or ".mp4"
+
+
+def _safe_time(seconds):
+    return seconds_to_hms(seconds).replace(':', '').replace('.', '')
+
+
+def _clip_job(video_id, mode, source, start, duration, output, codec="copy", **extra):
+    job = {
+        "id": f"{video_id}:{mode}:{os.path.basename(output)}",
+        "video_id": video_id,
+        "mode": mode,
+        "source": source,
+        "start": round(float(start), 3),
+        "duration": round(float(duration), 3),
+        "output": output,
+        "codec": codec,
+    }
+    job.update(extra)
+    return job
+
+
+def plan_weapon_clips(mode, video_id, input_video_path, weapon_time_sources, output_folder, clip_duration=0.8, merge_threshold_factor=2.0):
+    """
+    Part 3 的剪辑计划。mode: individual / merged / concatenated，参数与输出文件名和
+    generate_clips_from_multiple_weapon_times(_merge) / generate_concatenated_video_from_timestamps 相同。
+    output_folder: individual/merged 为片段文件夹，concatenated 为视频输出目录。返回任务列表。
+    """
+    times_ms, labels, weapon_names, _ = read_weapon_time_sources(weapon_time_sources, log_skipped=False)
+    if times_ms.size == 0:
+        return []
+    video_name_no_ext = os.path.splitext(os.path.basename(input_video_path))[0]
+    extension = _video_extension(input_video_path)
+
+    jobs = []
+    if mode == "individual":
+        order = np.argsort(times_ms, kind='stable').tolist()
+        times_list, labels_list = times_ms.tolist(), labels.tolist()
+        for i, k in enumerate(order):
+            weapon_name = weapon_names[labels_list[k]]
+            start = times_list[k] / 1000.0
+            output = os.path.join(output_folder, f"{video_name_no_ext}_{_safe_time(start)}_clip_{i+1}_{weapon_name}{extension}")
+            jobs.append(_clip_job(video_id, "part3-individual", input_video_path, start, clip_duration, output, weapons=[weapon_name]))
+        return jobs
+
+    if mode not in ("merged", "concatenated"):
+        logger.error(f"[剪辑计划] 未知的剪辑模式: {mode}")
+        return []
+    intervals = merge_intervals(times_ms, merge_gap_ms=int(round((merge_threshold_factor + clip_duration) * 1000)),
+                                pre_ms=int(round(merge_threshold_factor * 1000)), post_ms=int(round(clip_duration * 1000)),
+                                labels=labels, n_labels=len(weapon_names))
+    group_weapons = group_label_names(intervals, weapon_names)
+    first_ms, start_ms, end_ms = intervals["first_ms"].tolist(), intervals["start_ms"].tolist(), intervals["end_ms"].tolist()
+
+    if mode == "merged":
+        for group_idx in range(len(first_ms)):
+            duration = (end_ms[group_idx] - start_ms[group_idx]) / 1000.0
+            if duration <= 0.001:
+                continue
+            weapons_str_part = "_".join(sorted(set(name[:3].lower() for name in group_weapons[group_idx]))) or "multiw"
+            output = os.path.join(output_folder, f"{video_name_no_ext}_{_safe_time(first_ms[group_idx] / 1000.0)}_mclip_{group_idx+1}_{weapons_str_part}{extension}")
+            jobs.append(_clip_job(video_id, "part3-merged", input_video_path, start_ms[group_idx] / 1000.0, duration, output,
+                                  weapons=group_weapons[group_idx]))
+        return jobs
+
+    # concatenated: 每组重新编码为一个中间文件，最后 concat (流复制) 为一个视频
+    final_output = os.path.join(output_folder, f"{video_name_no_ext}_CONCAT_FROM_PARTS{extension}")
+    intermediate_folder = os.path.join(output_folder, f"{video_name_no_ext}_intermediate_reencoded_parts")
+    segment_outputs = []
+    for start, end in zip(start_ms, end_ms):
+        duration = (end - start) / 1000.0
+        if duration <= 0.001:
+            continue
+        output = os.path.join(intermediate_folder, f"intermediate_segment_{len(segment_outputs):04d}{extension}")
+        jobs.append(_clip_job(video_id, "part3-concatenated", input_video_path, start / 1000.0, duration, output, codec="encode",
+                              group=final_output))
+        segment_outputs.append(output)
+    if segment_outputs:
+        total_duration = sum(job["duration"] for job in jobs)
+        jobs.append(_clip_job(video_id, "part3-concatenated", input_video_path, 0.0, total_duration, final_output, codec="concat",
+                              inputs=segment_outputs, group=final_output))
+    return jobs
+
+
+def plan_time_file_clips(video_id, input_video_path, times_file, output_folder, clip_duration=0.8, mode="part6-bow_sum"):
+    """Part 6 (shooting_bow_sum.txt) 的剪辑计划：每个时间一个 clip_duration 秒的片段，文件名与 clip_video_ffmpeg 相同。"""
+    times_ms, _, line_nums = read_hms_file(times_file)
+    video_name_no_ext = os.path.splitext(os.path.basename(input_video_path))[0]
+    extension = _video_extension(input_video_path)
+    jobs = []
+    for t_ms, line_num in zip(times_ms.tolist(), line_nums):
+        start = t_ms / 1000.0
+        output = os.path.join(output_folder, f"{video_name_no_ext}_{_safe_time(start)}_clip_{line_num}{extension}")
+        jobs.append(_clip_job(video_id, mode, input_video_path, start, clip_duration, output))
+    return jobs
+
+
+def plan_range_file_clips(video_id, input_video_path, ranges_file, output_folder, mode="part4-infinite"):
+    """Part 4 (infinite_2.txt，每行 'HH:MM:SS.mmm - HH:MM:SS.mmm') 的剪辑计划，文件名与 clip_video_ffmpeg_with_duration 相同。"""
+    with open(ranges_file, 'r', encoding='utf-8') as f:
+        numbered = [(line_num, line.strip()) for line_num, line in enumerate(f, 1) if line.strip()]
+    pairs = [[part.strip() for part in line.split(' - ')] for _, line in numbered]
+    valid = [len(pair) == 2 for pair in pairs]
+    start_ms, start_errors = hms_lines_to_ms([pair[0] if ok else "" for pair, ok in zip(pairs, valid)])
+    end_ms, end_errors = hms_lines_to_ms([pair[1] if ok else "" for pair, ok in zip(pairs, valid)])
+
+    video_name_no_ext = os.path.splitext(os.path.basename(input_video_path))[0]
+    extension = _video_extension(input_video_path)
+    jobs = []
+    for i, (line_num, line) in enumerate(numbered):
+        if not valid[i] or i in start_errors or i in end_errors or start_ms[i] > end_ms[i]:
+            logger.warning(f"[剪辑计划] 跳过无效的时间范围 (行 {line_num}: '{line}') ({ranges_file})")
+            continue
+        start = int(start_ms[i]) / 1000.0
+        output = os.path.join(output_folder, f"{video_name_no_ext}_{_safe_time(start)}_infinite_clip_{line_num}{extension}")
+        jobs.append(_clip_job(video_id, mode, input_video_path, start, (int(end_ms[i]) - int(start_ms[i])) / 1000.0, output))
+    return jobs
+
+
+def _probe_source_bytes_per_second(video_path):
+    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration,size', '-of', 'json', video_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True, creationflags=_CREATION_FLAGS)
+        info = json.loads(result.stdout)["format"]
+        return float(info["size"]) / float(info["duration"])
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError, KeyError, ZeroDivisionError):
+        return DEFAULT_SOURCE_BYTES_PER_SECOND
+
+
+def load_calibration(calibration_path):
+    if calibration_path and os.path.exists(calibration_path):
+        try:
+            with open(calibration_path, 'r', encoding='utf-8') as f:
+                return dict(DEFAULT_CALIBRATION, **json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"[剪辑计划] 校准文件 {calibration_path} 无法读取 ({e})，使用默认估计。")
+    return dict(DEFAULT_CALIBRATION)
+
+
+def _timed_ffmpeg(command):
+    started = time.perf_counter()
+    subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace', creationflags=_CREATION_FLAGS)
+    return time.perf_counter() - started
+
+
+def calibrate_clip_costs(sample_video, calibration_path, sample_seconds=5.0):
+    """
+    在本机用 sample_video 测量剪辑耗时: 极短的 copy 片段 (ffmpeg 启动开销)、sample_seconds 秒的 copy 和 encode 片段。
+    结果写入 calibration_path 并返回；失败时返回默认估计。
+    """
+    work_dir = os.path.dirname(os.path.abspath(calibration_path))
+    extension = _video_extension(sample_video)
+    overhead_path = os.path.join(work_dir, f"_calibration_overhead{extension}")
+    copy_path = os.path.join(work_dir, f"_calibration_copy{extension}")
+    encode_path = os.path.join(work_dir, f"_calibration_encode{extension}")
+    base = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-ss', '0', '-i', sample_video]
+    try:
+        overhead = _timed_ffmpeg(base + ['-t', '0.1', '-codec', 'copy', overhead_path])
+        copy_seconds = _timed_ffmpeg(base + ['-t', str(sample_seconds), '-codec', 'copy', copy_path])
+        encode_seconds = _timed_ffmpeg(base + ['-t', str(sample_seconds)] + ENCODE_ARGS + [encode_path])
+        calibration = {
+            "per_job_seconds": round(overhead, 4),
+            "copy_seconds_per_output_second": round(max(0.0, copy_seconds - overhead) / sample_seconds, 4),
+            "encode_seconds_per_output_second": round(max(0.0, encode_seconds - overhead) / sample_seconds, 4),
+            "encode_bytes_per_second": round(os.path.getsize(encode_path) / sample_seconds),
+            "calibrated": True,
+            "machine": platform.node(),
+            "sample_video": os.path.abspath(sample_video),
+            "created": time.time(),
+        }
+    except (subprocess.CalledProcessError, FileNotFoundError, OSError) as e:
+        logger.error(f"[剪辑计划] 校准失败: {e}，使用默认估计。")
+        return dict(DEFAULT_CALIBRATION)
+    finally:
+        for path in (overhead_path, copy_path, encode_path):
+            if os.path.exists(path):
+                os.remove(path)
+    with open(calibration_path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, ensure_ascii=False, indent=2)
+    logger.info(f"[剪辑计划] 校准完成: 每个任务 {calibration['per_job_seconds']:.2f}s, "
+                f"copy {calibration['copy_seconds_per_output_second']:.3f}s/s, encode {calibration['encode_seconds_per_output_second']:.3f}s/s")
+    return calibration
+
+
+def estimate_plan_cost(jobs, calibration=None):
+    """估算尚未完成 (输出不存在) 的任务的总输出时长、磁盘占用 (字节) 和耗时 (秒)。"""
+    calibration = calibration or dict(DEFAULT_CALIBRATION)
+    source_rates = {}
+    estimate = {"jobs": len(jobs), "pending_jobs": 0, "output_seconds": 0.0, "output_bytes": 0, "seconds": 0.0,
+                "copy_jobs": 0, "encode_jobs": 0, "calibrated": bool(calibration.get("calibrated"))}
+    for job in jobs:
+        if os.path.exists(job["output"]):
+            continue
+        estimate["pending_jobs"] += 1
+        duration = job["duration"]
+        if job["codec"] == "encode":
+            estimate["encode_jobs"] += 1
+            estimate["output_bytes"] += duration * calibration["encode_bytes_per_second"]
+            estimate["seconds"] += calibration["per_job_seconds"] + duration * calibration["encode_seconds_per_output_second"]
+        elif job["codec"] == "concat":
+            # 拼接已编码的中间文件 (流复制)，输出与中间文件大小相同，不计入总时长
+            estimate["output_bytes"] += duration * calibration["encode_bytes_per_second"]
+            estimate["seconds"] += calibration["per_job_seconds"] + duration * calibration["copy_seconds_per_output_second"]
+            continue
+        else:
+            estimate["copy_jobs"] += 1
+            if job["source"] not in source_rates:
+                source_rates[job["source"]] = _probe_source_bytes_per_second(job["source"])
+            estimate["output_bytes"] += duration * source_rates[job["source"]]
+            estimate["seconds"] += calibration["per_job_seconds"] + duration * calibration["copy_seconds_per_output_second"]
+        estimate["output_seconds"] += duration
+    estimate["output_seconds"] = round(estimate["output_seconds"], 3)
+    estimate["output_bytes"] = int(estimate["output_bytes"])
+    estimate["seconds"] = round(estimate["seconds"], 1)
+    return estimate
+
+
+def write_clip_plan(plan_path, jobs, calibration=None):
+    """写入剪辑计划 JSON (包含估算结果)，返回 plan 字典。"""
+    plan = {
+        "version": CLIP_PLAN_VERSION,
+        "created": time.time(),
+        "calibration": calibration or dict(DEFAULT_CALIBRATION),
+        "estimate": estimate_plan_cost(jobs, calibration),
+        "jobs": jobs,
+    }
+    tmp_path = plan_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, plan_path)
+    return plan
+
+
+def load_clip_plan(plan_path):
+    with open(plan_path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get("version") != CLIP_PLAN_VERSION:
+        raise ValueError(f"剪辑计划版本不支持: {plan.get('version')} ({plan_path})")
+    return plan
+
+
+def format_estimate(estimate):
+    return (f"{estimate['pending_jobs']}/{estimate['jobs']} 个任务待执行 (copy {estimate['copy_jobs']}, encode {estimate['encode_jobs']}), "
+            f"输出 {estimate['output_seconds'] / 60:.1f} 分钟, 约 {estimate['output_bytes'] / (1024 * 1024):.0f} MB, "
+            f"预计耗时 {estimate['seconds'] / 60:.1f} 分钟{'' if estimate['calibrated'] else ' (未校准)'}")
+
+
+def _temp_output_path(output):
+    # ffmpeg 根据扩展名选择格式，临时文件保留原扩展名；完成后再改名，中断时不会留下看似完成的文件
+    root, extension = os.path.splitext(output)
+    return f"{root}.part{extension}"
+
+
+def _run_clip_job(job, remuxer=None):
+    os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+    tmp_output = _temp_output_path(job["output"])
+    if remuxer is not None and job["codec"] == "copy":
+        try:
+            remuxer.cut(job["start"], job["duration"], tmp_output)
+        except Exception as e: # PyAV 的各种 av.error.*
+            logger.error(f"[剪辑计划] 任务失败 {job['id']} (pyav): {e}")
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            return False
+        os.replace(tmp_output, job["output"])
+        logger.info(f"[剪辑计划] 完成: {job['output']}")
+        return True
+    if job["codec"] == "concat":
+        missing = [path for path in job["inputs"] if not os.path.exists(path)]
+        if missing:
+            logger.warning(f"[剪辑计划] {job['output']}: {len(missing)} 个中间文件尚未生成，暂不拼接。")
+            return False
+        concat_list_path = os.path.join(os.path.dirname(job["inputs"][0]), "concat_list.txt")
+        with open(concat_list_path, 'w', encoding='utf-8') as f:
+            for path in job["inputs"]:
+                f.write(f"file '{os.path.basename(path)}'\n")
+        command = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list_path, '-c', 'copy']
+    else:
+        command = ['ffmpeg', '-ss', seconds_to_hms(job["start"]), '-i', job["source"], '-t', str(job["duration"])]
+        command += ENCODE_ARGS if job["codec"] == "encode" else ['-codec', 'copy']
+    command += ['-loglevel', 'error', '-y', tmp_output]
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace', creationflags=_CREATION_FLAGS)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logger.error(f"[剪辑计划] 任务失败 {job['id']}: {e}")
+        if getattr(e, 'stderr', None):
+            logger.error(f"FFmpeg错误输出: {e.stderr.strip()}")
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return False
+    os.replace(tmp_output, job["output"])
+    logger.info(f"[剪辑计划] 完成: {job['output']}")
+    return True
+
+
+def _run_copy_jobs_pyav(jobs):
+    # 同一个源视频的 copy 任务: 打开一次，按开始时间顺序剪辑
+    try:
+        remuxer = PacketRemuxer(jobs[0]["source"])
+    except Exception as e:
+        logger.error(f"[剪辑计划] PyAV 无法打开 {jobs[0]['source']}: {e}，改用 ffmpeg。")
+        return [_run_clip_job(job) for job in jobs]
+    try:
+        return [_run_clip_job(job, remuxer) for job in sorted(jobs, key=lambda job: job["start"])]
+    finally:
+        remuxer.close()
+
+
+def _job_shard(job, shard_count):
+    # concat 任务和它的中间文件 (同一个 group) 分在同一个分片
+    return zlib.crc32(job.get("group", job["id"]).encode('utf-8')) % shard_count
+
+
+def run_clip_plan(plan_path, shard_index=0, shard_count=1, max_workers=1, backend="ffmpeg"):
+    """
+    执行剪辑计划中属于 shard_index (共 shard_count 个分片) 的任务。已存在的输出跳过，中断后重新运行即可继续。
+    concat 任务在其他任务完成后执行。backend: ffmpeg (每个片段一个子进程) 或 pyav (进程内复制数据包)。
+    返回 {'done', 'skipped', 'failed'}。
+    """
+    if backend not in CLIP_BACKENDS:
+        raise ValueError(f"未知的剪辑后端: {backend}，可选: {CLIP_BACKENDS}")
+    if backend == "pyav" and not pyav_available():
+        logger.warning("[剪辑计划] PyAV 未安装，使用 ffmpeg 后端。")
+        backend = "ffmpeg"
+    plan = load_clip_plan(plan_path)
+    jobs = [job for job in plan["jobs"] if _job_shard(job, max(1, shard_count)) == shard_index]
+    pending = [job for job in jobs if not os.path.exists(job["output"])]
+    counts = {"done": 0, "skipped": len(jobs) - len(pending), "failed": 0}
+    logger.info(f"[剪辑计划] 分片 {shard_index}/{shard_count}: {len(jobs)} 个任务, {counts['skipped']} 个已完成, "
+                f"{format_estimate(estimate_plan_cost(pending, plan.get('calibration')))}")
+
+    concat_jobs = [job for job in pending if job["codec"] == "concat"]
+    if backend == "pyav":
+        # copy 任务按源视频分组，每组在一个线程中使用同一个 PacketRemuxer
+        copy_groups = {}
+        for job in pending:
+            if job["codec"] == "copy":
+                copy_groups.setdefault(job["source"], []).append(job)
+        tasks = [(_run_copy_jobs_pyav, group) for group in copy_groups.values()]
+        tasks += [(lambda job: [_run_clip_job(job)], job) for job in pending if job["codec"] == "encode"]
+    else:
+        tasks = [(lambda job: [_run_clip_job(job)], job) for job in pending if job["codec"] != "concat"]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [executor.submit(fn, arg) for fn, arg in tasks]
+        for future in as_completed(futures):
+            for ok in future.result():
+                counts["done" if ok else "failed"] += 1
+    for job in concat_jobs:
+        counts["done" if _run_clip_job(job) else "failed"] += 1
+    logger.info(f"[剪辑计划] 分片 {shard_index}/{shard_count} 完成: {counts}")
+    return counts
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="执行剪辑计划 (clip_plan.json)")
+    parser.add_argument("plan_path")
+    parser.add_argument("--shard", default="0/1", help="分片 i/n，例如 0/2")
+    parser.add_argument("--workers", type=int, default=1, help="同时运行的 ffmpeg 进程数")
+    parser.add_argument("--backend", choices=CLIP_BACKENDS, default="ffmpeg", help="copy 片段的剪辑方式")
+    args = parser.parse_args(argv)
+    shard_index, shard_count = (int(x) for x in args.shard.split('/'))
+    counts = run_clip_plan(args.plan_path, shard_index, shard_count, args.workers, args.backend)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
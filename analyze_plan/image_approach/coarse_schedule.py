@@ -0,0 +1,79 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 自适应粗扫描间隔: 大厅、死亡、观战等没有已选武器的时间不需要每 3 秒采样一次。
+# - 弹药数变化或武器刚激活后 hot_seconds 内: 最短步长 (min_interval_seconds，默认粗扫描间隔的一半)；
+# - 已选武器激活: 粗扫描间隔 (coarse_interval_seconds)；
+# - 连续 idle_after_seconds 没有已选武器: 每次采样步长乘以 growth，直到 max_interval_seconds。
+# 步长永远不超过 max_interval_seconds，即武器出现后最多 max_interval_seconds 才会被粗扫描发现 (最大漏检窗口)。
+
+
+class AdaptiveCoarseSchedule:
+    """find_shooting_moments 每次粗扫描后调用 next_step()，返回到下一个采样点的帧数。"""
+
+    def __init__(self, fps, coarse_interval_seconds, max_interval_seconds, min_interval_seconds=None,
+                 idle_after_seconds=20.0, hot_seconds=10.0, growth=1.5):
+        self.fps = fps
+        self.base_step = max(1, int(fps * coarse_interval_seconds))
+        self.max_step = max(self.base_step, int(fps * max_interval_seconds))
+        if min_interval_seconds is None:
+            min_interval_seconds = coarse_interval_seconds / 2
+        self.min_step = max(1, min(self.base_step, int(fps * min_interval_seconds)))
+        self.idle_after_frames = int(fps * idle_after_seconds)
+        self.hot_frames = int(fps * hot_seconds)
+        self.growth = growth
+        self.step = self.base_step
+        self.last_active_frame = None
+        self.last_event_frame = None
+        self.was_active = False
+        self.first_frame = None
+        self.last_frame = None
+        self.samples = 0
+        self.samples_by_state = {"hot": 0, "active": 0, "idle": 0, "waiting": 0}
+
+    def next_step(self, frame_num, weapon_active, event=False):
+        """
+        weapon_active: 这一帧有已选武器激活；event: 这一帧触发了精扫描 (弹药数变化、弓的无限符号)。
+        """
+        if self.first_frame is None:
+            self.first_frame = frame_num
+        self.last_frame = frame_num
+        self.samples += 1
+        if weapon_active:
+            if event or not self.was_active:
+                self.last_event_frame = frame_num # 武器刚激活也按事件处理
+            self.last_active_frame = frame_num
+        self.was_active = weapon_active
+
+        if self.last_event_frame is not None and frame_num - self.last_event_frame <= self.hot_frames:
+            state, self.step = "hot", self.min_step
+        elif weapon_active:
+            state, self.step = "active", self.base_step
+        elif self.last_active_frame is None or frame_num - self.last_active_frame >= self.idle_after_frames:
+            state, self.step = "idle", min(self.max_step, max(self.base_step, int(self.step * self.growth)))
+        else:
+            state, self.step = "waiting", self.base_step # 武器刚消失 (换弹、切换武器)，先保持粗扫描间隔
+        self.samples_by_state[state] += 1
+        return self.step
+
+    def summary(self):
+        """实际采样数与固定间隔采样数的比较。"""
+        span = 0 if self.first_frame is None else self.last_frame - self.first_frame
+        fixed_samples = span // self.base_step + 1 if self.samples else 0
+        return {
+            "samples": self.samples,
+            "fixed_schedule_samples": fixed_samples,
+            "ratio": round(self.samples / fixed_samples, 3) if fixed_samples else 0.0,
+            "samples_by_state": dict(self.samples_by_state),
+            "min_interval_seconds": round(self.min_step / self.fps, 3),
+            "coarse_interval_seconds": round(self.base_step / self.fps, 3),
+            "max_interval_seconds": round(self.max_step / self.fps, 3),
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info(f"[自适应粗扫描] 采样 {summary['samples']} 次, 固定间隔需要 {summary['fixed_schedule_samples']} 次 "
+                    f"({summary['ratio']:.0%}); 各状态: {summary['samples_by_state']}, "
+                    f"步长 {summary['min_interval_seconds']}s ~ {summary['max_interval_seconds']}s (最大漏检窗口)")
+        return summary
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import threading
+import subprocess
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+from general_function import build_download_command, seconds_to_hms, seconds_array_to_ms
+from interval_functions import merge_intervals
+
+logger = logging.getLogger(__name__)
+
+# 任务状态文件中每个视频的状态: pending / running / done / failed
+JOB_STATE_FILENAME = "download_jobs.json"
+# 分段下载时 yt-dlp --print 输出行的前缀
+SECTION_PRINT_PREFIX = "[section]"
+
+
+def read_download_jobs(urls_file):
+    """
+    解析 video_urls.txt，每行: URL 或 URL,开始时间,结束时间。
+    返回 [{'line_num', 'url', 'video_id', 'start', 'end'}]，格式错误的行跳过。
+    """
+    jobs = []
+    with open(urls_file, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(',')
+            if len(parts) not in (1, 3):
+                logger.warning(f"URL文件行格式错误: {line}，跳过。")
+                continue
+            video_url = parts[0].strip()
+            video_id = urlparse(video_url).path.split('/')[-1] or f"unknown_video_{line_num}"
+            start_time_str, end_time_str = (parts[1].strip(), parts[2].strip()) if len(parts) == 3 else (None, None)
+            jobs.append({"line_num": line_num, "url": video_url, "video_id": video_id, "start": start_time_str, "end": end_time_str})
+    return jobs
+
+
+def load_job_state(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"下载任务状态文件 {state_path} 无法读取 ({e})，将重新建立。")
+        return {}
+
+
+def _save_job_state(state, state_path):
+    # 先写临时文件再替换，程序中断时状态文件不会损坏
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _run_download_job(job, output_dir, state, state_lock, state_path, max_retries, backoff_seconds, downloader_cmd, stream):
+    video_id = job["video_id"]
+    final_file_mp4 = os.path.join(output_dir, f"{video_id}.mp4")
+    # -c: 继续下载已有的 .part 文件 (断点续传)
+    command = build_download_command(job["url"], final_file_mp4, job["start"], job["end"], stream, downloader_cmd) + ['-c']
+    # 上次运行留下的 .part 文件大小，不算本次下载的字节数
+    resumed_bytes = sum(os.path.getsize(os.path.join(output_dir, name)) for name in os.listdir(output_dir)
+                        if name.startswith(f"{video_id}.") and name.endswith(".part"))
+
+    for attempt in range(1, max_retries + 2):
+        with state_lock:
+            state[video_id].update(status="running", attempts=state[video_id].get("attempts", 0) + 1, updated=time.time())
+            _save_job_state(state, state_path)
+        logger.info(f"[下载 {video_id}] 第 {attempt} 次尝试: {' '.join(command)}")
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+            returncode, error_tail = result.returncode, (result.stderr or "").strip()[-1000:]
+        except FileNotFoundError:
+            returncode, error_tail = -1, f"未找到下载器: {command[0]}"
+
+        if returncode == 0 and os.path.exists(final_file_mp4):
+            with state_lock:
+                state[video_id].update(status="done", path=final_file_mp4, last_error=None, updated=time.time())
+                _save_job_state(state, state_path)
+            logger.info(f"[下载 {video_id}] 下载成功: {final_file_mp4}")
+            return {"parsed_id": video_id, "filename": os.path.basename(final_file_mp4), "path": final_file_mp4,
+                    "skipped": False, "resumed_bytes": resumed_bytes}
+
+        final_attempt = attempt > max_retries
+        with state_lock:
+            state[video_id].update(status="failed" if final_attempt else "pending", last_error=error_tail or f"返回码 {returncode}", updated=time.time())
+            _save_job_state(state, state_path)
+        if final_attempt:
+            logger.error(f"[下载 {video_id}] 已重试 {max_retries} 次仍然失败 (返回码 {returncode}): {error_tail}")
+            return None
+        wait_seconds = backoff_seconds * (2 ** (attempt - 1))
+        logger.warning(f"[下载 {video_id}] 下载失败 (返回码 {returncode})，{wait_seconds:.1f} 秒后重试。")
+        time.sleep(wait_seconds)
+    return None
+
+
+def run_download_queue(jobs, output_dir, state_path=None, max_workers=3, max_retries=3, backoff_seconds=5.0,
+                       downloader_cmd=None, stream='bestvideo+bestaudio/best', on_done=None):
+    """
+    同时运行 max_workers 个下载进程。任务状态保存在 output_dir/download_jobs.json，
+    中断后重新运行时: done 且文件存在的跳过，running/failed/pending 的重新排队并续传 .part 文件。
+    失败后按 backoff_seconds * 2^n 等待重试。
+    on_done(info): 每个视频下载完成 (或已存在) 时立即调用，可以在其他视频下载时开始分析；
+    已存在而跳过下载的视频 info['skipped'] 为 True；续传的视频 info['resumed_bytes'] 为上次运行已下载的字节数。
+    downloader_cmd: 替代 yt-dlp 的命令前缀，例如 [sys.executable, "fake_downloader.py"]。
+    返回已完成视频的 [{'parsed_id', 'filename', 'path', 'skipped', ('resumed_bytes')}]，顺序为完成顺序。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if state_path is None:
+        state_path = os.path.join(output_dir, JOB_STATE_FILENAME)
+    state = load_job_state(state_path)
+    state_lock = threading.Lock()
+
+    done_infos = []
+    pending_jobs = []
+    for job in jobs:
+        video_id = job["video_id"]
+        final_file_mp4 = os.path.join(output_dir, f"{video_id}.mp4")
+        entry = state.setdefault(video_id, {})
+        entry.update(url=job["url"], start=job["start"], end=job["end"])
+        if os.path.exists(final_file_mp4):
+            entry.update(status="done", path=final_file_mp4)
+            logger.info(f"{final_file_mp4} 已存在，跳过下载。")
+            done_infos.append({"parsed_id": video_id, "filename": os.path.basename(final_file_mp4), "path": final_file_mp4,
+                               "skipped": True})
+        else:
+            if entry.get("status") == "running":
+                logger.info(f"[下载 {video_id}] 上次运行中断，继续下载。")
+            entry.update(status="pending", attempts=0)
+            pending_jobs.append(job)
+    _save_job_state(state, state_path)
+
+    if on_done:
+        for info in done_infos:
+            on_done(info)
+
+    logger.info(f"下载队列: {len(pending_jobs)} 个待下载, {len(done_infos)} 个已存在, 并发数 {max_workers}")
+    if not pending_jobs:
+        return done_infos
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(_run_download_job, job, output_dir, state, state_lock, state_path,
+                                   max_retries, backoff_seconds, downloader_cmd, stream): job for job in pending_jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                info = future.result()
+            except Exception as e:
+                logger.error(f"[下载 {job['video_id']}] 下载任务异常: {e}")
+                continue
+            if info:
+                done_infos.append(info)
+                if on_done:
+                    on_done(info)
+
+    failed = [video_id for video_id, entry in state.items() if entry.get("status") == "failed"]
+    logger.info(f"下载队列完成: {len(done_infos)} 个完成, {len(failed)} 个失败 {failed if failed else ''}")
+    return done_infos
+
+
+def merge_shot_windows(shot_times, before=2.0, after=2.0, merge_gap=3.0):
+    """把射击时刻扩展为 [t-before, t+after] 的窗口，间隔小于 merge_gap 的窗口合并。返回 [(开始秒, 结束秒)]。"""
+    # 窗口等宽，两个窗口的间隔 = 两个射击时刻之差 - before - after
+    intervals = merge_intervals(seconds_array_to_ms(shot_times), merge_gap_ms=int(round((merge_gap + before + after) * 1000)),
+                                pre_ms=int(round(before * 1000)), post_ms=int(round(after * 1000)))
+    return [(start_ms / 1000.0, end_ms / 1000.0) for start_ms, end_ms in zip(intervals["start_ms"].tolist(), intervals["end_ms"].tolist())]
+
+
+def download_sections_batched(video_url, video_id, sections, output_dir, max_workers=3, sections_per_call=20,
+                              stream='bestvideo+bestaudio/best', downloader_cmd=None):
+    """
+    只下载 sections 中的时间段。每次 yt-dlp 调用带多个 --download-sections，
+    多个批次并行运行；已存在的片段跳过。
+    片段文件名 {video_id}_{开始}-{结束}.mp4 (时间为原视频时间，HHMMSS.mmm)，
+    并写入 sections_manifest.json 记录每个片段在原视频中的位置和状态 (done / missing)。
+    返回已下载的 [{'start', 'end', 'path', 'status'}]。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = []
+    pending = []
+    for start, end in sections:
+        start_str, end_str = seconds_to_hms(start), seconds_to_hms(end)
+        path = os.path.join(output_dir, f"{video_id}_{start_str.replace(':', '')}-{end_str.replace(':', '')}.mp4")
+        entry = {"start": start, "end": end, "path": path, "status": "missing"}
+        manifest.append(entry)
+        if os.path.exists(path):
+            entry["status"] = "done"
+            logger.info(f"{path} 已存在，跳过下载。")
+        else:
+            pending.append(entry)
+
+    def run_batch(batch):
+        # yt-dlp 把每个 section 分别下载为一个文件，文件名中的 section_start/section_end 格式不固定；
+        # 用 --print after_move 输出每个文件最终的 section_start、section_end 和路径，按数值对应到片段后重命名
+        output_template = os.path.join(output_dir, f"{video_id}_sec_%(section_start)s-%(section_end)s.%(ext)s")
+        command = list(downloader_cmd) if downloader_cmd else ['yt-dlp']
+        command += [video_url, '-f', stream, '-o', output_template, '--merge-output-format', 'mp4', '-c',
+                    '--no-simulate', '--print', f"after_move:{SECTION_PRINT_PREFIX} %(section_start)s %(section_end)s %(filepath)s"]
+        for entry in batch:
+            command += ['--download-sections', f"*{seconds_to_hms(entry['start'])}-{seconds_to_hms(entry['end'])}"]
+        logger.info(f"[分段下载] {video_id}: 批量下载 {len(batch)} 个片段")
+        try:
+            result = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            logger.error(f"[分段下载] {video_id} 批量下载失败: {e}")
+            return 0
+        renamed = 0
+        for section_start, section_end, filepath in _parse_section_prints(result.stdout):
+            entry = next((e for e in batch if e["status"] != "done"
+                          and abs(e["start"] - section_start) < 0.01 and abs(e["end"] - section_end) < 0.01), None)
+            if entry is None or not os.path.exists(filepath):
+                logger.warning(f"[分段下载] 无法对应 yt-dlp 输出的片段 {section_start}-{section_end}: {filepath}")
+                continue
+            os.replace(filepath, entry["path"])
+            entry["status"] = "done"
+            renamed += 1
+        return renamed
+
+    batches = [pending[i:i + sections_per_call] for i in range(0, len(pending), max(1, sections_per_call))]
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            downloaded = sum(executor.map(run_batch, batches))
+        logger.info(f"[分段下载] {video_id}: {len(batches)} 个批次, 下载 {downloaded}/{len(pending)} 个片段")
+
+    missing = [entry for entry in manifest if entry["status"] != "done"]
+    for entry in missing:
+        logger.warning(f"[分段下载] 片段 {seconds_to_hms(entry['start'])}-{seconds_to_hms(entry['end'])} 未下载，已在 sections_manifest.json 中标记为 missing")
+    with open(os.path.join(output_dir, "sections_manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return [entry for entry in manifest if entry["status"] == "done"]
+
+
+def _parse_section_prints(stdout):
+    # 每行: SECTION_PRINT_PREFIX 开始秒 结束秒 文件路径 (路径中可能有空格)
+    for line in (stdout or "").splitlines():
+        fields = line.strip().split(' ', 3)
+        if len(fields) != 4 or fields[0] != SECTION_PRINT_PREFIX:
+            continue
+        try:
+            yield float(fields[1]), float(fields[2]), fields[3]
+        except ValueError:
+            continue
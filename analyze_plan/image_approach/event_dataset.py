@@ -0,0 +1,216 @@
+import os
+import json
+import sqlite3
+import logging
+
+from analysis_functions import WEAPON_METADATA
+from event_store import EVENT_LOG_FILENAME
+from general_function import read_hms_file, write_hms_file, hms_to_seconds
+
+logger = logging.getLogger(__name__)
+
+# 所有已分析视频的事件汇总到 clips_output/events.sqlite 一张表中:
+#   events(video_id, weapon, kind, t_ms, score, detector)
+# 时间以毫秒整数保存，查询时不需要再解析 HH:MM:SS.mmm。
+# 每个视频优先读取 events.jsonl (事件日志)，没有时读取 shooting_*.txt / infinite*.txt；
+# sources 表记录已导入文件的大小和修改时间，未变化的文件不会重复导入。
+# audio_approach 的 timestamps_scores.tsv (每个枪声时间戳的 corr / prominence) 导入为 detector="audio" 的事件，
+# score 为互相关峰值；音频不区分武器，weapon 为 AUDIO_WEAPON。
+# Part 3-6 仍然使用 txt 文件，可以用 export_txt 从数据库导出。
+
+DATASET_FILENAME = "events.sqlite"
+AUDIO_SCORES_FILENAME = "timestamps_scores.tsv"
+AUDIO_WEAPON = "unknown"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    video_id TEXT NOT NULL,
+    weapon TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    t_ms INTEGER NOT NULL,
+    score REAL,
+    detector TEXT NOT NULL,
+    UNIQUE (video_id, weapon, kind, t_ms, detector)
+);
+CREATE INDEX IF NOT EXISTS idx_events_video_weapon_time ON events (video_id, weapon, kind, t_ms);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (t_ms);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+"""
+
+
+def open_event_dataset(db_path):
+    """打开 (或新建) 事件数据库，返回 sqlite3 连接。"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _source_changed(conn, path):
+    stat = os.stat(path)
+    row = conn.execute("SELECT size, mtime FROM sources WHERE path = ?", (path,)).fetchone()
+    return row is None or row[0] != stat.st_size or row[1] != stat.st_mtime
+
+
+def _mark_source(conn, path):
+    stat = os.stat(path)
+    conn.execute("INSERT OR REPLACE INTO sources (path, size, mtime) VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime))
+
+
+def _insert_events(conn, rows):
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO events (video_id, weapon, kind, t_ms, score, detector) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return conn.total_changes - before
+
+
+def ingest_txt_file(conn, video_id, txt_path, weapon, kind="shot", detector="txt"):
+    """导入一个 HH:MM:SS.mmm 时间文件 (每行一个时间)，返回新增事件数。"""
+    times_ms, _, _ = read_hms_file(txt_path)
+    return _insert_events(conn, [(video_id, weapon, kind, t_ms, None, detector) for t_ms in times_ms.tolist()])
+
+
+def ingest_audio_scores(conn, video_id, scores_path):
+    """
+    导入 audio_approach 的 timestamps_scores.tsv (使用本地视频时间 t_local，score 为 corr)。
+    音频重新分析后文件整体替换，所以先删除该视频之前导入的音频事件。返回新增事件数。
+    """
+    rows = []
+    with open(scores_path, 'r', encoding='utf-8') as f:
+        next(f, None) # 表头: t_original, t_local, corr, prominence, template
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            try:
+                rows.append((video_id, AUDIO_WEAPON, "shot", int(round(hms_to_seconds(fields[1]) * 1000)), float(fields[2]), "audio"))
+            except (ValueError, IndexError):
+                continue
+    conn.execute("DELETE FROM events WHERE video_id = ? AND detector = 'audio'", (video_id,))
+    return _insert_events(conn, rows)
+
+
+def ingest_video_dir(conn, video_id, video_output_dir, force=False, audio_output_dir=None):
+    """
+    导入单个视频的输出目录，返回新增事件数。
+    audio_output_dir: 可选，audio_approach 的输出目录 (clips/<id>)；timestamps_scores.tsv 先在 video_output_dir 中找，再在这里找。
+    """
+    inserted = 0
+    event_log_path = os.path.join(video_output_dir, EVENT_LOG_FILENAME)
+    if os.path.exists(event_log_path):
+        if force or _source_changed(conn, event_log_path):
+            rows = []
+            with open(event_log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        rows.append((video_id, event["weapon"], event["kind"], int(round(float(event["t"]) * 1000)),
+                                     event.get("score"), event.get("detector", "image")))
+                    except (ValueError, KeyError, TypeError):
+                        continue # 写了一半的最后一行
+            inserted += _insert_events(conn, rows)
+            _mark_source(conn, event_log_path)
+    else:
+        suffix_to_weapon = {meta['suffix']: name for name, meta in WEAPON_METADATA.items()}
+        for filename in sorted(os.listdir(video_output_dir)):
+            txt_path = os.path.join(video_output_dir, filename)
+            if not filename.endswith('.txt') or not (force or _source_changed(conn, txt_path)):
+                continue
+            stem = filename[:-4]
+            if stem.startswith("shooting_") and not stem.endswith("_sum"):
+                file_key = stem[len("shooting_"):]
+                weapon = suffix_to_weapon.get(file_key, file_key if file_key in WEAPON_METADATA else None)
+                if weapon is None:
+                    continue
+                inserted += ingest_txt_file(conn, video_id, txt_path, weapon, "shot")
+            elif stem.startswith("infinite"):
+                inserted += ingest_txt_file(conn, video_id, txt_path, "bow", stem) # infinite / infinite_2 / infinite_3
+            else:
+                continue
+            _mark_source(conn, txt_path)
+    for scores_dir in (video_output_dir, audio_output_dir):
+        scores_path = os.path.join(scores_dir, AUDIO_SCORES_FILENAME) if scores_dir else None
+        if scores_path and os.path.exists(scores_path):
+            if force or _source_changed(conn, scores_path):
+                inserted += ingest_audio_scores(conn, video_id, scores_path)
+                _mark_source(conn, scores_path)
+            break
+    conn.commit()
+    return inserted
+
+
+def ingest_output_root(conn, output_root_folder, force=False, audio_output_root=None):
+    """导入 clips_output 下所有视频目录 (audio_output_root: audio_approach 的输出目录 clips)，返回 {video_id: 新增事件数}。"""
+    results = {}
+    for video_id in sorted(os.listdir(output_root_folder)):
+        video_output_dir = os.path.join(output_root_folder, video_id)
+        if os.path.isdir(video_output_dir):
+            results[video_id] = ingest_video_dir(conn, video_id, video_output_dir, force,
+                                                 os.path.join(audio_output_root, video_id) if audio_output_root else None)
+    logger.info(f"[事件数据库] 导入 {len(results)} 个视频目录, 新增 {sum(results.values())} 个事件")
+    return results
+
+
+def update_event_dataset(output_root_folder, video_id, audio_output_root=None):
+    """
+    分析完成后调用: 把单个视频的结果更新到 output_root_folder/events.sqlite。
+    audio_output_root: 可选，audio_approach 的输出目录 (clips)，其中 <id>/timestamps_scores.tsv 一起导入。
+    """
+    # 数据库只是汇总，失败时只记录错误，不影响分析结果
+    try:
+        conn = open_event_dataset(os.path.join(output_root_folder, DATASET_FILENAME))
+    except sqlite3.Error as e:
+        logger.error(f"[事件数据库] 无法打开数据库: {e}")
+        return 0
+    try:
+        inserted = ingest_video_dir(conn, video_id, os.path.join(output_root_folder, video_id),
+                                    audio_output_dir=os.path.join(audio_output_root, video_id) if audio_output_root else None)
+        logger.info(f"[事件数据库] {video_id}: 新增 {inserted} 个事件")
+        return inserted
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"[事件数据库] 更新 {video_id} 失败: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def shots_per_weapon(conn, video_id=None, kind="shot"):
+    """每个视频每种武器的事件数，返回 [(video_id, weapon, 数量)]。"""
+    query = "SELECT video_id, weapon, COUNT(*) FROM events WHERE kind = ?"
+    params = [kind]
+    if video_id is not None:
+        query += " AND video_id = ?"
+        params.append(video_id)
+    query += " GROUP BY video_id, weapon ORDER BY video_id, weapon"
+    return conn.execute(query, params).fetchall()
+
+
+def events_in_range(conn, start_seconds, end_seconds, video_id=None, weapon=None, kind="shot"):
+    """[start_seconds, end_seconds] 内的事件，返回 [(video_id, weapon, 秒)]，按视频和时间排序。"""
+    query = "SELECT video_id, weapon, t_ms FROM events WHERE kind = ? AND t_ms BETWEEN ? AND ?"
+    params = [kind, int(round(start_seconds * 1000)), int(round(end_seconds * 1000))]
+    if video_id is not None:
+        query += " AND video_id = ?"
+        params.append(video_id)
+    if weapon is not None:
+        query += " AND weapon = ?"
+        params.append(weapon)
+    query += " ORDER BY video_id, t_ms"
+    return [(vid, w, t_ms / 1000.0) for vid, w, t_ms in conn.execute(query, params)]
+
+
+def export_txt(conn, video_id, output_path, weapons=None, kind="shot"):
+    """
+    导出 Part 3-6 使用的 txt 文件 (每行 HH:MM:SS.mmm，已排序去重)。
+    weapons 为 None 时导出所有武器 (相当于 all_weapons.txt)。返回导出的时间数。
+    """
+    query = "SELECT DISTINCT t_ms FROM events WHERE video_id = ? AND kind = ?"
+    params = [video_id, kind]
+    if weapons:
+        query += f" AND weapon IN ({', '.join('?' for _ in weapons)})"
+        params.extend(weapons)
+    query += " ORDER BY t_ms"
+    times_ms = [row[0] for row in conn.execute(query, params)]
+    write_hms_file(output_path, times_ms)
+    logger.info(f"[事件数据库] {video_id}: {len(times_ms)} 个时间已导出到 {output_path}")
+    return len(times_ms)
@@ -0,0 +1,180 @@
+import os
+import json
+import bisect
+import logging
+
+from general_function import read_hms_file, seconds_array_to_ms, ms_to_hms_strings
+
+logger = logging.getLogger(__name__)
+
+# 每个视频一个只追加的事件日志 (video_output_dir/events.jsonl)，每行一个事件:
+#   {"kind": "shot", "weapon": "bow", "t": 123.456}
+#   {"kind": "infinite", "weapon": "bow", "t": 130.0}
+# 每次 flush 只追加新事件并 fsync，程序中断时最多丢失最后一批；读取时跳过损坏的行，截掉写了一半的最后一行。
+# 内存中按 (kind, weapon) 保存有序时间列表，shooting_{suffix}.txt / all_weapons.txt / infinite.txt 由日志导出。
+
+EVENT_LOG_FILENAME = "events.jsonl"
+
+
+def _atomic_write_lines(path, lines):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(f"{line}\n")
+    os.replace(tmp_path, path)
+
+
+def _read_legacy_times(txt_path):
+    times_ms, _, _ = read_hms_file(txt_path)
+    return (times_ms / 1000.0).tolist()
+
+
+def _hms_lines(times):
+    return ms_to_hms_strings(seconds_array_to_ms(times))
+
+
+class EventStore:
+    """
+    单个视频的事件日志。weapon_suffixes: {武器名: suffix}，日志不存在时用来导入旧的
+    shooting_{suffix}.txt / shooting_{武器名}.txt / infinite.txt，之前的结果不会丢失。
+    """
+
+    def __init__(self, video_output_dir, weapon_suffixes=None):
+        self.video_output_dir = video_output_dir
+        self.path = os.path.join(video_output_dir, EVENT_LOG_FILENAME)
+        self.index = {} # {(kind, weapon): 有序时间列表}
+        self.keys = set() # 去重: (kind, weapon, 毫秒)
+        self.pending = []
+        os.makedirs(video_output_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            self._load()
+        elif weapon_suffixes:
+            self._import_legacy_txt(weapon_suffixes)
+
+    def _load(self):
+        # 损坏的行跳过并记录，后面的事件继续读取；
+        # 没有换行符的最后一行是上次运行中断时写了一半的记录，截掉，之后追加的事件从新的一行开始
+        offset = 0
+        count = 0
+        bad_line_numbers = []
+        truncate_offset = None
+        missing_newline = False
+        with open(self.path, 'rb') as f:
+            for line_number, raw_line in enumerate(f, 1):
+                complete = raw_line.endswith(b"\n")
+                try:
+                    event = json.loads(raw_line.decode('utf-8'))
+                    self._index_event(event["kind"], event["weapon"], float(event["t"]))
+                    count += 1
+                    missing_newline = not complete
+                except (ValueError, KeyError, TypeError):
+                    if complete:
+                        if raw_line.strip():
+                            bad_line_numbers.append(line_number)
+                    else:
+                        truncate_offset = offset
+                offset += len(raw_line)
+        if bad_line_numbers:
+            logger.warning(f"[事件日志] {self.path} 有 {len(bad_line_numbers)} 行无法解析，已跳过 (行号: {bad_line_numbers[:20]})。")
+        if truncate_offset is not None:
+            logger.warning(f"[事件日志] {self.path} 末尾有不完整的记录 (上次运行中断)，已截断。")
+            with open(self.path, 'r+b') as f:
+                f.truncate(truncate_offset)
+        elif missing_newline:
+            with open(self.path, 'ab') as f:
+                f.write(b"\n")
+        logger.info(f"[事件日志] 读取 {self.path}: {count} 个事件")
+
+    def _import_legacy_txt(self, weapon_suffixes):
+        imported = 0
+        for weapon, suffix in weapon_suffixes.items():
+            for file_key in dict.fromkeys((suffix, weapon)):
+                txt_path = os.path.join(self.video_output_dir, f"shooting_{file_key}.txt")
+                if os.path.exists(txt_path):
+                    for t in _read_legacy_times(txt_path):
+                        imported += self.add("shot", weapon, t)
+        infinite_txt_path = os.path.join(self.video_output_dir, "infinite.txt")
+        if os.path.exists(infinite_txt_path):
+            for t in _read_legacy_times(infinite_txt_path):
+                imported += self.add("infinite", "bow", t)
+        if imported:
+            logger.info(f"[事件日志] 从已有的 txt 文件导入 {imported} 个事件")
+            self.flush()
+
+    def _index_event(self, kind, weapon, t):
+        key = (kind, weapon, int(round(t * 1000)))
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        bisect.insort(self.index.setdefault((kind, weapon), []), t)
+        return True
+
+    def add(self, kind, weapon, t, score=None, detector=None):
+        """记录一个事件，已存在 (同一毫秒) 的忽略。score/detector 可选，写入日志供事件数据库使用。返回是否为新事件。"""
+        t = round(max(0.0, float(t)), 3)
+        if not self._index_event(kind, weapon, t):
+            return False
+        event = {"kind": kind, "weapon": weapon, "t": t}
+        if score is not None:
+            event["score"] = round(float(score), 4)
+        if detector is not None:
+            event["detector"] = detector
+        self.pending.append(event)
+        return True
+
+    def flush(self):
+        """把新事件追加到日志并写入磁盘，返回写入的事件数。"""
+        if not self.pending:
+            return 0
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for event in self.pending:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        written = len(self.pending)
+        self.pending = []
+        return written
+
+    def times(self, kind, weapon=None):
+        """有序的事件时间 (秒)；weapon 为 None 时合并所有武器。"""
+        if weapon is not None:
+            return list(self.index.get((kind, weapon), []))
+        return sorted(set(t for (k, _), ts in self.index.items() if k == kind for t in ts))
+
+    def export_legacy_txt(self, weapon_suffixes, include_infinite=False):
+        """
+        导出 shooting_{suffix}.txt (每个武器) 和 all_weapons.txt (weapon_suffixes 中所有武器)，
+        include_infinite 时导出 infinite.txt。没有事件的武器删除旧文件。返回 all_weapons 的时间列表。
+        """
+        self.flush()
+        all_times = set()
+        for weapon, suffix in weapon_suffixes.items():
+            txt_path = os.path.join(self.video_output_dir, f"shooting_{suffix}.txt")
+            weapon_times = self.times("shot", weapon)
+            if weapon_times:
+                _atomic_write_lines(txt_path, _hms_lines(weapon_times))
+                logger.info(f"{weapon} 的 {len(weapon_times)} 个射击时刻已保存到: {txt_path}")
+                all_times.update(weapon_times)
+            else:
+                logger.info(f"武器 '{weapon}' 没有检测到射击时刻。")
+                if os.path.exists(txt_path):
+                    os.remove(txt_path)
+
+        all_weapons_txt_path = os.path.join(self.video_output_dir, "all_weapons.txt")
+        if all_times:
+            _atomic_write_lines(all_weapons_txt_path, _hms_lines(sorted(all_times)))
+            logger.info(f"所有选定武器的 {len(all_times)} 个射击时刻已合并保存到: {all_weapons_txt_path}")
+        else:
+            logger.info("没有为任何选定武器检测到射击时刻，all_weapons.txt 将不被创建。")
+            if os.path.exists(all_weapons_txt_path):
+                os.remove(all_weapons_txt_path)
+
+        if include_infinite:
+            infinite_txt_path = os.path.join(self.video_output_dir, "infinite.txt")
+            infinite_times = self.times("infinite", "bow")
+            if infinite_times:
+                _atomic_write_lines(infinite_txt_path, _hms_lines(infinite_times))
+                logger.info(f"Bow ∞ 大符号开始时刻 ({len(infinite_times)} 个) 已保存到: {infinite_txt_path}")
+            elif os.path.exists(infinite_txt_path):
+                os.remove(infinite_txt_path)
+        return sorted(all_times)
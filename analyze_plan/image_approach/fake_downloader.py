@@ -0,0 +1,60 @@
+"""
+测试用的假下载器，参数与 yt-dlp 相同 (只使用 -o)。不访问网络，写入一个假的视频文件。
+用法: run_download_queue(jobs, out_dir, downloader_cmd=[sys.executable, "fake_downloader.py"])
+环境变量:
+  FAKE_DL_SECONDS   下载耗时 (默认 2)
+  FAKE_DL_FAIL_RATE 失败概率 0~1 (默认 0)，用于测试重试
+  FAKE_DL_FAIL_ATTEMPTS 每个输出文件的前 N 次调用直接失败 (默认 0)，用于确定性地测试重试和等待时间
+  FAKE_DL_SOURCE    如果设置，复制这个本地文件作为下载结果 (可用于后续分析)
+"""
+import os
+import sys
+import time
+import random
+import shutil
+
+
+def main(argv):
+    if '-o' not in argv:
+        print("fake_downloader: 缺少 -o 参数", file=sys.stderr)
+        return 2
+    output_path = argv[argv.index('-o') + 1]
+    part_path = output_path + ".part"
+    seconds = float(os.environ.get("FAKE_DL_SECONDS", "2"))
+    fail_rate = float(os.environ.get("FAKE_DL_FAIL_RATE", "0"))
+    source = os.environ.get("FAKE_DL_SOURCE")
+    fail_attempts = int(os.environ.get("FAKE_DL_FAIL_ATTEMPTS", "0"))
+
+    if fail_attempts:
+        # 调用次数记录在 输出文件.attempts 中
+        counter_path = output_path + ".attempts"
+        attempt = 1
+        if os.path.exists(counter_path):
+            with open(counter_path, 'r', encoding='utf-8') as f:
+                attempt = int(f.read().strip() or 0) + 1
+        with open(counter_path, 'w', encoding='utf-8') as f:
+            f.write(str(attempt))
+        if attempt <= fail_attempts:
+            print(f"fake_downloader: 模拟下载失败 (第 {attempt} 次调用)", file=sys.stderr)
+            return 1
+
+    # 与 yt-dlp -c 一样，已有 .part 时接着写
+    resumed = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    steps = 10
+    with open(part_path, 'ab') as f:
+        for i in range(resumed // 1024, steps):
+            time.sleep(seconds / steps)
+            if random.random() < fail_rate / steps:
+                print(f"fake_downloader: 模拟下载失败 ({i}/{steps})", file=sys.stderr)
+                return 1
+            f.write(b"\0" * 1024)
+            f.flush()
+    if source:
+        shutil.copyfile(source, part_path)
+    os.replace(part_path, output_path)
+    print(f"fake_downloader: {output_path} (续传 {resumed} 字节)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,608 @@
+import os
+import sys
+import json
+import time
+import shutil
+import bisect
+import argparse
+import threading
+import subprocess
+import logging
+from collections import deque
+import cv2
+import numpy as np
+
+try:
+    import av # 可选依赖 (pip install av)，没有安装时只能使用 OpenCV 解码
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+
+# 边下载边分析: 读取正在下载的分段目录 (HLS/TS 分段等)，接口与 cv2.VideoCapture 相同，
+# 可以直接作为 find_shooting_moments(frame_source=...) 的帧来源。
+# 目录中出现 end_marker 文件表示下载结束；结束前最后一个分段可能还在写入，不会被读取。
+
+DEFAULT_END_MARKER = "ENDLIST"
+SEGMENT_EXTENSIONS = ('.ts', '.mp4', '.mkv', '.m4s', '.flv')
+# 下载未结束时 CAP_PROP_FRAME_COUNT 返回这个值，分析循环靠 read() 返回 False 结束
+LIVE_FRAME_COUNT = 10 ** 12
+
+
+def _count_video_frames(segment_path):
+    # ffprobe 统计视频包数 (不解码)，失败时退回 OpenCV 的估计值
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+               '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', segment_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True,
+                                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        return int(result.stdout.strip().split(',')[0])
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError, IndexError):
+        cap = cv2.VideoCapture(segment_path)
+        count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        return count
+
+
+class LiveSegmentCapture:
+    """
+    把一个不断增长的分段目录当作一个连续视频读取。
+    帧号是所有分段连续编号的全局帧号；读取尚未下载到的帧时等待新分段，
+    下载结束 (end_marker) 或 idle_timeout_seconds 内没有新分段时 read() 返回 (False, None)。
+    """
+
+    def __init__(self, segment_dir, end_marker=DEFAULT_END_MARKER, poll_seconds=2.0, idle_timeout_seconds=600.0):
+        self.segment_dir = segment_dir
+        self.end_marker = end_marker
+        self.poll_seconds = poll_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.segments = [] # [(路径, 起始全局帧号, 帧数)]
+        self.segment_starts = []
+        self.known_frames = 0
+        self.ended = False
+        self.fps = 0.0
+        self.frame_size = (0.0, 0.0)
+        self.pos = 0
+        self._last_growth = time.time()
+        self._cap = None
+        self._cap_index = -1
+        self._cap_next_local = -1
+
+        os.makedirs(segment_dir, exist_ok=True)
+        logger.info(f"[直播源] 等待分段目录中的第一个完整分段: {segment_dir}")
+        if self._wait_for(lambda: len(self.segments) > 0):
+            probe = cv2.VideoCapture(self.segments[0][0])
+            if probe.isOpened():
+                self.fps = probe.get(cv2.CAP_PROP_FPS)
+                self.frame_size = (probe.get(cv2.CAP_PROP_FRAME_WIDTH), probe.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            probe.release()
+            logger.info(f"[直播源] 第一个分段就绪: {os.path.basename(self.segments[0][0])}, FPS: {self.fps}")
+
+    def _refresh(self):
+        names = sorted(f for f in os.listdir(self.segment_dir) if f.lower().endswith(SEGMENT_EXTENSIONS))
+        ended = self.ended or os.path.exists(os.path.join(self.segment_dir, self.end_marker))
+        complete = names if ended else names[:-1] # 最后一个分段可能还在写入
+        for name in complete[len(self.segments):]:
+            path = os.path.join(self.segment_dir, name)
+            count = _count_video_frames(path)
+            self.segments.append((path, self.known_frames, count))
+            self.segment_starts.append(self.known_frames)
+            self.known_frames += count
+            self._last_growth = time.time()
+            logger.info(f"[直播源] 新分段 {name}: {count} 帧, 累计 {self.known_frames} 帧")
+        if ended and not self.ended:
+            logger.info(f"[直播源] 收到结束标记，共 {len(self.segments)} 个分段, {self.known_frames} 帧")
+        self.ended = ended
+
+    def _wait_for(self, condition):
+        while True:
+            self._refresh()
+            if condition() or self.ended:
+                return condition()
+            if time.time() - self._last_growth > self.idle_timeout_seconds:
+                logger.warning(f"[直播源] {self.idle_timeout_seconds:.0f} 秒内没有新分段，按下载结束处理。")
+                self.ended = True
+                continue # 再刷新一次，把最后一个分段也算作完整
+            time.sleep(self.poll_seconds)
+
+    def isOpened(self):
+        return len(self.segments) > 0
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.known_frames if self.ended else LIVE_FRAME_COUNT)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_size[1])
+        return 0.0
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.pos = max(0, int(value))
+            return True
+        return False
+
+    def _position_segment(self):
+        # 打开当前帧所在的分段并定位；顺序读取时不重复 seek
+        if not self._wait_for(lambda: self.pos < self.known_frames):
+            return False
+        seg_index = bisect.bisect_right(self.segment_starts, self.pos) - 1
+        path, start_frame, _ = self.segments[seg_index]
+        local_frame = self.pos - start_frame
+        if seg_index != self._cap_index:
+            if self._cap is not None:
+                self._cap.release()
+            self._cap = cv2.VideoCapture(path)
+            self._cap_index = seg_index
+            self._cap_next_local = 0
+        if local_frame != self._cap_next_local:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, local_frame)
+        self._cap_next_local = local_frame
+        return True
+
+    def read(self):
+        if not self._position_segment():
+            return False, None
+        ret, frame = self._cap.read()
+        self._cap_next_local = self._cap_next_local + 1 if ret else -1
+        self.pos += 1
+        return ret, frame
+
+    def grab(self):
+        if not self._position_segment():
+            return False
+        ret = self._cap.grab()
+        self._cap_next_local = self._cap_next_local + 1 if ret else -1
+        self.pos += 1
+        return ret
+
+    def release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+            self._cap_index = -1
+
+
+def start_segment_download(video_url, segment_dir, segment_seconds=60, stream='best', end_marker=DEFAULT_END_MARKER):
+    """
+    yt-dlp 输出到管道，ffmpeg 按 segment_seconds 切成 TS 分段写入 segment_dir，
+    两个进程结束后写入 end_marker。返回后台线程。
+    """
+    os.makedirs(segment_dir, exist_ok=True)
+    creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    ytdlp_cmd = ['yt-dlp', video_url, '-f', stream, '-o', '-']
+    ffmpeg_cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-map', '0', '-c', 'copy',
+                  '-f', 'segment', '-segment_time', str(segment_seconds), '-reset_timestamps', '1',
+                  os.path.join(segment_dir, 'seg_%05d.ts')]
+
+    def run():
+        logger.info(f"[分段下载] {' '.join(ytdlp_cmd)} | {' '.join(ffmpeg_cmd)}")
+        try:
+            downloader = subprocess.Popen(ytdlp_cmd, stdout=subprocess.PIPE, creationflags=creationflags)
+            segmenter = subprocess.Popen(ffmpeg_cmd, stdin=downloader.stdout, creationflags=creationflags)
+            downloader.stdout.close() # ffmpeg 退出时 yt-dlp 能收到 SIGPIPE
+            segmenter.wait()
+            downloader.wait()
+            if downloader.returncode != 0 or segmenter.returncode != 0:
+                logger.error(f"[分段下载] 下载或分段失败 (yt-dlp: {downloader.returncode}, ffmpeg: {segmenter.returncode})")
+        except FileNotFoundError as e:
+            logger.error(f"[分段下载] 未找到 yt-dlp 或 ffmpeg: {e}")
+        finally:
+            # 失败时也写结束标记，分析端不会一直等待
+            open(os.path.join(segment_dir, end_marker), 'w').close()
+            logger.info(f"[分段下载] 完成: {segment_dir}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def simulate_live_download(source_dir, segment_dir, interval_seconds=5.0, end_marker=DEFAULT_END_MARKER):
+    """
+    测试用: 把 source_dir 中预先录好的分段按文件名顺序每隔 interval_seconds 复制一个到 segment_dir，
+    全部复制后写入 end_marker，模拟直播下载。返回后台线程。
+    """
+    os.makedirs(segment_dir, exist_ok=True)
+    names = sorted(f for f in os.listdir(source_dir) if f.lower().endswith(SEGMENT_EXTENSIONS))
+
+    def run():
+        for name in names:
+            tmp_path = os.path.join(segment_dir, name + ".partial")
+            shutil.copyfile(os.path.join(source_dir, name), tmp_path)
+            os.replace(tmp_path, os.path.join(segment_dir, name))
+            logger.info(f"[模拟下载] 写入分段 {name}")
+            time.sleep(interval_seconds)
+        open(os.path.join(segment_dir, end_marker), 'w').close()
+        logger.info(f"[模拟下载] 全部 {len(names)} 个分段已写入，结束标记: {end_marker}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+class ProfiledCapture:
+    """
+    包装一个帧来源，把 read/grab/read_keyframe 的耗时 (seek + 解码) 和次数记入 profiler (stage_profiler.StageProfiler)。
+    read_keyframe 只在被包装的帧来源有这个方法时存在，hasattr(cap, "read_keyframe") 的判断不变。
+    """
+
+    def __init__(self, cap, profiler):
+        self.cap = cap
+        self.profiler = profiler
+        if hasattr(cap, "read_keyframe"):
+            self.read_keyframe = self._read_keyframe
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.profiler.count("seek_requests")
+        return self.cap.set(prop_id, value)
+
+    def read(self):
+        t0 = time.perf_counter()
+        ret, frame = self.cap.read()
+        self.profiler.add("decode", t0)
+        self.profiler.count("frames_read")
+        return ret, frame
+
+    def grab(self):
+        t0 = time.perf_counter()
+        ret = self.cap.grab()
+        self.profiler.add("decode", t0)
+        self.profiler.count("frames_grabbed")
+        return ret
+
+    def _read_keyframe(self, target, min_index=-1):
+        t0 = time.perf_counter()
+        result = self.cap.read_keyframe(target, min_index)
+        self.profiler.add("decode", t0)
+        self.profiler.count("keyframes_read")
+        return result
+
+    def decoder_stats(self):
+        """PyAVCapture 的实际 seek 次数和解码帧数；OpenCV 不提供时为空 dict。"""
+        stats = {}
+        if hasattr(self.cap, "seek_count"):
+            stats["container_seeks"] = self.cap.seek_count
+        if hasattr(self.cap, "decoded_frames"):
+            stats["frames_decoded"] = self.cap.decoded_frames
+        return stats
+
+    def release(self):
+        self.cap.release()
+
+
+# 进程内解码 (PyAV): 与 cv2.VideoCapture 接口相同，可以作为 find_shooting_moments 的帧来源。
+# - 解码器开启多线程 (thread_type="AUTO": 帧级 + 片级)，OpenCV 的 FFmpeg 后端默认只用片级线程；
+# - set(POS_FRAMES) 不立即 seek: 目标帧在一个 GOP 以内时继续向后解码，更远或向前时才 seek 到关键帧；
+# - 跳到目标帧的过程中，目标之前的非参考帧 (不被其他帧引用的 B 帧) 直接不解码 (skip_frame=NONREF)，
+#   目标之前的帧也不做颜色转换，grab() 完全不转换；
+# - gray=True 时 read() 直接返回解码器输出的亮度平面 (Y)，整帧不做 YUV->BGR 转换，
+#   ROI 已经是二维灰度，_to_gray 不再需要 cvtColor。Y 与 BGR 转灰度只差一个线性的范围映射
+#   (16-235 / 0-255)，ROI 都用 Otsu 自动阈值二值化，结果不受影响。
+# - read_keyframe() 只解码关键帧: 其他数据包只读取不送入解码器，关键帧不依赖其他帧，
+#   粗扫描 (find_shooting_moments(keyframe_coarse=True)) 每个采样点只解码一帧，不需要 seek。
+
+DECODE_BACKENDS = ("opencv", "pyav")
+# 第一个平面就是 8 位亮度 (Y) 的像素格式，可以不经转换直接使用
+LUMA_PLANE_FORMATS = ('yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p',
+                      'yuv440p', 'yuvj440p', 'yuv411p', 'nv12', 'nv21', 'gray')
+
+
+def pyav_available():
+    return av is not None
+
+
+def luma_plane(frame):
+    """PyAV 视频帧的亮度平面 (二维 uint8，不复制)；其他像素格式 (10 位等) 由 swscale 转为灰度。"""
+    if frame.format.name not in LUMA_PLANE_FORMATS:
+        return frame.to_ndarray(format='gray')
+    plane = frame.planes[0]
+    # 每行末尾可能有对齐用的填充 (line_size >= width)，切片去掉
+    return np.frombuffer(plane, np.uint8).reshape(frame.height, plane.line_size)[:, :frame.width]
+
+
+class PyAVCapture:
+    """
+    用 PyAV 解码 video_path 的第一个视频流。帧号按 pts 和平均帧率换算 (与 OpenCV 相同，假定恒定帧率)。
+    不是线程安全的，每个线程使用自己的 PyAVCapture。
+    """
+
+    def __init__(self, video_path, gray=False, thread_type="AUTO", thread_count=0):
+        if av is None:
+            raise RuntimeError("PyAV 未安装 (pip install av)，无法使用 pyav 解码后端。")
+        self.video_path = video_path
+        self.gray = gray
+        self.container = None
+        self.seek_count = 0 # 容器 seek 次数 (find_shooting_moments 的阶段耗时统计使用)
+        self.decoded_frames = 0 # 解码器实际输出的帧数 (包括跳到目标帧途中解码的帧)
+        try:
+            self.container = av.open(video_path)
+            self.stream = self.container.streams.video[0]
+        except (av.error.FFmpegError, IndexError) as e: # 打不开时与 OpenCV 一样由 isOpened() 返回 False
+            logger.error(f"[PyAV解码] 无法打开视频 {video_path}: {e}")
+            if self.container is not None:
+                self.container.close()
+            self.container = None
+            return
+        self.stream.thread_type = thread_type
+        self.stream.codec_context.thread_count = thread_count # 0: 按 CPU 核数自动决定
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 0.0
+        self.time_base = self.stream.time_base
+        self.start_pts = self.stream.start_time or 0
+        if self.stream.frames:
+            self.frame_count = int(self.stream.frames)
+        elif self.stream.duration:
+            self.frame_count = int(round(float(self.stream.duration * self.time_base) * self.fps))
+        elif self.container.duration:
+            self.frame_count = int(round(self.container.duration / av.time_base * self.fps))
+        else:
+            self.frame_count = 0
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        self.gop_frames = max(1, int(round(self.fps * 2))) # 关键帧间隔的估计值，解码时按观察到的最大间隔更新
+        self.pos = 0
+        self._packets = None
+        self._pending = deque() # 已解码但还没有返回的帧 [(帧号, frame)]
+        self._next_index = None # 解码器下一个输出的帧号，None 表示需要 seek
+        self._last_key_index = None
+        self._key_packets = None # read_keyframe 使用的数据包迭代器
+        self._key_held = None # 上次读过头的关键帧 (帧号, packet)
+        self._key_consumed_to = None # 已经读过的最后一个关键帧的帧号 (不含 _key_held)
+
+    def isOpened(self):
+        return self.container is not None
+
+    def get(self, prop_id):
+        if self.container is None:
+            return 0.0
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.pos = max(0, int(value))
+            return True
+        return False
+
+    def _frame_index(self, pts):
+        return int(round(float((pts - self.start_pts) * self.time_base) * self.fps))
+
+    def _seek(self, target):
+        # seek 到目标之前最近的关键帧，之后重新解码
+        target_pts = int(target / self.fps / self.time_base) + self.start_pts
+        self.container.seek(target_pts, stream=self.stream, backward=True, any_frame=False)
+        self.seek_count += 1
+        self.stream.codec_context.flush_buffers()
+        self._packets = self.container.demux(self.stream)
+        self._pending.clear()
+        self._next_index = None
+        self._last_key_index = None
+        self._key_packets = None # 与 read_keyframe 共用容器，seek 后它的位置失效
+
+    def _decode_to(self, target):
+        """返回帧号 >= target 的第一帧 (帧号, frame)，视频结束时返回 None。"""
+        if self.container is None:
+            return None
+        if self._next_index is None or target < self._next_index or target - self._next_index > self.gop_frames:
+            self._seek(target)
+        codec_context = self.stream.codec_context
+        while True:
+            while self._pending:
+                index, frame = self._pending.popleft()
+                self._next_index = index + 1
+                if frame.key_frame:
+                    if self._last_key_index is not None and 0 < index - self._last_key_index < self.fps * 20:
+                        self.gop_frames = max(self.gop_frames, index - self._last_key_index)
+                    self._last_key_index = index
+                if index >= target:
+                    return index, frame
+            try:
+                packet = next(self._packets)
+            except StopIteration:
+                return None
+            # 目标之前的非参考帧没有其他帧依赖，不需要解码
+            if packet.pts is not None and self._frame_index(packet.pts) < target:
+                codec_context.skip_frame = "NONREF"
+            else:
+                codec_context.skip_frame = "DEFAULT"
+            try:
+                frames = codec_context.decode(packet) # 最后的空数据包会取出解码器中剩余的帧
+            except av.error.FFmpegError as e:
+                logger.warning(f"[PyAV解码] 解码错误，跳过一个数据包: {e}")
+                continue
+            self.decoded_frames += len(frames)
+            for frame in frames:
+                if frame.pts is not None:
+                    self._pending.append((self._frame_index(frame.pts), frame))
+
+    def _seek_keyframes(self, min_index):
+        target_pts = int((min_index + 1) / self.fps / self.time_base) + self.start_pts
+        self.container.seek(target_pts, stream=self.stream, backward=True, any_frame=False)
+        self.seek_count += 1
+        self._key_packets = self.container.demux(self.stream)
+        self._key_held = None
+        self._key_consumed_to = min_index
+        self._packets = None # 普通读取下一次需要重新 seek
+        self._pending.clear()
+        self._next_index = None
+
+    def _decode_keyframe(self, index, packet):
+        # 单独解码一个关键帧: 送入数据包后立即取出 (flush)，再重置解码器
+        codec_context = self.stream.codec_context
+        codec_context.skip_frame = "DEFAULT"
+        try:
+            frames = list(codec_context.decode(packet)) + list(codec_context.decode(None))
+        except av.error.FFmpegError as e:
+            logger.warning(f"[PyAV解码] 关键帧 {index} 解码错误: {e}")
+            frames = []
+        codec_context.flush_buffers()
+        self.decoded_frames += len(frames)
+        self._key_consumed_to = index
+        if not frames:
+            return False, None, index
+        self.pos = index + 1
+        return True, self._to_ndarray(frames[0]), index
+
+    def read_keyframe(self, target, min_index=-1):
+        """
+        只解码关键帧。返回 (ret, frame, 帧号)：帧号为 (min_index, target] 中最后一个关键帧，
+        这个范围内没有关键帧时为 target 之后的第一个关键帧。按帧号递增调用时不会 seek。
+        """
+        if self.container is None:
+            return False, None, -1
+        if (self._key_packets is None or self._key_consumed_to is None or min_index < self._key_consumed_to
+                or min_index - self._key_consumed_to > 4 * self.gop_frames):
+            self._seek_keyframes(min_index)
+        candidate = None
+        held, self._key_held = self._key_held, None
+        if held is not None and held[0] > min_index:
+            if held[0] > target:
+                return self._decode_keyframe(*held)
+            candidate = held
+        for packet in self._key_packets:
+            if not packet.is_keyframe or packet.pts is None:
+                continue
+            index = self._frame_index(packet.pts)
+            if index <= min_index:
+                continue
+            if index <= target:
+                candidate = (index, packet)
+                continue
+            if candidate is None:
+                return self._decode_keyframe(index, packet)
+            self._key_held = (index, packet)
+            break
+        if candidate is None:
+            return False, None, -1
+        return self._decode_keyframe(*candidate)
+
+    def _to_ndarray(self, frame):
+        return luma_plane(frame) if self.gray else frame.to_ndarray(format='bgr24')
+
+    def read(self):
+        decoded = self._decode_to(self.pos)
+        if decoded is None:
+            return False, None
+        index, frame = decoded
+        self.pos = index + 1
+        return True, self._to_ndarray(frame)
+
+    def grab(self):
+        decoded = self._decode_to(self.pos)
+        if decoded is None:
+            return False
+        self.pos = decoded[0] + 1
+        return True
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+def open_frame_source(video_path, backend="opencv", gray=False):
+    """
+    按解码后端打开视频: "opencv" 返回 cv2.VideoCapture，"pyav" 返回 PyAVCapture。
+    gray 只对 pyav 有效。PyAV 未安装时记录警告并使用 OpenCV。
+    """
+    if backend == "pyav":
+        if av is not None:
+            return PyAVCapture(video_path, gray=gray)
+        logger.warning("[解码后端] PyAV 未安装 (pip install av)，改用 OpenCV 解码。")
+    elif backend != "opencv":
+        logger.warning(f"[解码后端] 未知的解码后端 {backend}，使用 OpenCV 解码。")
+    return cv2.VideoCapture(video_path)
+
+
+def benchmark_decode_backends(video_path, output_path=None, step_seconds=3.0, max_reads=300, fine_reads=0):
+    """
+    在同一个视频上比较解码后端: 按粗扫描的方式每隔 step_seconds 秒 set(POS_FRAMES) + read() 一帧，
+    fine_reads > 0 时每个位置之后再按顺序读 fine_reads 帧 (相当于精扫描)。
+    比较 opencv、pyav (BGR)、pyav_gray (亮度平面)、pyav_keyframe (只解码关键帧的粗扫描，不含 fine_reads)，
+    返回 {方式: 每秒读取的帧数}；
+    output_path 不为 None 时结果同时写入 JSON 文件。
+    """
+    variants = [("opencv", "opencv", False)]
+    if av is not None:
+        variants += [("pyav", "pyav", False), ("pyav_gray", "pyav", True), ("pyav_keyframe", "pyav", True)]
+    else:
+        logger.warning("[解码后端测试] PyAV 未安装，只测试 OpenCV。")
+    results = {}
+    positions = 0
+    for name, backend, gray in variants:
+        cap = open_frame_source(video_path, backend, gray)
+        if not cap.isOpened():
+            logger.error(f"[解码后端测试] {name}: 无法打开视频 {video_path}")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, int(fps * step_seconds))
+        frames_read = 0
+        positions = 0
+        started = time.perf_counter()
+        if name == "pyav_keyframe":
+            key_frame_num = -step
+            while key_frame_num + step < total_frames and positions < max_reads:
+                ret, _frame, key_frame_num = cap.read_keyframe(key_frame_num + step, key_frame_num)
+                if not ret:
+                    break
+                frames_read += 1
+                positions += 1
+        for frame_num in range(0, total_frames, step):
+            if name == "pyav_keyframe" or positions >= max_reads:
+                break
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            for _ in range(1 + fine_reads):
+                ret, _frame = cap.read()
+                if not ret:
+                    break
+                frames_read += 1
+            positions += 1
+        elapsed = time.perf_counter() - started
+        cap.release()
+        results[name] = round(frames_read / elapsed, 2) if elapsed > 0 else 0.0
+        logger.info(f"[解码后端测试] {name}: {positions} 个位置, {frames_read} 帧, {elapsed:.2f}s, {results[name]} 帧/秒")
+    if output_path is not None:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({"video": os.path.abspath(video_path), "step_seconds": step_seconds, "positions": positions,
+                       "fine_reads": fine_reads, "frames_per_second": results, "created": time.time()},
+                      f, ensure_ascii=False, indent=2)
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="比较 OpenCV 和 PyAV 两种解码后端在同一个视频上的速度")
+    parser.add_argument("video_path")
+    parser.add_argument("--output", default="decode_backend_benchmark.json")
+    parser.add_argument("--step", type=float, default=3.0, help="两次 seek 之间的秒数 (粗扫描间隔)")
+    parser.add_argument("--reads", type=int, default=300, help="最多 seek 的位置数")
+    parser.add_argument("--fine-reads", type=int, default=0, help="每个位置之后顺序读取的帧数")
+    args = parser.parse_args(argv)
+    print(benchmark_decode_backends(args.video_path, args.output, args.step, args.reads, args.fine_reads))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
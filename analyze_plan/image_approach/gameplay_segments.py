@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+import cv2
+
+from analysis_functions import (
+    _analysis_scale, _resolve_rois, build_template_pyramid, _load_weapon_template_paths, _identify_active_weapon,
+)
+from frame_sources import open_frame_source
+from general_function import seconds_to_hms, read_time_windows
+from interval_functions import merge_intervals
+
+logger = logging.getLogger(__name__)
+
+# 游戏画面分段: 分析前用很低的采样率 (默认每 10 秒一帧) 检查武器ROI中是否有任意武器模板 (HUD 武器栏)，
+# 有武器的采样点前后各加 pad_seconds，间隔不超过 merge_gap_seconds 的合并为一段。
+# 杂谈、排队、大厅、回放等没有 HUD 的部分不在分段内，find_shooting_moments 和音频分析只处理分段内的时间。
+# 结果保存在视频输出目录的 gameplay_segments.txt (每行 HH:MM:SS.mmm - HH:MM:SS.mmm，与 candidate_windows.txt 相同)，
+# gameplay_segments.json 记录视频大小、修改时间和参数，都相同时直接读取 txt，不重新扫描。
+# 没有检测到 HUD 时只写 gameplay_segments.json (no_hud: true，不写 txt)，视频和参数不变时下次也不重新扫描，直接分析整个视频。
+
+GAMEPLAY_SEGMENTS_FILENAME = "gameplay_segments.txt"
+GAMEPLAY_SEGMENTS_INFO_FILENAME = "gameplay_segments.json"
+
+
+def _segments_info(video_path, params):
+    stat = os.stat(video_path)
+    return {"video": os.path.basename(video_path), "size": stat.st_size, "mtime": stat.st_mtime, "params": params}
+
+
+def _load_segments_info(video_output_dir, video_path, params):
+    # gameplay_segments.json 中视频和参数都没有变化时返回其内容，否则返回 None
+    try:
+        with open(os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_INFO_FILENAME), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    expected = _segments_info(video_path, params)
+    if any(info.get(key) != value for key, value in expected.items()):
+        return None
+    return info
+
+
+def load_gameplay_segments(video_output_dir, video_path=None, params=None):
+    """
+    读取已保存的游戏画面分段 [(start_sec, end_sec)]；不存在 (或上次没有检测到 HUD) 时返回 None。
+    给出 video_path 和 params 时只有视频和参数都没有变化才返回。
+    """
+    segments_path = os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_FILENAME)
+    if not os.path.exists(segments_path):
+        return None
+    if video_path is not None and _load_segments_info(video_output_dir, video_path, params) is None:
+        return None
+    return read_time_windows(segments_path)
+
+
+def segment_gameplay(video_path, video_output_dir, root_pic_template_dir,
+                     weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2,
+                     presence_threshold=0.4, sample_interval_seconds=10.0, merge_gap_seconds=90.0, pad_seconds=15.0,
+                     proxy_info=None, decode_backend="opencv", reuse=True, roi_normalized=False):
+    """
+    返回游戏画面分段 [(start_sec, end_sec)] 并保存到 video_output_dir。
+    presence_threshold: 武器ROI与任意武器模板的 IoU 超过这个值就认为 HUD 在画面上 (比武器激活阈值宽松)。
+    一个采样点都没有检测到 HUD 时 (ROI 或模板不对) 返回 None，调用方应分析整个视频；
+    这个结果同样保存在 gameplay_segments.json 中，视频和参数不变时不再重新扫描。
+    """
+    params = {"weapon_roi": [weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2], "roi_normalized": roi_normalized,
+              "presence_threshold": presence_threshold, "sample_interval_seconds": sample_interval_seconds,
+              "merge_gap_seconds": merge_gap_seconds, "pad_seconds": pad_seconds}
+    if reuse:
+        info = _load_segments_info(video_output_dir, video_path, params)
+        if info is not None and info.get("no_hud"):
+            logger.info(f"[游戏画面分段] 上次扫描 ({info.get('samples')} 个采样点) 没有检测到 HUD 武器栏，视频和参数未变化，分析整个视频。")
+            return None
+        segments = load_gameplay_segments(video_output_dir, video_path, params)
+        if segments is not None:
+            logger.info(f"[游戏画面分段] 使用已保存的分段: {len(segments)} 段, 共 {sum(e - s for s, e in segments):.0f} 秒")
+            return segments
+
+    cap = open_frame_source(video_path, decode_backend, gray=True)
+    if not cap.isOpened():
+        logger.error(f"[游戏画面分段] 无法打开视频 {video_path}")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if not fps or total_frames <= 0:
+        logger.error(f"[游戏画面分段] 无法读取视频FPS或总帧数 {video_path}")
+        cap.release()
+        return None
+    duration = total_frames / fps
+
+    frame_width, frame_height, template_scale = _analysis_scale(cap, proxy_info)
+    weapon_roi, _, _ = _resolve_rois(frame_width, frame_height, (weapon_roi_x1, weapon_roi_y1, weapon_roi_x2, weapon_roi_y2), 0, [], proxy_info, roi_normalized)
+    roi_x1, roi_y1, roi_x2, roi_y2 = (int(v) for v in weapon_roi)
+    build_template_pyramid(root_pic_template_dir, template_scale)
+    weapon_template_paths = _load_weapon_template_paths(root_pic_template_dir)
+    if not weapon_template_paths:
+        logger.error("[游戏画面分段] 没有武器模板，无法分段。")
+        cap.release()
+        return None
+
+    started = time.perf_counter()
+    step = max(1, int(fps * sample_interval_seconds))
+    use_keyframes = hasattr(cap, "read_keyframe") # PyAV: 每个采样点只解码一个关键帧
+    present_ms = []
+    samples = 0
+    frame_num, prev_frame_num = 0, -step
+    while frame_num < total_frames:
+        if use_keyframes:
+            ret, frame, frame_num = cap.read_keyframe(frame_num, prev_frame_num)
+        else:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            ret, frame = cap.read()
+        if not ret:
+            break
+        samples += 1
+        if _identify_active_weapon(frame, weapon_template_paths, roi_x1, roi_y1, roi_x2, roi_y2, presence_threshold, template_scale):
+            present_ms.append(int(round(frame_num / fps * 1000)))
+        prev_frame_num = frame_num
+        frame_num += step
+    cap.release()
+
+    if not present_ms:
+        logger.warning(f"[游戏画面分段] {samples} 个采样点都没有检测到 HUD 武器栏，请检查武器ROI；将分析整个视频。")
+        if samples:
+            # 一帧都没有读到时不保存 (下次重新扫描)；删除旧的分段，音频分析等读取 txt 的地方也会分析整个视频
+            os.makedirs(video_output_dir, exist_ok=True)
+            segments_path = os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_FILENAME)
+            if os.path.exists(segments_path):
+                os.remove(segments_path)
+            info = _segments_info(video_path, params)
+            info.update({"no_hud": True, "segments": 0, "duration": round(duration, 3), "samples": samples,
+                         "present_samples": 0, "created": time.time()})
+            with open(os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_INFO_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False, indent=2)
+        return None
+    intervals = merge_intervals(np.array(present_ms, dtype=np.int64), merge_gap_ms=int(merge_gap_seconds * 1000),
+                                pre_ms=int(pad_seconds * 1000), post_ms=int(pad_seconds * 1000))
+    segments = [(start / 1000.0, min(duration, end / 1000.0))
+                for start, end in zip(intervals["start_ms"].tolist(), intervals["end_ms"].tolist())]
+
+    os.makedirs(video_output_dir, exist_ok=True)
+    with open(os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_FILENAME), 'w', encoding='utf-8') as f:
+        for start, end in segments:
+            f.write(f"{seconds_to_hms(start)} - {seconds_to_hms(end)}\n")
+    gameplay_seconds = sum(end - start for start, end in segments)
+    info = _segments_info(video_path, params)
+    info.update({"segments": len(segments), "gameplay_seconds": round(gameplay_seconds, 3), "duration": round(duration, 3),
+                 "samples": samples, "present_samples": len(present_ms), "created": time.time()})
+    with open(os.path.join(video_output_dir, GAMEPLAY_SEGMENTS_INFO_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+    logger.info(f"[游戏画面分段] {samples} 个采样点 ({time.perf_counter() - started:.1f}s): {len(segments)} 段游戏画面, "
+                f"共 {gameplay_seconds:.0f} / {duration:.0f} 秒 ({gameplay_seconds / duration:.0%})")
+    return segments
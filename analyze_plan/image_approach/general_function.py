@@ -3,6 +3,7 @@ import subprocess
 from urllib.parse import urlparse
 import logging
 import re
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -25,17 +26,7 @@ def download_twitch(video_url, outputfile, start_time=None, end_time=None, strea
         logger.info(f"{final_file_mp4} 已存在，跳过下载。")
         return final_file_mp4
 
-    command = [
-        'yt-dlp', video_url,
-        '-f', stream,
-        # '--remux-video', 'mp4', # Alternative to --merge-output-format if issues
-        '-o', final_file_mp4, # 直接使用最终的mp4文件名
-        '--merge-output-format', 'mp4', # Ensures output is mp4 after download and merge
-    ]
-    if start_time and end_time:
-        command += ['--download-sections', f"*{start_time}-{end_time}"]
-        # If using --download-sections, yt-dlp might output to a temp name then rename.
-        # The -o template should still work for the final name.
+    command = build_download_command(video_url, final_file_mp4, start_time, end_time, stream)
 
     try:
         logger.info(f"执行下载命令: {' '.join(command)}")
@@ -57,6 +48,22 @@ def download_twitch(video_url, outputfile, start_time=None, end_time=None, strea
         logger.error("错误：未找到 yt-dlp，请确保已安装并配置环境变量")
     return None
 
+def build_download_command(video_url, final_file_mp4, start_time=None, end_time=None, stream='bestvideo+bestaudio/best', downloader_cmd=None):
+    # downloader_cmd: 替代 'yt-dlp' 的命令前缀 (列表)，例如用于测试的本地假下载器
+    command = list(downloader_cmd) if downloader_cmd else ['yt-dlp']
+    command += [
+        video_url,
+        '-f', stream,
+        # '--remux-video', 'mp4', # Alternative to --merge-output-format if issues
+        '-o', final_file_mp4, # 直接使用最终的mp4文件名
+        '--merge-output-format', 'mp4', # Ensures output is mp4 after download and merge
+    ]
+    if start_time and end_time:
+        command += ['--download-sections', f"*{start_time}-{end_time}"]
+        # If using --download-sections, yt-dlp might output to a temp name then rename.
+        # The -o template should still work for the final name.
+    return command
+
 def seconds_to_hms(seconds):
     if not isinstance(seconds, (int, float)):
         raise TypeError(f"Input 'seconds' must be a number, got {type(seconds)}")
@@ -120,6 +127,119 @@ def hms_to_seconds(time_str):
         raise ValueError(f"解析时间字符串 '{time_str}' 时出错: {e}")
 
 
+# 批量转换: 整个时间文件一次解析为毫秒整数数组 (np.int64)，格式/范围检查与 hms_to_seconds 相同。
+# 标准的定宽行 (H..H:MM:SS.mmm) 按长度分组，拼成 uint8 矩阵后用 NumPy 列运算一次解析；
+# 其他写法 (毫秒位数不同、非 ASCII 等) 或范围错误的行交给 hms_to_seconds，结果和错误信息与逐行解析相同。
+
+def _fixed_width_hms_to_ms(lines, width):
+    hour_digits = width - 10
+    raw = np.frombuffer("".join(lines).encode('ascii'), dtype=np.uint8).reshape(-1, width)
+    digits = raw.astype(np.int64) - 48
+    separator_cols = [hour_digits, hour_digits + 3, hour_digits + 6]
+    digit_cols = [c for c in range(width) if c not in separator_cols]
+    valid = (raw[:, hour_digits] == 58) & (raw[:, hour_digits + 3] == 58) & (raw[:, hour_digits + 6] == 46) # ':' ':' '.'
+    valid &= ((digits[:, digit_cols] >= 0) & (digits[:, digit_cols] <= 9)).all(axis=1)
+    hours = digits[:, :hour_digits] @ (10 ** np.arange(hour_digits - 1, -1, -1, dtype=np.int64))
+    minutes = digits[:, hour_digits + 1] * 10 + digits[:, hour_digits + 2]
+    seconds = digits[:, hour_digits + 4] * 10 + digits[:, hour_digits + 5]
+    millis = digits[:, hour_digits + 7] * 100 + digits[:, hour_digits + 8] * 10 + digits[:, hour_digits + 9]
+    valid &= (minutes <= 59) & (seconds <= 59)
+    return hours * 3600000 + minutes * 60000 + seconds * 1000 + millis, valid
+
+
+def hms_lines_to_ms(lines):
+    """
+    批量解析 HH:MM:SS.mmm 字符串 (已去掉首尾空白)。
+    返回 (毫秒数组 np.int64, errors)，errors 为 {行下标: 错误信息}，错误行在数组中为 -1。
+    """
+    n = len(lines)
+    ms = np.full(n, -1, dtype=np.int64)
+    parsed = np.zeros(n, dtype=bool)
+    lengths = np.fromiter((len(line) if line.isascii() else 0 for line in lines), dtype=np.int64, count=n)
+    for width in np.unique(lengths[lengths >= 12]).tolist():
+        idx = np.flatnonzero(lengths == width)
+        group_ms, group_valid = _fixed_width_hms_to_ms([lines[i] for i in idx.tolist()], width)
+        ms[idx[group_valid]] = group_ms[group_valid]
+        parsed[idx[group_valid]] = True
+
+    errors = {}
+    for i in np.flatnonzero(~parsed).tolist():
+        try:
+            ms[i] = int(round(hms_to_seconds(lines[i]) * 1000))
+        except ValueError as e:
+            errors[i] = str(e)
+    return ms, errors
+
+
+def read_hms_file(file_path, warn_invalid=True):
+    """
+    读取每行一个 HH:MM:SS.mmm 的时间文件 (空行跳过)。
+    返回 (毫秒数组, 原始字符串列表, 行号列表)，只包含有效行；无效行记录警告后跳过。
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        numbered = [(line_num, line.strip()) for line_num, line in enumerate(f, 1) if line.strip()]
+    lines = [line for _, line in numbered]
+    ms, errors = hms_lines_to_ms(lines)
+    if errors:
+        if warn_invalid:
+            for i, message in errors.items():
+                logger.warning(f"解析时间戳 '{lines[i]}' 错误 (来自 {os.path.basename(file_path)}, 行 {numbered[i][0]}): {message}。跳过此时间戳。")
+        keep = np.ones(len(lines), dtype=bool)
+        keep[list(errors)] = False
+        ms = ms[keep]
+        lines = [line for line, k in zip(lines, keep) if k]
+        numbered = [item for item, k in zip(numbered, keep) if k]
+    return ms, lines, [line_num for line_num, _ in numbered]
+
+
+def seconds_array_to_ms(seconds):
+    """秒 (浮点数或数组) 转为毫秒整数数组，四舍五入到毫秒。"""
+    return np.round(np.asarray(seconds, dtype=np.float64) * 1000.0).astype(np.int64)
+
+
+def _hms_text_block(ms):
+    # 0 <= 时间 < 100 小时时用 uint8 矩阵一次生成 "HH:MM:SS.mmm\n" 文本块，否则返回 None
+    if ms.size == 0 or ms.min() < 0 or ms.max() >= 100 * 3600000:
+        return None
+    hours, minutes, seconds, millis = ms // 3600000, ms // 60000 % 60, ms // 1000 % 60, ms % 1000
+    out = np.empty((ms.size, 13), dtype=np.uint8)
+    out[:, 0], out[:, 1] = hours // 10, hours % 10
+    out[:, 3], out[:, 4] = minutes // 10, minutes % 10
+    out[:, 6], out[:, 7] = seconds // 10, seconds % 10
+    out[:, 9], out[:, 10], out[:, 11] = millis // 100, millis // 10 % 10, millis % 10
+    out += 48
+    out[:, 2] = out[:, 5] = 58 # ':'
+    out[:, 8] = 46 # '.'
+    out[:, 12] = 10 # '\n'
+    return out.tobytes().decode('ascii')
+
+
+def ms_to_hms_strings(ms):
+    """毫秒整数数组批量格式化为 HH:MM:SS.mmm 字符串列表 (负数加 '-')。"""
+    ms = np.asarray(ms, dtype=np.int64).ravel()
+    block = _hms_text_block(ms)
+    if block is not None:
+        return block.split('\n')[:-1]
+    magnitude = np.abs(ms)
+    hours = (magnitude // 3600000).tolist()
+    minutes = (magnitude // 60000 % 60).tolist()
+    seconds = (magnitude // 1000 % 60).tolist()
+    millis = (magnitude % 1000).tolist()
+    signs = np.where(ms < 0, '-', '').tolist()
+    return [f"{sign}{h:02d}:{m:02d}:{s:02d}.{f:03d}" for sign, h, m, s, f in zip(signs, hours, minutes, seconds, millis)]
+
+
+def write_hms_file(file_path, ms):
+    """把毫秒数组按 HH:MM:SS.mmm 一行一个写入文件 (一次写入)。返回行数。"""
+    ms = np.asarray(ms, dtype=np.int64).ravel()
+    block = _hms_text_block(ms)
+    if block is None:
+        block = "".join(f"{line}\n" for line in ms_to_hms_strings(ms))
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(block)
+    return ms.size
+
+
 def hmsff_to_seconds(hmsff_str):
     # This function expects HH:MM:SS:FF where FF might be frames or another unit.
     # The original implementation assumed FF was /60.0, which is like seconds.
@@ -158,4 +278,34 @@ def hmsff_to_seconds(hmsff_str):
         if "in '{hmsff_str}'" in str(e) or "Time string" in str(e): raise # If it's one of our custom messages
         raise ValueError(f"Error parsing components of time string '{hmsff_str}': {e}") # General parsing error
     except Exception as e: # Catch any other unexpected error
-        raise ValueError(f"Unexpected error parsing time string '{hmsff_str}': {e}")
\ No newline at end of file
+        raise ValueError(f"Unexpected error parsing time string '{hmsff_str}': {e}")
+
+def read_time_windows(windows_file):
+    # 读取 "HH:MM:SS.mmm - HH:MM:SS.mmm" 格式的时间窗口文件 (与 infinite_2.txt 相同)，返回排序并合并重叠后的 [(start_sec, end_sec)]
+    windows = []
+    with open(windows_file, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(' - ')
+            if len(parts) != 2:
+                logger.warning(f"时间窗口格式错误 (行 {line_num}: '{line}'). 需要 'HH:MM:SS.mmm - HH:MM:SS.mmm' 格式。跳过此行。")
+                continue
+            try:
+                start_sec = hms_to_seconds(parts[0].strip())
+                end_sec = hms_to_seconds(parts[1].strip())
+            except ValueError as e:
+                logger.warning(f"解析时间窗口 (行 {line_num}: '{line}') 错误: {e}。跳过此行。")
+                continue
+            if end_sec > start_sec:
+                windows.append((start_sec, end_sec))
+
+    windows.sort()
+    merged_windows = []
+    for start_sec, end_sec in windows:
+        if merged_windows and start_sec <= merged_windows[-1][1]:
+            merged_windows[-1] = (merged_windows[-1][0], max(merged_windows[-1][1], end_sec))
+        else:
+            merged_windows.append((start_sec, end_sec))
+    return merged_windows
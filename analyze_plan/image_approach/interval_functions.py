@@ -0,0 +1,96 @@
+import os
+import logging
+import numpy as np
+
+from general_function import read_hms_file
+
+logger = logging.getLogger(__name__)
+
+# 所有剪辑模式共用的区间合并: 时间统一为毫秒整数数组 (np.int64)，
+# 排序 -> 相邻事件间隔 <= merge_gap_ms 的归为一组 -> 每组 [首个事件 - pre_ms, 最后事件 + post_ms]。
+# 分组和每组包含的武器都用 NumPy 一次算出，Python 循环只剩下每组一次的 ffmpeg 调用。
+
+
+def read_weapon_time_sources(weapon_time_sources, log_skipped=True):
+    """
+    读取多个武器的时间文件。weapon_time_sources: [{'file_path', 'weapon_name'}]。
+    返回 (times_ms, labels, weapon_names, hms_strings)：labels[i] 是 weapon_names 中的下标，
+    hms_strings 为文件中的原始字符串；顺序为文件顺序 (未排序)。
+    """
+    times_parts, label_parts, weapon_names, hms_strings = [], [], [], []
+    for source_info in weapon_time_sources:
+        file_path = source_info['file_path']
+        weapon_name = source_info['weapon_name']
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            if log_skipped:
+                logger.info(f"时间文件 {os.path.basename(file_path)} (武器: {weapon_name}) 不存在或为空，跳过。")
+            continue
+        try:
+            if log_skipped:
+                logger.info(f"读取时间文件: {file_path} (武器: {weapon_name})")
+            times_ms, strings, _ = read_hms_file(file_path) # 整个文件批量解析，无效行记录警告后跳过
+        except Exception as e:
+            logger.error(f"读取时间文件 {file_path} (武器: {weapon_name}) 时出错: {e}")
+            continue
+        if weapon_name not in weapon_names:
+            weapon_names.append(weapon_name)
+        times_parts.append(times_ms)
+        label_parts.append(np.full(times_ms.size, weapon_names.index(weapon_name), dtype=np.int64))
+        hms_strings.extend(strings)
+    if not times_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), weapon_names, hms_strings
+    return np.concatenate(times_parts), np.concatenate(label_parts), weapon_names, hms_strings
+
+
+def merge_intervals(times_ms, merge_gap_ms=0, pre_ms=0, post_ms=0, labels=None, n_labels=None):
+    """
+    把事件时间合并为区间。相邻 (排序后) 两个事件间隔 <= merge_gap_ms 时属于同一组。
+    每组区间为 [max(0, 首个事件 - pre_ms), 最后事件 + post_ms]。
+    返回 dict (数组均为 np.int64，组按时间排序):
+        order: 排序后第 k 个事件在输入中的下标
+        group: 排序后第 k 个事件所属的组号
+        first_index / last_index: 每组首个 / 最后事件在排序后数组中的位置
+        first_ms / last_ms: 每组首个 / 最后事件的时间
+        start_ms / end_ms: 每组区间
+        count: 每组事件数
+        label_mask: labels 不为 None 时，(组数, n_labels) 的 bool 矩阵，表示每组包含哪些标签 (武器)
+    """
+    times_ms = np.asarray(times_ms, dtype=np.int64).ravel()
+    order = np.argsort(times_ms, kind='stable')
+    sorted_ms = times_ms[order]
+    breaks = np.diff(sorted_ms) > merge_gap_ms
+    group = np.concatenate(([0], np.cumsum(breaks))).astype(np.int64) if sorted_ms.size else np.zeros(0, dtype=np.int64)
+    first_index = np.flatnonzero(np.concatenate(([True], breaks))) if sorted_ms.size else np.zeros(0, dtype=np.int64)
+    last_index = np.append(first_index[1:] - 1, sorted_ms.size - 1) if sorted_ms.size else np.zeros(0, dtype=np.int64)
+    first_ms = sorted_ms[first_index]
+    last_ms = sorted_ms[last_index]
+    result = {
+        "order": order,
+        "group": group,
+        "first_index": first_index,
+        "last_index": last_index,
+        "first_ms": first_ms,
+        "last_ms": last_ms,
+        "start_ms": np.maximum(first_ms - pre_ms, 0),
+        "end_ms": last_ms + post_ms,
+        "count": last_index - first_index + 1,
+    }
+    if labels is not None:
+        labels = np.asarray(labels, dtype=np.int64).ravel()
+        if n_labels is None:
+            n_labels = int(labels.max()) + 1 if labels.size else 0
+        label_mask = np.zeros((first_index.size, n_labels), dtype=bool)
+        label_mask[group, labels[order]] = True
+        result["label_mask"] = label_mask
+    return result
+
+
+def unique_sorted_ms(times_ms):
+    """去重并排序 (merge_gap_ms=0 时每组就是一个不同的时间)。"""
+    return merge_intervals(times_ms)["first_ms"]
+
+
+def group_label_names(intervals, label_names):
+    """每组包含的标签名列表 (按 label_names 顺序)。"""
+    label_mask = intervals["label_mask"]
+    return [[label_names[k] for k in np.flatnonzero(row).tolist()] for row in label_mask]
@@ -1,12 +1,11 @@
 import os
 import logging
-from urllib.parse import urlparse
 # 确保 analysis_functions.py 中的函数被导入
 from analysis_functions import (
     find_shooting_moments,
 )
-from general_function import (
-    download_twitch,
+from download_functions import (
+    read_download_jobs, run_download_queue,
 )
 from clip_functions import(
     clip_video_ffmpeg, clip_video_ffmpeg_merged,clip_video_ffmpeg_with_duration,process_and_merge_times
@@ -57,6 +56,7 @@ if __name__ == "__main__":
     COARSE_SCAN_INTERVAL_SECONDS = 3.0
     FINE_SCAN_INTERVAL_SECONDS = 0.1
     START_TIME = "00:00:00.000"
+    DOWNLOAD_WORKERS = 3 # 同时运行的 yt-dlp 下载数
 
     ROOT = "E:\\mande\\0_PLAN"
     URLROOT = "https://www.twitch.tv/videos/"
@@ -103,47 +103,9 @@ if __name__ == "__main__":
         downloaded_video_files_info = []
 
         if os.path.exists(URLPATH):
-            with open(URLPATH, 'r') as f:
-                for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    try:
-                        parts = line.split(',')
-                        video_url = parts[0].strip()
-
-                        parsed_video_id = urlparse(video_url).path.split('/')[-1]
-                        if not parsed_video_id:
-                            parsed_video_id = f"unknown_video_{line_num}"
-                            main_logger.info(f"警告: 无法从URL '{video_url}' 解析出video_id，使用临时代号 '{parsed_video_id}' (主要用于下载日志)")
-
-                        start_time_str = None
-                        end_time_str = None
-                        if len(parts) == 3:
-                            start_time_str = parts[1].strip()
-                            end_time_str = parts[2].strip()
-                            main_logger.info(f"准备下载视频片段: {video_url} 从 {start_time_str} 到 {end_time_str}")
-                            downloaded_file_path = download_twitch(video_url, video_download_base_dir, start_time_str, end_time_str)
-                        elif len(parts) == 1:
-                            main_logger.info(f"准备下载完整视频: {video_url}")
-                            downloaded_file_path = download_twitch(video_url, video_download_base_dir)
-                        else:
-                            main_logger.info(f"警告: URL文件行格式错误: {line}，跳过。")
-                            continue
-
-                        if downloaded_file_path and os.path.exists(downloaded_file_path):
-                            actual_filename = os.path.basename(downloaded_file_path)
-                            downloaded_video_files_info.append({
-                                "parsed_id": parsed_video_id,
-                                "filename": actual_filename,
-                                "path": downloaded_file_path,
-                            })
-                            main_logger.info(f"视频 {parsed_video_id} (文件: {actual_filename}) 已下载或已存在于: {downloaded_file_path}")
-                        else:
-                            main_logger.info(f"视频 {video_url} 未能成功下载或找到。")
-
-                    except Exception as e:
-                        main_logger.error(f"处理URL文件行 '{line}' 时出错: {e}")
+            # 同时运行多个下载，任务状态保存在 downloaded_videos/download_jobs.json，中断后重新运行会续传 .part 文件
+            download_jobs = read_download_jobs(URLPATH)
+            downloaded_video_files_info = run_download_queue(download_jobs, video_download_base_dir, max_workers=DOWNLOAD_WORKERS)
         else:
             main_logger.info(f"错误: video_urls.txt 文件未找到于 {URLPATH}")
         main_logger.info("--- Part 1 完成 ---")
@@ -0,0 +1,232 @@
+import os
+import time
+import queue
+import threading
+import logging
+import subprocess
+
+from analysis_functions import WEAPON_METADATA
+from download_functions import run_download_queue, merge_shot_windows, download_sections_batched
+from general_function import build_download_command, hms_to_seconds
+from clip_functions import (
+    generate_clips_from_multiple_weapon_times,
+    generate_clips_from_multiple_weapon_times_merge,
+    generate_concatenated_video_from_timestamps,
+)
+
+logger = logging.getLogger(__name__)
+
+# 流水线: 下载 -> 分析 -> 剪辑
+# 每个视频下载完成后立即进入分析队列，分析完成后进入剪辑队列，后面的视频仍在下载
+PIPELINE_STAGES = ("download", "analysis", "clip")
+
+
+def collect_weapon_time_sources(video_output_dir, selected_weapon_names):
+    """与 Part 3 相同: 收集 shooting_{suffix}.txt 中非空的武器时间文件。"""
+    weapon_time_sources = []
+    for weapon_name in selected_weapon_names:
+        file_key = WEAPON_METADATA.get(weapon_name, {}).get('suffix', weapon_name)
+        txt_path = os.path.join(video_output_dir, f"shooting_{file_key}.txt")
+        if os.path.exists(txt_path) and os.path.getsize(txt_path) > 0:
+            weapon_time_sources.append({'file_path': txt_path, 'weapon_name': weapon_name})
+        else:
+            logger.info(f"时间文件 {txt_path} (武器: {weapon_name}) 不存在或为空.")
+    return weapon_time_sources
+
+
+def clip_weapon_times(video_id, video_path, video_output_dir, selected_weapon_names, clip_mode,
+                      clip_duration=1.0, merge_threshold_factor=3.0):
+    """单个视频的 Part 3 剪辑，clip_mode: individual / merged / concatenated。"""
+    weapon_time_sources = collect_weapon_time_sources(video_output_dir, selected_weapon_names)
+    if not weapon_time_sources:
+        logger.info(f"没有找到有效的武器时间文件为视频 ID '{video_id}' 进行剪辑 (模式: {clip_mode}).")
+        return
+    if clip_mode in ("individual", "merged"):
+        final_clips_output_path = os.path.join(video_output_dir, f"clips_{clip_mode}")
+        os.makedirs(final_clips_output_path, exist_ok=True)
+    if clip_mode == "individual":
+        generate_clips_from_multiple_weapon_times(
+            input_video_path=video_path, weapon_time_sources=weapon_time_sources,
+            output_folder=final_clips_output_path, clip_duration=clip_duration)
+    elif clip_mode == "merged":
+        generate_clips_from_multiple_weapon_times_merge(
+            input_video_path=video_path, weapon_time_sources=weapon_time_sources,
+            output_folder=final_clips_output_path, clip_duration=clip_duration,
+            merge_threshold_factor=merge_threshold_factor)
+    elif clip_mode == "concatenated":
+        generate_concatenated_video_from_timestamps(
+            input_video_path=video_path, weapon_time_sources=weapon_time_sources,
+            output_folder=video_output_dir, clip_duration=clip_duration,
+            merge_threshold_factor=merge_threshold_factor)
+    else:
+        logger.error(f"未知的剪辑模式: {clip_mode}")
+
+
+def _format_pipeline_status(stats, analysis_queue, clip_queue, start_time):
+    elapsed = max(time.time() - start_time, 1e-6)
+    parts = []
+    for stage in PIPELINE_STAGES:
+        s = stats[stage]
+        text = f"{stage}: 完成 {s['done']} 失败 {s['failed']}"
+        if stage == 'download':
+            text += f" 已存在 {s['skipped']}" # 已存在的文件不计入下载速度
+        text += f" ({s['done'] / elapsed * 3600:.1f} 个/小时"
+        if stage != 'download' and s['workers']:
+            # 分析/剪辑线程的忙碌时间占比，长期偏低说明在等待下载
+            text += f", 利用率 {s['busy_seconds'] / elapsed / s['workers']:.0%}"
+        parts.append(text + ")")
+    download_mb = stats['download']['bytes'] / (1024 * 1024)
+    return (f"[流水线 {elapsed:.0f}s] " + " | ".join(parts) +
+            f" | 队列: 待分析 {analysis_queue.qsize()} (最大 {stats['analysis']['max_queue']})"
+            f", 待剪辑 {clip_queue.qsize()} (最大 {stats['clip']['max_queue']})"
+            f" | 下载 {download_mb:.1f} MB ({download_mb / elapsed:.2f} MB/s)")
+
+
+def run_pipeline(jobs, video_download_base_dir, analyze_fn, clip_fn=None,
+                 download_workers=3, analysis_workers=1, clip_workers=1,
+                 downloader_cmd=None, report_interval_seconds=30.0):
+    """
+    生产者/消费者流水线。jobs 来自 read_download_jobs。
+    analyze_fn(info) / clip_fn(info): info 为 {'parsed_id', 'filename', 'path'}，
+    分析成功的视频才进入剪辑队列；clip_fn 为 None 时只下载和分析。
+    每 report_interval_seconds 秒输出一次各阶段的吞吐量和队列深度，结束时输出汇总。
+    返回各阶段的统计 dict。
+    """
+    analysis_queue = queue.Queue()
+    clip_queue = queue.Queue()
+    stats_lock = threading.Lock()
+    stats = {stage: {'done': 0, 'failed': 0, 'skipped': 0, 'busy_seconds': 0.0, 'max_queue': 0, 'bytes': 0, 'workers': 0}
+             for stage in PIPELINE_STAGES}
+    stats['download']['workers'] = download_workers
+    stats['analysis']['workers'] = analysis_workers
+    stats['clip']['workers'] = clip_workers if clip_fn else 0
+    start_time = time.time()
+
+    def _enqueue(stage, target_queue, info):
+        target_queue.put(info)
+        with stats_lock:
+            stats[stage]['max_queue'] = max(stats[stage]['max_queue'], target_queue.qsize())
+
+    def on_downloaded(info):
+        # 只统计本次运行实际下载的视频和字节数，已存在的文件单独计数
+        with stats_lock:
+            if info.get('skipped'):
+                stats['download']['skipped'] += 1
+            else:
+                stats['download']['done'] += 1
+                if os.path.exists(info['path']):
+                    stats['download']['bytes'] += max(0, os.path.getsize(info['path']) - info.get('resumed_bytes', 0))
+        logger.info(f"[流水线] {info['parsed_id']} {'已存在' if info.get('skipped') else '下载完成'}，加入分析队列。")
+        _enqueue('analysis', analysis_queue, info)
+
+    def stage_worker(stage, in_queue, fn, next_stage, out_queue):
+        while True:
+            info = in_queue.get()
+            if info is None:
+                break
+            t0 = time.time()
+            try:
+                fn(info)
+                ok = True
+            except Exception as e:
+                logger.error(f"[流水线] {stage} 阶段处理 {info['parsed_id']} 时出错: {e}", exc_info=True)
+                ok = False
+            with stats_lock:
+                stats[stage]['busy_seconds'] += time.time() - t0
+                stats[stage]['done' if ok else 'failed'] += 1
+            logger.info(f"[流水线] {info['parsed_id']} {stage} 阶段{'完成' if ok else '失败'} ({time.time() - t0:.1f}s)")
+            if ok and out_queue is not None:
+                _enqueue(next_stage, out_queue, info)
+
+    analysis_threads = [threading.Thread(target=stage_worker, args=('analysis', analysis_queue, analyze_fn, 'clip', clip_queue if clip_fn else None), daemon=True)
+                        for _ in range(max(1, analysis_workers))]
+    clip_threads = [threading.Thread(target=stage_worker, args=('clip', clip_queue, clip_fn, None, None), daemon=True)
+                    for _ in range(max(1, clip_workers))] if clip_fn else []
+    for t in analysis_threads + clip_threads:
+        t.start()
+
+    stop_reporting = threading.Event()
+
+    def reporter():
+        while not stop_reporting.wait(report_interval_seconds):
+            with stats_lock:
+                logger.info(_format_pipeline_status(stats, analysis_queue, clip_queue, start_time))
+
+    reporter_thread = threading.Thread(target=reporter, daemon=True)
+    reporter_thread.start()
+
+    logger.info(f"[流水线] 开始: {len(jobs)} 个视频, 下载并发 {download_workers}, 分析线程 {len(analysis_threads)}, 剪辑线程 {len(clip_threads)}")
+    done_infos = run_download_queue(jobs, video_download_base_dir, max_workers=download_workers,
+                                    downloader_cmd=downloader_cmd, on_done=on_downloaded)
+    with stats_lock:
+        stats['download']['failed'] = len(jobs) - len(done_infos)
+
+    # 下载全部结束后依次关闭分析和剪辑阶段
+    for _ in analysis_threads:
+        analysis_queue.put(None)
+    for t in analysis_threads:
+        t.join()
+    for _ in clip_threads:
+        clip_queue.put(None)
+    for t in clip_threads:
+        t.join()
+    stop_reporting.set()
+    reporter_thread.join()
+
+    logger.info("[流水线] 完成. " + _format_pipeline_status(stats, analysis_queue, clip_queue, start_time))
+    return stats
+
+
+def run_two_tier_ingest(video_url, video_id, work_dir, analyze_fn, low_res_stream='360p/480p/worst[height>=160]',
+                        high_res_stream='bestvideo+bestaudio/best', before_seconds=2.0, after_seconds=2.0,
+                        merge_gap_seconds=3.0, section_workers=3, sections_per_call=20, downloader_cmd=None,
+                        start_time=None, end_time=None):
+    """
+    两级下载:
+    1. 下载低分辨率版本 (work_dir/{video_id}_lowres.mp4)，start_time/end_time (video_urls.txt 的时间范围) 给出时只下载该范围；
+    2. analyze_fn(lowres_path, video_output_dir) 在低分辨率视频上找射击时刻，写入 video_output_dir/all_weapons.txt
+       (ROI 和模板会按低分辨率视频的宽高自动缩放)；
+    3. 射击时刻前后扩展并合并，只下载这些时间段的高分辨率片段 (work_dir/{video_id}/sections/，
+       射击时刻是低分辨率视频的时间，加上 start_time 换算为原视频时间)。
+    返回 download_sections_batched 的结果 (片段列表)。
+    """
+    video_output_dir = os.path.join(work_dir, video_id)
+    os.makedirs(video_output_dir, exist_ok=True)
+    lowres_path = os.path.join(work_dir, f"{video_id}_lowres.mp4")
+    if os.path.exists(lowres_path):
+        logger.info(f"[两级下载] {lowres_path} 已存在，跳过低分辨率下载。")
+    else:
+        command = build_download_command(video_url, lowres_path, start_time, end_time, stream=low_res_stream,
+                                         downloader_cmd=downloader_cmd) + ['-c']
+        logger.info(f"[两级下载] 下载低分辨率版本: {' '.join(command)}")
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                           creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            logger.error(f"[两级下载] 低分辨率版本下载失败: {e}")
+            return []
+
+    analyze_fn(lowres_path, video_output_dir)
+
+    all_weapons_txt_path = os.path.join(video_output_dir, "all_weapons.txt")
+    shot_times = []
+    if os.path.exists(all_weapons_txt_path):
+        with open(all_weapons_txt_path, 'r', encoding='utf-8') as f:
+            shot_times = [hms_to_seconds(line.strip()) for line in f if line.strip()]
+    if not shot_times:
+        logger.info(f"[两级下载] {video_id}: 低分辨率分析没有找到射击时刻，不下载高分辨率片段。")
+        return []
+
+    offset_seconds = hms_to_seconds(start_time) if start_time and end_time else 0.0
+    sections = [(start + offset_seconds, end + offset_seconds)
+                for start, end in merge_shot_windows(shot_times, before_seconds, after_seconds, merge_gap_seconds)]
+    covered_seconds = sum(end - start for start, end in sections)
+    logger.info(f"[两级下载] {video_id}: {len(shot_times)} 个射击时刻 -> {len(sections)} 个片段, "
+                f"共 {covered_seconds:.1f} 秒 (到最后一个片段为止的 {covered_seconds / max(sections[-1][1] - offset_seconds, 1e-6):.1%})")
+    manifest = download_sections_batched(video_url, video_id, sections, os.path.join(video_output_dir, "sections"),
+                                         max_workers=section_workers, sections_per_call=sections_per_call,
+                                         stream=high_res_stream, downloader_cmd=downloader_cmd)
+    lowres_mb = os.path.getsize(lowres_path) / (1024 * 1024) if os.path.exists(lowres_path) else 0.0
+    sections_mb = sum(os.path.getsize(entry['path']) for entry in manifest) / (1024 * 1024)
+    logger.info(f"[两级下载] {video_id}: 低分辨率 {lowres_mb:.1f} MB + 高分辨率片段 {sections_mb:.1f} MB")
+    return manifest
@@ -0,0 +1,109 @@
+import os
+import json
+import subprocess
+import logging
+import cv2
+
+from analysis_functions import roi_to_pixels
+
+logger = logging.getLogger(__name__)
+
+# HUD 代理视频: 用 ffmpeg 把原视频只保留右下角 HUD 区域 (所有 ROI 的外接矩形)，
+# 转为灰度、降到精扫描帧率，用帧内编码 (ffv1, -g 1) 或无压缩 (rawvideo) 保存。
+# 原视频只需完整解码一次，之后的分析 / 调阈值都在这个很小的视频上进行。
+# 代理视频旁边的 .json 记录裁剪位置和原视频分辨率，find_shooting_moments(proxy_info=...) 用它换算 ROI。
+
+PROXY_CODECS = {
+    "ffv1": ("mkv", ['-c:v', 'ffv1', '-level', '3', '-g', '1', '-slices', '4']),
+    "raw": ("nut", ['-c:v', 'rawvideo']),
+}
+
+
+def _probe_frame_size(video_path):
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height',
+               '-of', 'csv=p=0:s=x', video_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True,
+                                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        width, height = result.stdout.strip().splitlines()[0].split('x')[:2]
+        return int(width), int(height)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError, IndexError):
+        cap = cv2.VideoCapture(video_path)
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))) if cap.isOpened() else (0, 0)
+        cap.release()
+        return size
+
+
+def hud_crop_box(rois, frame_width, frame_height, margin=8, roi_normalized=False):
+    """所有 ROI (参考分辨率像素坐标，roi_normalized 时为归一化坐标) 换算到原视频后的外接矩形，四周留 margin 像素，宽高取偶数。"""
+    pixel_rois = [roi_to_pixels(roi, frame_width, frame_height, roi_normalized) for roi in rois]
+    x1 = max(0, min(r[0] for r in pixel_rois) - margin)
+    y1 = max(0, min(r[1] for r in pixel_rois) - margin)
+    x2 = min(frame_width, max(r[2] for r in pixel_rois) + margin)
+    y2 = min(frame_height, max(r[3] for r in pixel_rois) + margin)
+    x1, y1 = x1 - x1 % 2, y1 - y1 % 2
+    width, height = (x2 - x1) - (x2 - x1) % 2, (y2 - y1) - (y2 - y1) % 2
+    return x1, y1, width, height
+
+
+def load_proxy_info(proxy_path):
+    info_path = proxy_path + ".json"
+    if not (os.path.exists(proxy_path) and os.path.exists(info_path)):
+        return None
+    try:
+        with open(info_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def build_hud_proxy(video_path, proxy_dir, rois, fps=10.0, codec="ffv1", margin=8, roi_normalized=False):
+    """
+    生成 (或复用已有的) HUD 代理视频。rois: [(x1, y1, x2, y2), ...]，通常为数字、武器、无限符号 ROI。
+    fps 一般取 1 / 精扫描间隔。代理视频的第 n 帧对应原视频 n / fps 秒，时间戳不需要换算。
+    返回 (代理视频路径, proxy_info)；失败时返回 (video_path, None)，调用方直接分析原视频。
+    """
+    if codec not in PROXY_CODECS:
+        logger.error(f"[HUD代理] 未知的编码: {codec}，可选: {list(PROXY_CODECS)}")
+        return video_path, None
+    extension, codec_args = PROXY_CODECS[codec]
+    source_width, source_height = _probe_frame_size(video_path)
+    if not source_width or not source_height:
+        logger.error(f"[HUD代理] 无法读取视频分辨率: {video_path}，使用原视频分析。")
+        return video_path, None
+    crop_x, crop_y, crop_w, crop_h = hud_crop_box(rois, source_width, source_height, margin, roi_normalized)
+
+    os.makedirs(proxy_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    proxy_path = os.path.join(proxy_dir, f"{base_name}_hud_{fps:g}fps.{extension}")
+    proxy_info = {
+        "source_path": os.path.abspath(video_path),
+        "source_size": os.path.getsize(video_path),
+        "source_mtime": os.path.getmtime(video_path),
+        "source_width": source_width, "source_height": source_height,
+        "crop_x": crop_x, "crop_y": crop_y, "crop_w": crop_w, "crop_h": crop_h,
+        "fps": fps, "codec": codec,
+    }
+    existing_info = load_proxy_info(proxy_path)
+    if existing_info == proxy_info:
+        logger.info(f"[HUD代理] 复用已有代理视频: {proxy_path}")
+        return proxy_path, proxy_info
+
+    # 先裁剪再降帧率和转灰度，滤镜处理的像素最少；音频/字幕不需要
+    command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-i', video_path, '-an', '-sn', '-dn',
+               '-vf', f"crop={crop_w}:{crop_h}:{crop_x}:{crop_y},fps={fps:g},format=gray"] + codec_args + [proxy_path]
+    logger.info(f"[HUD代理] 生成代理视频 ({crop_w}x{crop_h}@{fps:g}fps, {codec}): {' '.join(command)}")
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                       creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        logger.error(f"[HUD代理] 生成失败: {e}，使用原视频分析。")
+        if os.path.exists(proxy_path):
+            os.remove(proxy_path)
+        return video_path, None
+
+    with open(proxy_path + ".json", 'w', encoding='utf-8') as f:
+        json.dump(proxy_info, f, ensure_ascii=False, indent=2)
+    logger.info(f"[HUD代理] 完成: {proxy_path} ({os.path.getsize(proxy_path) / (1024 * 1024):.1f} MB, "
+                f"原视频 {proxy_info['source_size'] / (1024 * 1024):.1f} MB)")
+    return proxy_path, proxy_info
@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import logging
+
+try:
+    import av # 可选依赖 (pip install av)，没有安装时只能使用 ffmpeg 子进程
+except ImportError:
+    av = None
+
+from general_function import seconds_to_hms
+
+logger = logging.getLogger(__name__)
+
+# 进程内剪辑 (PyAV): 源视频只打开一次，用容器的索引 seek 到开始时间之前的关键帧，
+# 直接复制压缩后的数据包写入每个小片段，不解码、不重新编码。
+# 与 ffmpeg -ss START -i SRC -t DUR -codec copy 的结果相同: 从 START 之前最近的关键帧开始复制，
+# 时间戳以 START 为 0，关键帧到 START 之间的数据包时间戳为负 (mp4 写入编辑列表，播放从 START 开始)，
+# 但省去了每个片段启动 ffmpeg 进程和探测容器的时间，0.8 秒的短片段时差别最明显。
+
+CLIP_BACKENDS = ("ffmpeg", "pyav")
+
+
+def pyav_available():
+    return av is not None
+
+
+def _add_output_stream(output_container, input_stream):
+    # PyAV 12 以后为 add_stream_from_template，之前为 add_stream(template=...)
+    if hasattr(output_container, "add_stream_from_template"):
+        return output_container.add_stream_from_template(input_stream)
+    return output_container.add_stream(template=input_stream)
+
+
+class PacketRemuxer:
+    """
+    打开一个源视频，cut() 把 [start, start + duration] 按数据包复制到新文件。
+    同一个源的多个片段按开始时间顺序调用最快。不是线程安全的，每个线程使用自己的 PacketRemuxer。
+    """
+
+    def __init__(self, source_path):
+        if av is None:
+            raise RuntimeError("PyAV 未安装 (pip install av)，无法使用 pyav 剪辑后端。")
+        self.source_path = source_path
+        self.container = av.open(source_path)
+        self.video_stream = self.container.streams.video[0]
+        self.streams = [self.video_stream] + list(self.container.streams.audio[:1])
+
+    def _seconds(self, stream, pts):
+        return float((pts - (stream.start_time or 0)) * stream.time_base)
+
+    def cut(self, start, duration, output_path):
+        """写入一个片段，返回复制的数据包数。"""
+        end = start + duration
+        video = self.video_stream
+        self.container.seek(int(start / video.time_base) + (video.start_time or 0), stream=video, backward=True, any_frame=False)
+
+        output = av.open(output_path, 'w')
+        packets_written = 0
+        try:
+            out_streams = {stream.index: _add_output_stream(output, stream) for stream in self.streams}
+            # 每个流的时间偏移: START 为 0 秒，关键帧之前的部分 (pre-roll) 为负时间戳，只用于解码不显示
+            offset_pts = {s.index: int(round(start / s.time_base)) + (s.start_time or 0) for s in self.streams}
+            base_seconds = None
+            finished = set()
+            for packet in self.container.demux(*self.streams):
+                stream = packet.stream
+                if packet.dts is None or packet.pts is None or stream.index in finished:
+                    continue
+                t = self._seconds(stream, packet.pts)
+                if base_seconds is None:
+                    if stream is not video or not packet.is_keyframe:
+                        continue
+                    base_seconds = t
+                if self._seconds(stream, packet.dts) >= end: # 按解码顺序判断结束，B 帧引用的帧不会被丢掉
+                    finished.add(stream.index)
+                    if len(finished) == len(self.streams) or t >= end + 1.0:
+                        break
+                    continue
+                if t < base_seconds:
+                    continue # 关键帧之前的音频
+                packet.pts -= offset_pts[stream.index]
+                packet.dts -= offset_pts[stream.index]
+                packet.stream = out_streams[stream.index]
+                output.mux(packet)
+                packets_written += 1
+        finally:
+            output.close()
+        return packets_written
+
+    def close(self):
+        self.container.close()
+
+
+def _clip_with_ffmpeg(source_path, start, duration, output_path):
+    command = ['ffmpeg', '-ss', seconds_to_hms(start), '-i', source_path, '-t', str(duration), '-codec', 'copy',
+               '-loglevel', 'error', '-y', output_path]
+    subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8', errors='replace',
+                   creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+
+
+def _probe_duration(source_path):
+    if av is not None:
+        with av.open(source_path) as container:
+            if container.duration:
+                return container.duration / av.time_base
+    command = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', source_path]
+    result = subprocess.run(command, capture_output=True, text=True, check=True, creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    return float(result.stdout.strip())
+
+
+def benchmark_clip_backends(source_path, work_dir, n_clips=30, clip_duration=0.8, backends=CLIP_BACKENDS,
+                            duration_tolerance=0.1):
+    """
+    用两个后端各剪辑 n_clips 个均匀分布的 clip_duration 秒片段 (stream copy)，返回 {后端: 每秒片段数}。
+    先检查各后端同一片段的时长相差不超过 duration_tolerance 秒，不一致时抛出 RuntimeError (速度没有可比性)。
+    结果同时写入 work_dir/clip_backend_benchmark.json，测试用的片段会被删除。
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    source_duration = _probe_duration(source_path)
+    step = max(clip_duration, (source_duration - clip_duration) / max(1, n_clips))
+    starts = [i * step for i in range(n_clips) if i * step + clip_duration <= source_duration]
+    extension = os.path.splitext(source_path)[1] or ".mp4"
+    results = {}
+    durations = {}
+    for backend in backends:
+        if backend == "pyav" and av is None:
+            logger.warning("[剪辑后端测试] PyAV 未安装，跳过 pyav。")
+            continue
+        outputs = [os.path.join(work_dir, f"_bench_{backend}_{i:04d}{extension}") for i in range(len(starts))]
+        started = time.perf_counter()
+        if backend == "pyav":
+            remuxer = PacketRemuxer(source_path)
+            try:
+                for start, output_path in zip(starts, outputs):
+                    remuxer.cut(start, clip_duration, output_path)
+            finally:
+                remuxer.close()
+        else:
+            for start, output_path in zip(starts, outputs):
+                _clip_with_ffmpeg(source_path, start, clip_duration, output_path)
+        elapsed = time.perf_counter() - started
+        results[backend] = round(len(starts) / elapsed, 2) if elapsed > 0 else 0.0
+        durations[backend] = [round(_probe_duration(output_path), 3) for output_path in outputs]
+        for output_path in outputs:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    # 片段时长不同 (例如一个后端包含了关键帧之前的部分) 时速度比较没有意义
+    mismatches = []
+    reference_backend = next(iter(durations), None)
+    for backend, backend_durations in durations.items():
+        if backend == reference_backend:
+            continue
+        for i, (start, d, ref) in enumerate(zip(starts, backend_durations, durations[reference_backend])):
+            if abs(d - ref) > duration_tolerance:
+                mismatches.append(f"#{i} @ {seconds_to_hms(start)}: {reference_backend} {ref}s, {backend} {d}s")
+    with open(os.path.join(work_dir, "clip_backend_benchmark.json"), 'w', encoding='utf-8') as f:
+        json.dump({"source": os.path.abspath(source_path), "clips": len(starts), "clip_duration": clip_duration,
+                   "clip_durations": durations, "durations_match": not mismatches,
+                   "clips_per_second": {} if mismatches else results, "created": time.time()}, f, ensure_ascii=False, indent=2)
+    if mismatches:
+        raise RuntimeError(f"[剪辑后端测试] {len(mismatches)} 个片段的时长在不同后端之间不一致: {mismatches[:5]}")
+    for backend, clips_per_second in results.items():
+        logger.info(f"[剪辑后端测试] {backend}: {len(starts)} 个片段, 平均时长 {sum(durations[backend]) / max(1, len(starts)):.2f}s, "
+                    f"{clips_per_second} 片段/秒")
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="比较 ffmpeg 子进程和 PyAV 两种剪辑后端的速度")
+    parser.add_argument("source_path")
+    parser.add_argument("--work-dir", default="clip_benchmark")
+    parser.add_argument("--clips", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=0.8)
+    args = parser.parse_args(argv)
+    print(benchmark_clip_backends(args.source_path, args.work_dir, args.clips, args.duration))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(main(sys.argv[1:]))
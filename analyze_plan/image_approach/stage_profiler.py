@@ -0,0 +1,104 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 分析各阶段的耗时和计数 (find_shooting_moments 始终开启，开销只有每次调用两次 perf_counter):
+#   stages: 互不重叠的阶段 (解码、灰度+Otsu、武器IoU、数字识别、∞检查、写事件)，加上 other 等于总耗时；
+#   spans: 包含其他阶段的时间段 (精扫描、二分查找)，只用于看精扫描占了多少；
+#   counters: 解码帧数、seek 次数、模板比较次数、精扫描次数等。
+# 每个视频结束时写入 analysis_profile.json，运行中每隔 log_interval_seconds 在日志中输出一行。
+# cprofile=True 时同时用 cProfile 记录整个分析，保存 .prof 文件并在日志中输出累计耗时最多的函数。
+
+
+class StageProfiler:
+
+    def __init__(self, name, log_interval_seconds=60.0, cprofile=False):
+        self.name = name
+        self.log_interval_seconds = log_interval_seconds
+        self.stage_seconds = {}
+        self.stage_calls = {}
+        self.span_seconds = {}
+        self.span_calls = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+        self._last_log = self.started
+        self._cprofile = None
+        if cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def add(self, stage, t0):
+        """t0 = time.perf_counter() 记录的开始时间。"""
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + (time.perf_counter() - t0)
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+
+    def add_span(self, span, t0):
+        self.span_seconds[span] = self.span_seconds.get(span, 0.0) + (time.perf_counter() - t0)
+        self.span_calls[span] = self.span_calls.get(span, 0) + 1
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def timed(self, stage, fn):
+        """返回记录 fn 每次调用耗时的包装函数。"""
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, t0)
+        return wrapper
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        stages = {}
+        for stage, seconds in sorted(self.stage_seconds.items(), key=lambda item: -item[1]):
+            calls = self.stage_calls[stage]
+            stages[stage] = {"seconds": round(seconds, 4), "calls": calls,
+                             "ms_per_call": round(seconds * 1000 / calls, 4) if calls else 0.0,
+                             "share": round(seconds / wall, 4) if wall > 0 else 0.0}
+        other = max(0.0, wall - sum(self.stage_seconds.values()))
+        stages["other"] = {"seconds": round(other, 4), "calls": 0, "ms_per_call": 0.0,
+                           "share": round(other / wall, 4) if wall > 0 else 0.0}
+        spans = {span: {"seconds": round(seconds, 4), "calls": self.span_calls[span]}
+                 for span, seconds in self.span_seconds.items()}
+        return {"name": self.name, "wall_seconds": round(wall, 3), "stages": stages, "spans": spans,
+                "counters": dict(self.counters)}
+
+    def _format_line(self, summary):
+        stages = ", ".join(f"{stage} {info['share']:.0%}" for stage, info in summary["stages"].items())
+        counters = ", ".join(f"{name}={value}" for name, value in summary["counters"].items())
+        return f"{summary['wall_seconds']:.1f}s | {stages} | {counters}"
+
+    def maybe_log(self, progress=""):
+        now = time.perf_counter()
+        if now - self._last_log >= self.log_interval_seconds:
+            self._last_log = now
+            logger.info(f"[阶段耗时] {progress} {self._format_line(self.summary())}")
+
+    def finish(self, json_path=None, top_functions=15):
+        """结束 cProfile (如果开启)，写入 json_path，返回汇总 dict。"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if json_path:
+                prof_path = json_path.rsplit('.', 1)[0] + ".prof"
+                self._cprofile.dump_stats(prof_path)
+                logger.info(f"[阶段耗时] cProfile 结果已保存: {prof_path} (python -m pstats {prof_path})")
+            stream = io.StringIO()
+            pstats.Stats(self._cprofile, stream=stream).sort_stats("cumulative").print_stats(top_functions)
+            logger.info(f"[阶段耗时] cProfile 累计耗时前 {top_functions} 的函数:\n{stream.getvalue()}")
+            self._cprofile = None
+        summary = self.summary()
+        logger.info(f"[阶段耗时] {self.name} 完成: {self._format_line(summary)}")
+        if json_path:
+            try:
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(dict(summary, created=time.time()), f, ensure_ascii=False, indent=2)
+            except OSError as e:
+                logger.error(f"[阶段耗时] 无法写入 {json_path}: {e}")
+        return summary